@@ -1,40 +1,76 @@
+import asyncio
+import json
+import numpy as np
 import typer
 from pathlib import Path
 from typing import Optional, List
-from rag_system.core.vector_store import FaissVectorStore
-from rag_system.ingestion.services import IngestionService
-from rag_system.retrieval.services import SearchService
-from rag_system.core.ollama_provider import OllamaProvider
-from rag_system.agents.retriever import RetrieverAgent
-from rag_system.agents.writer import WriterAgent
+from rag_system.core.registry import get_registry, close_registry
+from rag_system.embeddings.dispatcher import bulk_lane
+from rag_system.ingestion.schemas import IngestionConfig, ChunkingStrategy
+from rag_system.ingestion.bulk import process_directory
+from rag_system.ingestion.parser_pool import ParserPool
+from rag_system.ingestion.services import process_file
+from rag_system.retrieval.schemas import SearchRequest
+from rag_system.vector_store.reduction import recall_report
+from rag_system.agents.retriever import RetrieverRequest
+from rag_system.agents.writer import WriterRequest
 
 app = typer.Typer()
 
-# Initialize shared services
-vector_store = FaissVectorStore()
-ollama_provider = OllamaProvider()
-search_service = SearchService(vector_store, ollama_provider)
-ingestion_service = IngestionService(vector_store)
+# Shared services: each command gets the same registry the API uses. It is not built at import,
+# as the parser processes that multiprocessing spawns re-import this module.
+
+def _echo_progress(update):
+    # Small files finish in one batch; only large ones get running progress lines
+    if update.batches > 1:
+        typer.echo(f"  {update.filename}: {update.chunks_indexed} chunks from {update.sections_parsed} sections "
+                   f"({update.elapsed_seconds:.1f}s)")
+
+def _echo_throughput(update):
+    typer.echo(f"  {update.files_done}/{update.files_total} files, {update.chunks_indexed} chunks "
+               f"({update.files_per_second:.1f} files/s, {update.chunks_per_second:.0f} chunks/s"
+               + (f", {update.files_failed} failed)" if update.files_failed else ")"))
 
 @app.command()
 def ingest(
     file_path: Path = typer.Argument(..., help="Path to file or directory to ingest"),
-    strategy: str = typer.Option("default", help="Ingestion strategy to use")
+    strategy: ChunkingStrategy = typer.Option(ChunkingStrategy.LENGTH, help="Chunking strategy to use"),
+    collection: Optional[str] = typer.Option(None, help="Collection to ingest into (default: DEFAULT_COLLECTION)"),
+    processes: Optional[int] = typer.Option(None, help="Parser processes for a directory (default: INGEST_PARSE_PROCESSES)"),
+    embed_concurrency: Optional[int] = typer.Option(None, help="Batches embedded at once for a directory (default: INGEST_EMBED_CONCURRENCY)")
 ):
     """
     Ingest files into the RAG system.
-    
+
+    A directory is ingested in parallel: files are parsed across a pool of processes,
+    embedded in concurrent batches and written to the store by a single writer.
+
     Args:
         file_path: Path to file or directory to ingest
-        strategy: Ingestion strategy to use
+        strategy: Chunking strategy to use
+        collection: Collection to ingest into
+        processes: Parser processes for a directory
+        embed_concurrency: Batches embedded at once for a directory
     """
     try:
-        if file_path.is_dir():
-            typer.echo(f"Ingesting all files from directory: {file_path}")
-            ingestion_service.process_directory(file_path, strategy)
-        else:
-            typer.echo(f"Ingesting file: {file_path}")
-            ingestion_service.process_file(file_path, strategy)
+        registry = get_registry()
+        config = IngestionConfig(chunking_strategy=strategy, collection=collection)
+        with registry.collections.use(collection) as vector_store:
+            if file_path.is_dir():
+                typer.echo(f"Ingesting all files from directory: {file_path}")
+                parser_pool = ParserPool(processes)
+                try:
+                    result = process_directory(file_path, config, vector_store, registry.embedding_provider,
+                                               parser_pool, embed_concurrency, progress=_echo_throughput)
+                finally:
+                    parser_pool.close()
+                for filename, error in result["failed"].items():
+                    typer.echo(f"Failed to ingest {filename}: {error}", err=True)
+            else:
+                typer.echo(f"Ingesting file: {file_path}")
+                result = process_file(file_path, config, vector_store, registry.embedding_provider,
+                                      progress=_echo_progress)
+            typer.echo(result["message"])
         typer.echo("Ingestion completed successfully!")
     except Exception as e:
         typer.echo(f"Error during ingestion: {str(e)}", err=True)
@@ -43,37 +79,46 @@ def ingest(
 def search(
     query: str = typer.Argument(..., help="Search query"),
     top_k: int = typer.Option(5, help="Number of results to return"),
-    score_threshold: float = typer.Option(0.5, help="Minimum similarity score"),
-    metadata_filters: Optional[List[str]] = typer.Option(None, help="Metadata filters in key=value format")
+    score_threshold: Optional[float] = typer.Option(None, help="Maximum L2 distance, or minimum ip/cosine similarity"),
+    metadata_filters: Optional[List[str]] = typer.Option(None, help="Metadata filters in key=value format"),
+    collection: Optional[str] = typer.Option(None, help="Collection to search (default: DEFAULT_COLLECTION)")
 ):
     """
     Perform a semantic search.
-    
+
     Args:
         query: Search query
         top_k: Number of results to return
-        score_threshold: Minimum similarity score
+        score_threshold: Maximum L2 distance, or minimum ip/cosine similarity
         metadata_filters: Metadata filters in key=value format
+        collection: Collection to search
     """
     try:
+        registry = get_registry()
         # Parse metadata filters
         filters = {}
         if metadata_filters:
             for filter in metadata_filters:
-                key, value = filter.split("=")
+                key, value = filter.split("=", 1)
                 filters[key] = value
-        
+
         # Perform search
-        results = search_service.search(query, top_k, score_threshold, filters)
-        
+        response = registry.search_service.search(SearchRequest(
+            query=query,
+            top_k=top_k,
+            score_threshold=score_threshold,
+            metadata_filters=filters or None,
+            collection=collection
+        ))
+
         # Format and display results
         typer.echo(f"\nSearch results for: {query}")
         typer.echo("=" * 50)
-        for i, result in enumerate(results, 1):
-            typer.echo(f"\nResult {i} - Score: {result['score']:.2f}")
+        for i, result in enumerate(response.results, 1):
+            typer.echo(f"\nResult {i} - Score: {result.score:.2f}")
             typer.echo("-" * 50)
-            typer.echo(f"Text: {result['text']}")
-            typer.echo(f"Metadata: {result['metadata']}")
+            typer.echo(f"Text: {result.text}")
+            typer.echo(f"Metadata: {result.metadata}")
     except Exception as e:
         typer.echo(f"Error during search: {str(e)}", err=True)
 
@@ -81,67 +126,129 @@ def search(
 def ask(
     question: str = typer.Argument(..., help="Question to ask"),
     top_k: int = typer.Option(5, help="Number of context chunks to retrieve"),
-    temperature: float = typer.Option(0.7, help="Generation temperature")
+    temperature: float = typer.Option(0.7, help="Generation temperature"),
+    collection: Optional[str] = typer.Option(None, help="Collection to answer from (default: DEFAULT_COLLECTION)")
 ):
     """
     Ask a question and get an answer using the Q&A agent.
-    
+
     Args:
         question: Question to ask
         top_k: Number of context chunks to retrieve
         temperature: Generation temperature
+        collection: Collection to answer from
     """
     try:
-        # Initialize agents
-        retriever_agent = RetrieverAgent(vector_store, search_service)
-        writer_agent = WriterAgent(ollama_provider)
-        
+        registry = get_registry()
         # Retrieve context
-        retrieval_request = {
-            "query": question,
-            "top_k": top_k,
-            "score_threshold": 0.5
-        }
-        retrieval_response = retriever_agent.execute(retrieval_request)
-        
+        retrieval_request = RetrieverRequest(query=question, top_k=top_k, collection=collection)
+        retrieval_response = asyncio.run(registry.retriever_agent.execute(retrieval_request))
+
         # Generate answer
-        writer_request = {
-            "prompt": f"Answer the following question based on the provided context:\n\nQuestion: {question}\n\nContext: {json.dumps(retrieval_response.result.get('results'), indent=2)}",
-            "parameters": {
+        writer_request = WriterRequest(
+            prompt=f"Answer the following question based on the provided context:\n\nQuestion: {question}\n\nContext: {json.dumps(retrieval_response.result.get('results'), indent=2)}",
+            parameters={
                 "temperature": temperature,
                 "max_tokens": 500
             }
-        }
-        
-        answer = writer_agent.execute(writer_request)
-        
+        )
+
+        answer = asyncio.run(registry.writer_agent.execute(writer_request))
+
         typer.echo(f"\nQuestion: {question}")
         typer.echo("=" * 50)
         typer.echo(f"\nAnswer: {answer.result.get('text')}")
     except Exception as e:
         typer.echo(f"Error during Q&A: {str(e)}", err=True)
 
+@app.command()
+def collections():
+    """
+    List the collections and the memory their loaded indexes take.
+    """
+    registry = get_registry()
+    stats = registry.collections.stats()
+    for name in registry.collections.names():
+        resident = stats["resident"].get(name)
+        typer.echo(f"{name}: " + (f"loaded, {resident} bytes" if resident is not None else "not loaded"))
+
 @app.command()
 def re_index(
-    all: bool = typer.Option(False, help="Re-index all documents")
+    index_type: Optional[str] = typer.Option(None, help="Index type to rebuild into (default: the current one)"),
+    collection: Optional[str] = typer.Option(None, help="Collection to rebuild (default: DEFAULT_COLLECTION)")
 ):
     """
     Re-index documents in the vector store.
-    
+
     Args:
-        all: If true, clear and re-index all documents
+        index_type: Index type to rebuild into
+        collection: Collection to rebuild
     """
     try:
-        if all:
-            typer.echo("Clearing vector store...")
-            vector_store.clear()
-            typer.echo("Vector store cleared!")
-        
+        registry = get_registry()
         typer.echo("Re-indexing documents...")
-        # TODO: Implement re-indexing logic
+        with registry.collections.use(collection) as vector_store:
+            vector_store.rebuild(index_type)
+            vector_store.save()
         typer.echo("Re-indexing completed!")
     except Exception as e:
         typer.echo(f"Error during re-indexing: {str(e)}", err=True)
 
+@app.command()
+def reduction_report(
+    dimensions: List[int] = typer.Option([64, 128, 256, 512], help="Target dimensions to compare"),
+    sample: int = typer.Option(2000, help="Chunks to embed as the corpus sample"),
+    queries: int = typer.Option(200, help="Further chunks to embed as queries"),
+    top_k: int = typer.Option(10, help="Neighbours compared per query"),
+    collection: Optional[str] = typer.Option(None, help="Collection to sample (default: DEFAULT_COLLECTION)")
+):
+    """
+    Compare PCA and truncation to several dimensions on a sample of a collection.
+
+    The sampled chunks are embedded afresh at full dimension, so the report also works for
+    collections that already store reduced vectors. Pick VECTOR_REDUCTION and
+    VECTOR_REDUCED_DIMENSION from it before creating a collection.
+
+    Args:
+        dimensions: Target dimensions to compare
+        sample: Chunks to embed as the corpus sample
+        queries: Further chunks to embed as queries
+        top_k: Neighbours compared per query
+        collection: Collection to sample
+    """
+    try:
+        registry = get_registry()
+        rng = np.random.default_rng(0)
+        texts = []
+        with registry.collections.use(collection) as vector_store:
+            metric = (vector_store.shards[0] if hasattr(vector_store, "shards") else vector_store).index_config["metric"]
+            for store in getattr(vector_store, "shards", [vector_store]):
+                # Deleted chunks, e.g. earlier versions of re-ingested files, are not sampled.
+                ids = store.live_ids()
+                picked = np.sort(rng.choice(ids, min(ids.size, sample + queries), replace=False))
+                texts += [chunk["chunk_text"] for chunk in store.get_chunks(picked)]
+        rng.shuffle(texts)
+        texts = texts[:sample + queries]
+        if len(texts) <= queries:
+            typer.echo("Not enough chunks in the collection for a report.", err=True)
+            return
+
+        typer.echo(f"Embedding {len(texts)} chunks...")
+        with bulk_lane():
+            embeddings = registry.embedding_provider.get_embeddings(texts)
+        report = recall_report(embeddings[queries:], embeddings[:queries], dimensions, k=top_k, metric=metric)
+
+        typer.echo(f"\n{'method':<10}{'dimension':>10}{'recall@' + str(top_k):>12}{'bytes/vec':>12}{'ms/query':>10}{'speedup':>9}")
+        typer.echo("=" * 63)
+        for row in report:
+            typer.echo(f"{row['method']:<10}{row['dimension']:>10}{row['recall_at_k']:>12.3f}"
+                       f"{row['bytes_per_vector']:>12}{row['search_ms']:>10.3f}{row['speedup']:>9.2f}")
+    except Exception as e:
+        typer.echo(f"Error during reduction report: {str(e)}", err=True)
+
 if __name__ == "__main__":
-    app()
+    try:
+        app()
+    finally:
+        # Saves every collection the command loaded
+        close_registry()
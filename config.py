@@ -13,11 +13,85 @@ class Settings(BaseSettings):
     LLM_PROVIDER_TYPE: str = "ollama"
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_MODEL: str = "mistral"
+    OLLAMA_EMBED_BATCH_SIZE: int = 32  # Texts per /api/embed request
+    OLLAMA_EMBED_MAX_BATCH_CHARS: int = 32000  # Characters per /api/embed request
+    OLLAMA_EMBED_CONCURRENCY: int = 4  # Embedding requests in flight at once
     OPENAI_API_KEY: str = ""
     OPENAI_MODEL: str = "text-embedding-ada-002"
+    OPENAI_EMBED_CONCURRENCY: int = 4  # Async embedding requests in flight at once
+    EMBEDDING_PROVIDER_TYPE: str = ""  # ollama, openai or onnx; empty uses LLM_PROVIDER_TYPE
+    ONNX_MODEL_PATH: str = "./models/all-MiniLM-L6-v2"  # Directory with model.onnx and tokenizer.json
+    ONNX_MAX_LENGTH: int = 256  # Tokens per text; longer texts are truncated
+    ONNX_BATCH_SIZE: int = 32
+    ONNX_NUM_THREADS: int = 0  # Intra-op threads per inference; 0 lets ONNX Runtime decide
+    ONNX_MAX_WORKERS: int = 2  # Batches run concurrently
+    EMBEDDING_HTTP_MAX_CONNECTIONS: int = 32  # Per client, Ollama and OpenAI alike
+    EMBEDDING_HTTP_MAX_KEEPALIVE: int = 16  # Idle connections kept open for reuse
+    EMBEDDING_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # Seconds an idle connection is kept
+    EMBEDDING_HTTP_TIMEOUT: float = 120.0  # Seconds
+
+    # Embedding Cache Settings
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./data/embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 1000000  # Least recently used embeddings are evicted beyond this
+
+    # Embedding Dispatcher Settings (interactive and bulk lanes over an adaptive concurrency limit)
+    EMBEDDING_DISPATCHER_ENABLED: bool = True
+    EMBEDDING_INITIAL_CONCURRENCY: int = 4  # Backend calls in flight at once, before any adjustment
+    EMBEDDING_MIN_CONCURRENCY: int = 1
+    EMBEDDING_MAX_CONCURRENCY: int = 16
+    EMBEDDING_LATENCY_TOLERANCE: float = 2.0  # Latency, relative to the best seen, at which the limit is cut
+    EMBEDDING_CONCURRENCY_BACKOFF: float = 0.7  # Factor the limit is cut by
+    EMBEDDING_INTERACTIVE_RESERVE: int = 1  # Slots bulk work leaves free for queries
+    EMBEDDING_BULK_BATCH_SIZE: int = 32  # Texts per bulk backend call
+    EMBEDDING_BULK_QUEUE_SIZE: int = 8  # Bulk batches queued or running before ingestion blocks
+
+    # Embedding Micro-Batching Settings (concurrent single-query embeddings share one request)
+    EMBEDDING_MICROBATCH_ENABLED: bool = True
+    EMBEDDING_MICROBATCH_MAX_SIZE: int = 32
+    EMBEDDING_MICROBATCH_MAX_WAIT_MS: float = 5.0  # Only waited for under concurrent load
+    EMBEDDING_MICROBATCH_WORKERS: int = 2  # Batches in flight at once
+
+    # Query Embedding Cache Settings
+    QUERY_CACHE_ENABLED: bool = True
+    QUERY_CACHE_MAX_ENTRIES: int = 10000
+    QUERY_CACHE_TTL_SECONDS: float = 3600.0
+    QUERY_CACHE_WARM_ON_STARTUP: bool = False  # Log searched queries and pre-embed the most recent ones on startup
+    QUERY_CACHE_WARM_LIMIT: int = 1000
+    QUERY_LOG_PATH: str = "./data/query_log.txt"
+    QUERY_LOG_MAX_ENTRIES: int = 10000  # Distinct queries kept when the log is compacted
 
     # Vector Store Settings
-    VECTOR_STORE_TYPE: str = "faiss"
+    VECTOR_STORE_TYPE: str = "faiss"  # faiss or sharded
+    FAISS_INDEX_TYPE: str = "flat"  # flat, ivf_flat, hnsw, ivf_pq, sq8 or fp16
+    FAISS_NLIST: int = 1024
+    FAISS_NPROBE: int = 16
+    FAISS_HNSW_M: int = 32
+    FAISS_EF_CONSTRUCTION: int = 200
+    FAISS_EF_SEARCH: int = 64
+    FAISS_PQ_M: int = 16
+    FAISS_PQ_NBITS: int = 8
+    FAISS_RESCORE: bool = True  # Exact re-ranking of compressed-index candidates
+    FAISS_RESCORE_FACTOR: int = 4
+    FAISS_METRIC: str = "l2"  # l2, ip or cosine (inner product over normalized vectors)
+    VECTOR_REDUCTION: str = "none"  # none, pca or truncate (Matryoshka-style models); fixed once a store has vectors
+    VECTOR_REDUCED_DIMENSION: int = 256  # Target dimension
+    VECTOR_REDUCTION_TRAINING_SIZE: int = 10000  # Chunks pca is fitted on; until a store holds this many it keeps full vectors
+    VECTOR_STORE_READ_ONLY: bool = False  # Memory-map the index for serving-only workers
+    VECTOR_STORE_PREWARM: bool = False
+    VECTOR_STORE_MAX_SEGMENTS: int = 8  # Delta segments before background compaction starts
+    VECTOR_STORE_COMPACT_RATIO: float = 0.25  # Delta/base size at which deltas are merged into the base
+    VECTOR_STORE_SHARDS: int = 4  # Shard count for new sharded stores
+    DEFAULT_COLLECTION: str = "default"  # Collection used when a request names none
+    VECTOR_STORE_MEMORY_BUDGET_MB: int = 2048  # Index memory above which cold collections are unloaded
+
+    # Ingestion Settings
+    INGEST_BATCH_SIZE: int = 256  # Chunks embedded and added to the store per batch
+    INGEST_PREFETCH_BATCHES: int = 2  # Chunk batches parsed ahead of embedding; parsing pauses beyond this
+    INGEST_READ_BLOCK_BYTES: int = 1048576  # Block size for streaming uploads to disk and reading text files
+    INGEST_WORKERS: int = 2  # Upload jobs ingested concurrently in the background
+    INGEST_PARSE_PROCESSES: int = 2  # Processes that parse and chunk documents, off the API process's CPU
+    INGEST_EMBED_CONCURRENCY: int = 4  # Chunk batches embedded at once by bulk directory ingestion
 
     # API Settings
     API_HOST: str = "localhost"
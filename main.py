@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from rag_system.ingestion.router import router as ingestion_router
@@ -5,9 +6,18 @@ from rag_system.retrieval.router import router as retrieval_router
 from rag_system.agents.router import router as agents_router
 from rag_system.auth.router import router as auth_router
 from rag_system.auth.service import get_current_active_user, decode_token
+from rag_system.core.registry import get_registry, aclose_registry
 from config import settings
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Loads the shared services once at startup, resumes interrupted ingestion jobs, and shuts them down with the app."""
+    get_registry().ingestion_jobs.resume()
+    yield
+    await aclose_registry()
+
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.API_TITLE,
     description="""
     A modular system for ingesting documents, managing AI agents, and generating content.
@@ -1,8 +1,9 @@
+import json
 from typing import Dict, Any, Optional, List
 from pydantic import BaseModel
 from rag_system.agents.base_agent import BaseAgent, AgentRequest, AgentResponse
 from rag_system.core.llm_provider import LLMProvider
-from rag_system.agents.retriever import RetrieverAgent
+from rag_system.agents.retriever import RetrieverAgent, RetrieverRequest
 from rag_system.agents.writer import WriterAgent
 
 class AugmentorRequest(AgentRequest):
@@ -35,12 +36,12 @@ class AugmentorAgent(BaseAgent):
             AgentResponse containing the analysis and suggested updates
         """
         try:
-            # Step 1: Retrieve relevant context
-            retrieval_request = {
-                "query": request.topic,
-                "top_k": 10,
-                "score_threshold": 0.4
-            }
+            # Step 1: Retrieve context for the topic and the existing content in one batch
+            retrieval_request = RetrieverRequest(
+                query=request.topic,
+                queries=[request.existing_content] if request.existing_content else [],
+                top_k=10
+            )
             retrieval_response = await self.retriever_agent.execute(retrieval_request)
             
             # Step 2: Analyze content for gaps
@@ -1,25 +1,32 @@
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from rag_system.agents.base_agent import BaseAgent, AgentRequest, AgentResponse
-from rag_system.vector_store.faiss_store import FaissVectorStore
+from rag_system.retrieval.schemas import SearchRequest
 from rag_system.retrieval.services import SearchService
-from rag_system.embeddings.provider_factory import EmbeddingProviderFactory
 
 class RetrieverRequest(AgentRequest):
     """Request model for Retriever Agent"""
     query: str
     top_k: int = 5
-    score_threshold: float = 0.5
-    metadata_filters: Optional[Dict[str, str]] = None
+    score_threshold: Optional[float] = None
+    metadata_filters: Optional[Dict[str, Any]] = None
+    # Collection to search; None means the default collection
+    collection: Optional[str] = None
+    # Further queries answered in the same batch, e.g. the parts of a multi-part prompt
+    queries: List[str] = []
 
 class RetrieverAgent(BaseAgent):
     """Agent responsible for retrieving relevant context from the vector store"""
     
-    def __init__(self, vector_store: FaissVectorStore, provider_type: str, provider_config: Dict):
+    def __init__(self, search_service: SearchService):
         super().__init__(agent_type="retriever")
-        self.provider = EmbeddingProviderFactory.create_provider(provider_type, provider_config)
-        self.search_service = SearchService(vector_store, provider_type, provider_config)
+        self.search_service = search_service
         
+    @staticmethod
+    def _better(score: float, other: float, higher_is_better: bool) -> bool:
+        """Whether a score beats another under the collection's metric."""
+        return score > other if higher_is_better else score < other
+
     async def execute(self, request: RetrieverRequest) -> AgentResponse:
         """
         Execute the retrieval operation.
@@ -31,18 +38,32 @@ class RetrieverAgent(BaseAgent):
             AgentResponse containing the retrieved results
         """
         try:
-            search_request = {
-                "query": request.query,
-                "top_k": request.top_k,
-                "score_threshold": request.score_threshold,
-                "metadata_filters": request.metadata_filters
-            }
-            
-            results = await self.search_service.search(search_request)
-            
+            search_requests = [
+                SearchRequest(
+                    query=query,
+                    top_k=request.top_k,
+                    score_threshold=request.score_threshold,
+                    metadata_filters=request.metadata_filters,
+                    collection=request.collection
+                )
+                for query in [request.query, *request.queries]
+            ]
+
+            responses = await self.search_service.asearch_many(search_requests)
+            higher_is_better = self.search_service.higher_is_better(request.collection)
+
+            # Merge the hits of every query, keeping each chunk once at its best score
+            results = {}
+            for response in responses:
+                for hit in response.results:
+                    chunk_id = hit.metadata.get("chunk_id")
+                    if chunk_id not in results or self._better(hit.score, results[chunk_id]["score"], higher_is_better):
+                        results[chunk_id] = hit.model_dump()
+
             return AgentResponse(
                 result={
-                    "results": results,
+                    "results": sorted(results.values(), key=lambda hit: hit["score"],
+                                      reverse=higher_is_better),
                     "query": request.query
                 },
                 metadata={
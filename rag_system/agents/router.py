@@ -1,39 +1,22 @@
+import json
 from fastapi import APIRouter, Depends, HTTPException
 from rag_system.agents.base_agent import AgentRequest, AgentResponse
 from rag_system.agents.retriever import RetrieverAgent, RetrieverRequest
 from rag_system.agents.writer import WriterAgent, WriterRequest
 from rag_system.agents.editor import EditorAgent, EditorRequest
 from rag_system.agents.augmentor import AugmentorAgent, AugmentorRequest
-from rag_system.embeddings.provider_factory import EmbeddingProviderFactory
-from rag_system.vector_store.faiss_store import FaissVectorStore
-from rag_system.retrieval.services import SearchService
-from rag_system.core.llm_provider import LLMProvider
+from rag_system.core.registry import (
+    get_retriever_agent, get_writer_agent, get_editor_agent, get_augmentor_agent
+)
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
-# Initialize dependencies
-from config import settings
-
-provider_config = {
-    "provider_type": settings.LLM_PROVIDER_TYPE,
-    "config": {
-        "base_url": settings.OLLAMA_BASE_URL,
-        "model": settings.OLLAMA_MODEL
-    }
-}
-
-llm_provider = LLMProvider()
-vector_store = FaissVectorStore()
-search_service = SearchService(vector_store, "ollama", provider_config)
-
-# Initialize agents
-retriever_agent = RetrieverAgent(vector_store, "ollama", provider_config)
-writer_agent = WriterAgent(llm_provider)
-editor_agent = EditorAgent(llm_provider)
-augmentor_agent = AugmentorAgent(llm_provider, retriever_agent, writer_agent)
-
 @router.post("/qna", response_model=AgentResponse)
-async def qna_endpoint(request: RetrieverRequest) -> AgentResponse:
+async def qna_endpoint(
+    request: RetrieverRequest,
+    retriever_agent: RetrieverAgent = Depends(get_retriever_agent),
+    writer_agent: WriterAgent = Depends(get_writer_agent)
+) -> AgentResponse:
     """
     Answer questions using the retriever and writer agents.
     
@@ -73,7 +56,10 @@ async def qna_endpoint(request: RetrieverRequest) -> AgentResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/co-author", response_model=AgentResponse)
-async def co_author_endpoint(request: WriterRequest) -> AgentResponse:
+async def co_author_endpoint(
+    request: WriterRequest,
+    writer_agent: WriterAgent = Depends(get_writer_agent)
+) -> AgentResponse:
     """
     Co-author new documentation using the writer agent.
     
@@ -89,7 +75,10 @@ async def co_author_endpoint(request: WriterRequest) -> AgentResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/edit", response_model=AgentResponse)
-async def edit_endpoint(request: EditorRequest) -> AgentResponse:
+async def edit_endpoint(
+    request: EditorRequest,
+    editor_agent: EditorAgent = Depends(get_editor_agent)
+) -> AgentResponse:
     """
     Edit existing content using the editor agent.
     
@@ -105,7 +94,10 @@ async def edit_endpoint(request: EditorRequest) -> AgentResponse:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/suggest-updates", response_model=AgentResponse)
-async def suggest_updates_endpoint(request: AugmentorRequest) -> AgentResponse:
+async def suggest_updates_endpoint(
+    request: AugmentorRequest,
+    augmentor_agent: AugmentorAgent = Depends(get_augmentor_agent)
+) -> AgentResponse:
     """
     Suggest updates for existing documentation using the augmentor agent.
     
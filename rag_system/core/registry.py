@@ -0,0 +1,177 @@
+import logging
+import threading
+from typing import Any, Dict, Optional, Union
+
+from config import settings
+from rag_system.core.llm_provider import LLMProvider
+from rag_system.embeddings.base_provider import BaseEmbeddingProvider
+from rag_system.embeddings.provider_factory import EmbeddingProviderFactory
+from rag_system.ingestion.jobs import IngestionJobQueue
+from rag_system.vector_store.collection_manager import CollectionManager
+from rag_system.vector_store.faiss_store import FaissVectorStore
+from rag_system.vector_store.sharded_store import ShardedVectorStore
+from rag_system.retrieval.services import SearchService
+from rag_system.retrieval.query_cache import QueryEmbeddingCache, QueryLog
+from rag_system.agents.retriever import RetrieverAgent
+from rag_system.agents.writer import WriterAgent
+from rag_system.agents.editor import EditorAgent
+from rag_system.agents.augmentor import AugmentorAgent
+
+logger = logging.getLogger(__name__)
+
+class ServiceRegistry:
+    """
+    The process-wide services: one set of collections, one embedding provider and one LLM client.
+
+    Every router reads from and writes to the same store instance per collection, so a document
+    ingested by one request is searchable by the next without reloading anything.
+    """
+
+    def __init__(self, collections: CollectionManager,
+                 embedding_provider: BaseEmbeddingProvider, llm_provider: LLMProvider,
+                 query_cache: Optional[QueryEmbeddingCache] = None, query_log: Optional[QueryLog] = None):
+        self.collections = collections
+        self.embedding_provider = embedding_provider
+        self.llm_provider = llm_provider
+        self.search_service = SearchService(collections, embedding_provider, query_cache, query_log)
+        self.retriever_agent = RetrieverAgent(self.search_service)
+        self.writer_agent = WriterAgent(llm_provider)
+        self.editor_agent = EditorAgent(llm_provider)
+        self.augmentor_agent = AugmentorAgent(llm_provider, self.retriever_agent, self.writer_agent)
+        self._ingestion_jobs: Optional[IngestionJobQueue] = None
+        self._ingestion_jobs_lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ServiceRegistry":
+        """Builds the services described by the application settings."""
+        registry = cls(
+            collections=CollectionManager(),
+            embedding_provider=EmbeddingProviderFactory.create_provider(
+                embedding_provider_type(), embedding_provider_config()
+            ),
+            llm_provider=LLMProvider(),
+            query_cache=QueryEmbeddingCache() if settings.QUERY_CACHE_ENABLED else None,
+            query_log=QueryLog() if settings.QUERY_CACHE_ENABLED and settings.QUERY_CACHE_WARM_ON_STARTUP else None,
+        )
+        if settings.QUERY_CACHE_ENABLED and settings.QUERY_CACHE_WARM_ON_STARTUP:
+            # In the background, so startup does not wait on the database and the embedding model.
+            threading.Thread(target=registry.warm_query_cache, name="query-cache-warmup", daemon=True).start()
+        return registry
+
+    def warm_query_cache(self):
+        """Pre-embeds the most recent distinct queries from the query log."""
+        if self.search_service.query_log is None:
+            return
+        try:
+            count = self.search_service.warm_query_cache(self.search_service.query_log.recent())
+            logger.info("Warmed the query cache with %d queries", count)
+        except Exception as e:
+            logger.warning("Query cache warm-up failed: %s", e)
+
+    @property
+    def vector_store(self) -> Union[FaissVectorStore, ShardedVectorStore]:
+        """The default collection's store."""
+        return self.collections.get()
+
+    @property
+    def ingestion_jobs(self) -> IngestionJobQueue:
+        """The background ingestion queue, started on first use so the CLI never spawns its parser processes."""
+        with self._ingestion_jobs_lock:
+            if self._ingestion_jobs is None:
+                self._ingestion_jobs = IngestionJobQueue(self.collections, self.embedding_provider)
+            return self._ingestion_jobs
+
+    async def aclose(self):
+        """Closes the async connection pools of the running event loop; close() still follows."""
+        await self.embedding_provider.aclose()
+
+    def close(self):
+        """Stops the ingestion workers, saves every loaded collection, waits for background vector store work and closes connection pools and the query log."""
+        if self._ingestion_jobs is not None:
+            self._ingestion_jobs.close()
+        self.collections.close()
+        self.embedding_provider.close()
+        if self.search_service.query_log is not None:
+            self.search_service.query_log.close()
+
+
+def embedding_provider_type() -> str:
+    """The configured embedding provider: EMBEDDING_PROVIDER_TYPE, or LLM_PROVIDER_TYPE if unset."""
+    return (settings.EMBEDDING_PROVIDER_TYPE or settings.LLM_PROVIDER_TYPE).lower()
+
+def embedding_provider_config(provider_type: Optional[str] = None) -> Dict[str, Any]:
+    """The embedding provider settings for a provider type (default: embedding_provider_type())."""
+    provider_type = (provider_type or embedding_provider_type()).lower()
+    if provider_type == 'openai':
+        return {"api_key": settings.OPENAI_API_KEY, "model": settings.OPENAI_MODEL}
+    if provider_type == 'onnx':
+        return {"model_path": settings.ONNX_MODEL_PATH}
+    return {"base_url": settings.OLLAMA_BASE_URL, "model": settings.OLLAMA_MODEL}
+
+
+_registry: Optional[ServiceRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> ServiceRegistry:
+    """Returns the process-wide registry, creating it on first use (e.g. outside the API)."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ServiceRegistry.from_settings()
+            logger.info("Service registry initialized with collections: %s", ", ".join(_registry.collections.names()))
+        return _registry
+
+def set_registry(registry: Optional[ServiceRegistry]):
+    """Replaces the process-wide registry, e.g. with one built around test doubles."""
+    global _registry
+    with _registry_lock:
+        _registry = registry
+
+def close_registry():
+    """Closes and forgets the process-wide registry; called from the API lifespan on shutdown."""
+    global _registry
+    with _registry_lock:
+        registry, _registry = _registry, None
+    if registry is not None:
+        registry.close()
+
+
+async def aclose_registry():
+    """Closes the process-wide registry, its async connection pools first; called from the API lifespan on shutdown."""
+    with _registry_lock:
+        registry = _registry
+    if registry is not None:
+        await registry.aclose()
+    close_registry()
+
+
+# FastAPI dependencies
+def get_collections() -> CollectionManager:
+    return get_registry().collections
+
+def get_vector_store() -> Union[FaissVectorStore, ShardedVectorStore]:
+    return get_registry().vector_store
+
+def get_embedding_provider() -> BaseEmbeddingProvider:
+    return get_registry().embedding_provider
+
+def get_llm_provider() -> LLMProvider:
+    return get_registry().llm_provider
+
+def get_ingestion_jobs() -> IngestionJobQueue:
+    return get_registry().ingestion_jobs
+
+def get_search_service() -> SearchService:
+    return get_registry().search_service
+
+def get_retriever_agent() -> RetrieverAgent:
+    return get_registry().retriever_agent
+
+def get_writer_agent() -> WriterAgent:
+    return get_registry().writer_agent
+
+def get_editor_agent() -> EditorAgent:
+    return get_registry().editor_agent
+
+def get_augmentor_agent() -> AugmentorAgent:
+    return get_registry().augmentor_agent
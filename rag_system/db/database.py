@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from config import settings
@@ -24,6 +24,39 @@ from rag_system.retrieval.models import SearchQuery, SearchResult, Feedback
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+# Tables whose shape changed since they were first created; create_all never alters an existing table.
+CHECKED_TABLES = ("ingestion_jobs",)
+
+def check_tables(bind=engine):
+    """
+    Fails at startup when a table created by an earlier version no longer matches its model.
+
+    Raises:
+        RuntimeError: If a checked table lacks columns, or has NOT NULL columns the model allows to be null
+    """
+    inspector = inspect(bind)
+    for name in CHECKED_TABLES:
+        if not inspector.has_table(name):
+            continue
+        existing = {column["name"]: column for column in inspector.get_columns(name)}
+        columns = Base.metadata.tables[name].columns
+        missing = [column.name for column in columns if column.name not in existing]
+        not_null = [column.name for column in columns
+                    if column.name in existing and column.nullable and not existing[column.name]["nullable"]]
+        problems = []
+        if missing:
+            problems.append(f"missing columns {', '.join(missing)}")
+        if not_null:
+            problems.append(f"NOT NULL columns {', '.join(not_null)} that must be nullable")
+        if problems:
+            raise RuntimeError(
+                f"The {name} table was created by an earlier version and has {' and '.join(problems)}. "
+                f"Drop the table to have it recreated, or migrate it to the current model "
+                f"(python scripts/db.py migrate, then upgrade), and restart."
+            )
+
+check_tables()
+
 # Export the session factory
 def get_db():
     db = SessionLocal()
@@ -1,13 +1,45 @@
+import asyncio
+import numpy as np
 from abc import ABC, abstractmethod
 from typing import List
 
 class BaseEmbeddingProvider(ABC):
+    """
+    The embedding contract: vectors are float32 NumPy arrays, never Python lists.
+
+    get_embedding() returns a (d,) vector and get_embeddings() a C-contiguous (n, d) matrix
+    whose row i belongs to texts[i], so the vector store and the search path can hand them
+    to FAISS without converting or copying them. Providers that receive several batches
+    fill one preallocated matrix in place. Conversion to JSON happens only at the API edge.
+    """
+
     @abstractmethod
-    def get_embedding(self, text: str) -> List[float]:
+    def get_embedding(self, text: str) -> np.ndarray:
         """Get embedding for a given text."""
         pass
 
     @abstractmethod
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
         """Get embeddings for a list of texts."""
         pass
+
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """
+        Get embedding for a given text without blocking the event loop.
+
+        Providers with a native async client override this; the default runs
+        get_embedding on a worker thread.
+        """
+        return await asyncio.to_thread(self.get_embedding, text)
+
+    async def aget_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for a list of texts without blocking the event loop."""
+        return await asyncio.to_thread(self.get_embeddings, texts)
+
+    def close(self):
+        """Releases pooled connections and other resources."""
+        pass
+
+    async def aclose(self):
+        """Closes async connection pools; awaited on the event loop that used them, before close()."""
+        pass
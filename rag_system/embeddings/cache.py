@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional
+from .base_provider import BaseEmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+# SQLite's default limit on host parameters per statement is 999.
+LOOKUP_BATCH = 500
+# Hits whose recency is buffered in memory before it is written, and the longest it is held back
+TOUCH_FLUSH_SIZE = 1000
+TOUCH_FLUSH_SECONDS = 30.0
+
+class EmbeddingCache:
+    """
+    A disk-backed, content-addressed store of embeddings.
+
+    Entries are keyed by (namespace, SHA-256 of the text), where the namespace names the
+    provider and model, so switching models never returns stale vectors. Vectors are stored
+    as raw float32 bytes in SQLite. Once the cache holds more than max_entries, the least
+    recently used entries are evicted. Lookups only read: the recency of hits is buffered
+    and written in one transaction with the next put_many(), or once enough hits or time
+    have accumulated, so a cache hit costs no write on the query path.
+    """
+
+    def __init__(self, path: str = "./data/embedding_cache.sqlite3", max_entries: int = 1_000_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, dimension INTEGER NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._connection.commit()
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        # key -> last use, not yet written
+        self._touched: Dict[str, float] = {}
+        self._touched_since = time.monotonic()
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        return f"{namespace}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def get_many(self, namespace: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Looks up several texts at once.
+
+        Args:
+            namespace: Provider and model the embeddings came from
+            texts: Texts to look up
+
+        Returns:
+            One float32 vector per text, or None where the text is not cached
+        """
+        keys = [self.key(namespace, text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            unique = list(dict.fromkeys(keys))
+            for start in range(0, len(unique), LOOKUP_BATCH):
+                batch = unique[start:start + LOOKUP_BATCH]
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype='float32')) for key, vector in rows)
+            if found:
+                now = time.time()
+                self._touched.update((key, now) for key in found)
+                if (len(self._touched) >= TOUCH_FLUSH_SIZE
+                        or time.monotonic() - self._touched_since >= TOUCH_FLUSH_SECONDS):
+                    self._write_touches()
+                    self._connection.commit()
+            results = [found.get(key) for key in keys]
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return results
+
+    def put_many(self, namespace: str, texts: List[str], embeddings: np.ndarray):
+        """Stores the embeddings of several texts, evicting the least recently used entries if over budget."""
+        embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+        now = time.time()
+        rows = {self.key(namespace, text): (embeddings.shape[1], row.tobytes(), now)
+                for text, row in zip(texts, embeddings)}
+        with self._lock:
+            # Written first, so eviction below sees the recent hits.
+            self._write_touches()
+            keys = list(rows)
+            existing = sum(
+                self._connection.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchone()[0]
+                for batch in (keys[start:start + LOOKUP_BATCH] for start in range(0, len(keys), LOOKUP_BATCH))
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, dimension, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, *row) for key, row in rows.items()]
+            )
+            self._entries += len(keys) - existing
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (excess,)
+                )
+                self._entries -= excess
+                logger.debug("Evicted %d embeddings from %s", excess, self.path)
+            self._connection.commit()
+
+    def _write_touches(self):
+        """Writes the buffered recency of hits; the caller holds the lock and commits."""
+        if self._touched:
+            self._connection.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                         [(used, key) for key, used in self._touched.items()])
+            self._touched = {}
+        self._touched_since = time.monotonic()
+
+    def stats(self) -> Dict[str, float]:
+        """Reports the hit rate since startup and the number of cached embeddings."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        """Removes every cached embedding."""
+        with self._lock:
+            self._connection.execute("DELETE FROM embeddings")
+            self._connection.commit()
+            self._entries = 0
+            self._touched = {}
+
+    def close(self):
+        with self._lock:
+            self._write_touches()
+            self._connection.commit()
+            self._connection.close()
+
+
+class CachedEmbeddingProvider(BaseEmbeddingProvider):
+    """
+    Wraps another provider so texts already embedded with the same provider and model are
+    read from an EmbeddingCache instead of being sent again.
+    """
+
+    def __init__(self, provider: BaseEmbeddingProvider, cache: EmbeddingCache, namespace: str):
+        self.provider = provider
+        self.cache = cache
+        self.namespace = namespace
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text, from the cache if possible."""
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Get embeddings for multiple texts; only the texts missing from the cache reach the provider.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            A (len(texts), d) float32 array; row i is the embedding of texts[i]
+        """
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        cached = self.cache.get_many(self.namespace, texts)
+        missing = self._missing(texts, cached)
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            embedded = self.provider.get_embeddings(missing)
+            self.cache.put_many(self.namespace, missing, embedded)
+            if len(missing) == len(texts):
+                # Nothing cached and no repeats: the provider's matrix is already the answer.
+                return embedded
+            fresh = dict(zip(missing, embedded))
+        return self._assemble(texts, cached, fresh)
+
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text without blocking the event loop."""
+        return (await self.aget_embeddings([text]))[0]
+
+    async def aget_embeddings(self, texts: List[str]) -> np.ndarray:
+        """The async counterpart of get_embeddings(); SQLite work runs on a worker thread."""
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        cached = await asyncio.to_thread(self.cache.get_many, self.namespace, texts)
+        missing = self._missing(texts, cached)
+        fresh: Dict[str, np.ndarray] = {}
+        if missing:
+            embedded = await self.provider.aget_embeddings(missing)
+            await asyncio.to_thread(self.cache.put_many, self.namespace, missing, embedded)
+            if len(missing) == len(texts):
+                return embedded
+            fresh = dict(zip(missing, embedded))
+        return self._assemble(texts, cached, fresh)
+
+    @staticmethod
+    def _missing(texts: List[str], cached: List[Optional[np.ndarray]]) -> List[str]:
+        # Each distinct missing text is embedded once, however often it repeats.
+        return list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+
+    @staticmethod
+    def _assemble(texts: List[str], cached: List[Optional[np.ndarray]], fresh: Dict[str, np.ndarray]) -> np.ndarray:
+        dimension = (cached[0] if cached[0] is not None else fresh[texts[0]]).shape[0]
+        embeddings = np.empty((len(texts), dimension), dtype='float32')
+        for i, (text, vector) in enumerate(zip(texts, cached)):
+            embeddings[i] = vector if vector is not None else fresh[text]
+        return embeddings
+
+    def stats(self) -> Dict[str, float]:
+        return self.cache.stats()
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+    def close(self):
+        self.provider.close()
+        self.cache.close()
@@ -0,0 +1,279 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from config import settings
+from .base_provider import BaseEmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# How quickly a latency baseline follows samples above it, so it adapts to a backend that got slower for good.
+BASELINE_DRIFT = 0.01
+
+_lane: contextvars.ContextVar[str] = contextvars.ContextVar("embedding_lane", default=INTERACTIVE)
+
+@contextmanager
+def bulk_lane() -> Iterator[None]:
+    """Marks the embedding calls made inside the block, e.g. by ingestion, as bulk work."""
+    token = _lane.set(BULK)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimit:
+    """
+    A concurrency limit for the embedding backend, adjusted AIMD-style and shared by two lanes.
+
+    Each call's latency is compared with the lowest latency seen for calls of its lane and
+    size. While calls stay within tolerance times that baseline and the limit is in use, the
+    limit grows by about one per limit's worth of calls; a slower call or a failure means the
+    backend is queueing, and the limit is cut to backoff times itself, at most once per call
+    duration. Interactive calls are admitted first, and bulk calls leave `reserve` slots to them.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, tolerance: float, backoff: float, reserve: int):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.reserve = reserve
+        self.in_flight = {INTERACTIVE: 0, BULK: 0}
+        self.waiting = {INTERACTIVE: 0, BULK: 0}
+        self.increases = 0
+        self.decreases = 0
+        self._baselines: Dict[Tuple[str, int], float] = {}
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        # Futures of async waiters, resolved on the next release
+        self._wakeups: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def _admits(self, lane: str) -> bool:
+        limit = int(self.limit)
+        if self.in_flight[INTERACTIVE] + self.in_flight[BULK] >= limit:
+            return False
+        if lane == INTERACTIVE:
+            return True
+        return not self.waiting[INTERACTIVE] and self.in_flight[BULK] < max(1, limit - self.reserve)
+
+    def acquire(self, lane: str):
+        """Takes a slot, waiting while the lane is not admitted."""
+        with self._condition:
+            self.waiting[lane] += 1
+            try:
+                while not self._admits(lane):
+                    self._condition.wait()
+            finally:
+                self.waiting[lane] -= 1
+            self.in_flight[lane] += 1
+
+    async def aacquire(self, lane: str):
+        """Takes a slot, waiting on the event loop rather than on a thread."""
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self._admits(lane):
+                self.in_flight[lane] += 1
+                return
+            self.waiting[lane] += 1
+        try:
+            while True:
+                wakeup = loop.create_future()
+                with self._condition:
+                    if self._admits(lane):
+                        self.in_flight[lane] += 1
+                        return
+                    self._wakeups.append((loop, wakeup))
+                await wakeup
+        finally:
+            with self._condition:
+                self.waiting[lane] -= 1
+
+    def release(self, lane: str, size: int = 0, seconds: Optional[float] = None, failed: bool = False):
+        """
+        Frees a slot and adjusts the limit.
+
+        Args:
+            lane: Lane the slot was taken for
+            size: Texts in the call
+            seconds: Latency of the call; None records no sample
+            failed: Whether the call raised
+        """
+        with self._condition:
+            limit = int(self.limit)
+            # Admission is the bottleneck when every slot is taken, or every slot bulk work may take.
+            saturated = (self.in_flight[INTERACTIVE] + self.in_flight[BULK] >= limit
+                         or self.in_flight[BULK] >= max(1, limit - self.reserve))
+            self.in_flight[lane] -= 1
+            if failed:
+                self._decrease(time.monotonic(), 0.0)
+            elif seconds is not None:
+                self._observe((lane, size.bit_length()), seconds, saturated)
+            self._condition.notify_all()
+            wakeups, self._wakeups = self._wakeups, []
+        for loop, wakeup in wakeups:
+            try:
+                loop.call_soon_threadsafe(_wake, wakeup)
+            except RuntimeError:
+                # The waiter's event loop is closed.
+                pass
+
+    def _observe(self, key: Tuple[str, int], seconds: float, saturated: bool):
+        baseline = self._baselines.get(key)
+        if baseline is None or seconds < baseline:
+            self._baselines[key] = seconds
+        else:
+            self._baselines[key] = baseline + (seconds - baseline) * BASELINE_DRIFT
+        if baseline is not None and seconds > baseline * self.tolerance:
+            self._decrease(time.monotonic(), seconds)
+        elif saturated and self.limit < self.maximum:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.increases += 1
+
+    def _decrease(self, now: float, seconds: float):
+        # Calls already in flight when the limit was cut report the same congestion; count it once.
+        if now - self._last_decrease < seconds or self.limit <= self.minimum:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        self.decreases += 1
+        logger.debug("Embedding concurrency limit lowered to %.1f", self.limit)
+
+    def stats(self) -> Dict[str, float]:
+        with self._condition:
+            return {
+                "limit": self.limit,
+                "interactive_in_flight": self.in_flight[INTERACTIVE],
+                "bulk_in_flight": self.in_flight[BULK],
+                "interactive_waiting": self.waiting[INTERACTIVE],
+                "bulk_waiting": self.waiting[BULK],
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+
+class EmbeddingDispatcher(BaseEmbeddingProvider):
+    """
+    Schedules the calls to an embedding backend so bulk ingestion never starves search.
+
+    Calls run in the interactive lane unless made inside bulk_lane(). Both lanes share an
+    AdaptiveLimit that tracks the backend's latency; interactive calls go first and bulk
+    calls never take the last `reserve` slots. Bulk get_embeddings() calls are split into
+    batches of bulk_batch_size, so a large document holds the backend only one short batch
+    at a time, and at most bulk_queue_size of those batches are queued or running across all
+    callers; beyond that, bulk callers block until the backend catches up.
+    """
+
+    def __init__(self, provider: BaseEmbeddingProvider, initial_concurrency: Optional[int] = None,
+                 min_concurrency: Optional[int] = None, max_concurrency: Optional[int] = None,
+                 bulk_batch_size: Optional[int] = None, bulk_queue_size: Optional[int] = None):
+        self.provider = provider
+        self.model = getattr(provider, "model", "")
+        self.limiter = AdaptiveLimit(
+            initial=initial_concurrency or settings.EMBEDDING_INITIAL_CONCURRENCY,
+            minimum=min_concurrency or settings.EMBEDDING_MIN_CONCURRENCY,
+            maximum=max_concurrency or settings.EMBEDDING_MAX_CONCURRENCY,
+            tolerance=settings.EMBEDDING_LATENCY_TOLERANCE,
+            backoff=settings.EMBEDDING_CONCURRENCY_BACKOFF,
+            reserve=settings.EMBEDDING_INTERACTIVE_RESERVE,
+        )
+        self.bulk_batch_size = bulk_batch_size or settings.EMBEDDING_BULK_BATCH_SIZE
+        self.bulk_queue_size = bulk_queue_size or settings.EMBEDDING_BULK_QUEUE_SIZE
+        self._bulk_slots = threading.BoundedSemaphore(self.bulk_queue_size)
+        self._bulk_pool = ThreadPoolExecutor(max_workers=self.limiter.maximum, thread_name_prefix="embed-bulk")
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text, in the caller's lane."""
+        return self._call(_lane.get(), self.provider.get_embedding, text, 1)
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Get embeddings for multiple texts, in the caller's lane.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            A (len(texts), d) float32 array; row i is the embedding of texts[i]
+        """
+        lane = _lane.get()
+        if lane == BULK and len(texts) > self.bulk_batch_size:
+            return self._bulk(texts)
+        return self._call(lane, self.provider.get_embeddings, texts, len(texts))
+
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text without blocking the event loop."""
+        return await self._acall(_lane.get(), self.provider.aget_embedding, text, 1)
+
+    async def aget_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for multiple texts without blocking the event loop; see get_embeddings()."""
+        lane = _lane.get()
+        if lane == BULK and len(texts) > self.bulk_batch_size:
+            return await asyncio.to_thread(self._bulk, texts)
+        return await self._acall(lane, self.provider.aget_embeddings, texts, len(texts))
+
+    def _call(self, lane: str, embed: Callable, texts, size: int):
+        self.limiter.acquire(lane)
+        started = time.perf_counter()
+        try:
+            result = embed(texts)
+        except Exception:
+            self.limiter.release(lane, size, failed=True)
+            raise
+        self.limiter.release(lane, size, time.perf_counter() - started)
+        return result
+
+    async def _acall(self, lane: str, embed: Callable, texts, size: int):
+        await self.limiter.aacquire(lane)
+        started = time.perf_counter()
+        try:
+            result = await embed(texts)
+        except asyncio.CancelledError:
+            self.limiter.release(lane)
+            raise
+        except Exception:
+            self.limiter.release(lane, size, failed=True)
+            raise
+        self.limiter.release(lane, size, time.perf_counter() - started)
+        return result
+
+    def _bulk(self, texts: List[str]) -> np.ndarray:
+        """Embeds bulk texts batch by batch, blocking while the bulk queue is full."""
+        futures = []
+        for start in range(0, len(texts), self.bulk_batch_size):
+            batch = texts[start:start + self.bulk_batch_size]
+            self._bulk_slots.acquire()
+            future = self._bulk_pool.submit(self._call, BULK, self.provider.get_embeddings, batch, len(batch))
+            future.add_done_callback(lambda _: self._bulk_slots.release())
+            futures.append(future)
+        # Each batch is copied once, into its rows of the result.
+        results = [future.result() for future in futures]
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype='float32')
+        for start, rows in zip(range(0, len(texts), self.bulk_batch_size), results):
+            embeddings[start:start + rows.shape[0]] = rows
+        return embeddings
+
+    def stats(self) -> Dict[str, float]:
+        """Reports the current concurrency limit and the calls running and waiting in each lane."""
+        return {**self.limiter.stats(), "bulk_queue_size": self.bulk_queue_size}
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+    def close(self):
+        self._bulk_pool.shutdown(wait=False)
+        self.provider.close()
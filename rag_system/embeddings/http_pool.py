@@ -0,0 +1,71 @@
+import asyncio
+import threading
+import httpx
+from typing import Dict, Optional
+from config import settings
+
+def pool_limits() -> httpx.Limits:
+    """Connection pool limits shared by every embedding client."""
+    return httpx.Limits(
+        max_connections=settings.EMBEDDING_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.EMBEDDING_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=settings.EMBEDDING_HTTP_KEEPALIVE_EXPIRY,
+    )
+
+def pool_timeout(timeout: Optional[float] = None) -> httpx.Timeout:
+    """Request timeout; connecting fails fast while slow embedding responses are waited for."""
+    timeout = timeout or settings.EMBEDDING_HTTP_TIMEOUT
+    return httpx.Timeout(timeout, connect=min(timeout, 10.0))
+
+
+class ClientPool:
+    """
+    One keep-alive httpx.Client for the process and one httpx.AsyncClient per event loop.
+
+    An AsyncClient is bound to the loop it was first used on, so a CLI command that runs
+    asyncio.run() twice gets a fresh client the second time instead of a dead one.
+    """
+
+    def __init__(self, base_url: str = "", timeout: Optional[float] = None):
+        self.base_url = base_url
+        self.timeout = pool_timeout(timeout)
+        self._client: Optional[httpx.Client] = None
+        self._async_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self) -> httpx.Client:
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(base_url=self.base_url, limits=pool_limits(), timeout=self.timeout)
+            return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """The AsyncClient of the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                # Loops that have finished can no longer use theirs.
+                self._async_clients = {l: c for l, c in self._async_clients.items() if not l.is_closed()}
+                client = self._async_clients[loop] = httpx.AsyncClient(
+                    base_url=self.base_url, limits=pool_limits(), timeout=self.timeout
+                )
+            return client
+
+    async def aclose(self):
+        """Closes the running event loop's AsyncClient and its pooled connections."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.pop(loop, None)
+        if client is not None:
+            await client.aclose()
+
+    def close(self):
+        """Closes the sync client and forgets the async ones, whose connections close as they are collected."""
+        with self._lock:
+            client, self._client = self._client, None
+            self._async_clients = {}
+        if client is not None:
+            client.close()
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from .base_provider import BaseEmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+class MicroBatchingProvider(BaseEmbeddingProvider):
+    """
+    Coalesces concurrent single-text embedding calls into batched provider calls.
+
+    Each get_embedding()/aget_embedding() call queues its text and waits on a future. Worker
+    threads take the queued texts in batches of up to max_batch_size and fan the rows back
+    out to the callers. A lone request on an idle backend is sent at once; only while the
+    previous batch was shared, i.e. under concurrent load, does a worker wait up to
+    max_wait_ms for more texts to fill the batch. Multi-text calls such as ingestion
+    already batch and go straight to the provider.
+    """
+
+    def __init__(self, provider: BaseEmbeddingProvider, max_batch_size: Optional[int] = None,
+                 max_wait_ms: Optional[float] = None, workers: Optional[int] = None):
+        self.provider = provider
+        self.model = getattr(provider, "model", "")
+        self.namespace = getattr(provider, "namespace", None) or f"{type(provider).__name__}:{self.model}"
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_MICROBATCH_MAX_SIZE
+        self.max_wait = (settings.EMBEDDING_MICROBATCH_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._queue: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._closed = False
+        self.batches = 0
+        self.texts = 0
+        self._stats_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"embed-microbatch-{i}", daemon=True)
+            for i in range(workers or settings.EMBEDDING_MICROBATCH_WORKERS)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text, batched with whatever other texts are waiting."""
+        return self._submit(text).result()
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for multiple texts; these are already a batch and bypass the queue."""
+        return self.provider.get_embeddings(texts)
+
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text without blocking the event loop while the batch runs."""
+        return await asyncio.wrap_future(self._submit(text))
+
+    async def aget_embeddings(self, texts: List[str]) -> np.ndarray:
+        return await self.provider.aget_embeddings(texts)
+
+    def _submit(self, text: str) -> Future:
+        if self._closed:
+            raise RuntimeError("The embedding micro-batcher is closed.")
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _work(self):
+        shared = False
+        while True:
+            item = self._queue.get()
+            if item is None:
+                # Passed on so every worker sees it.
+                self._queue.put(None)
+                return
+            batch = [item]
+            # Under load, give concurrent callers a moment to join; when idle, go right away.
+            deadline = time.monotonic() + (self.max_wait if shared else 0)
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic())) \
+                        if deadline > time.monotonic() else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Hand the stop signal on after this batch.
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            shared = len(batch) > 1
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            rows: Dict[str, np.ndarray] = dict(zip(texts, self.provider.get_embeddings(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        with self._stats_lock:
+            self.batches += 1
+            self.texts += len(batch)
+        for text, future in batch:
+            future.set_result(rows[text])
+
+    def stats(self) -> Dict[str, float]:
+        """Reports how many calls were coalesced into how many provider batches."""
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "avg_batch_size": self.texts / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    async def aclose(self):
+        await self.provider.aclose()
+
+    def close(self):
+        """Finishes the queued texts, stops the workers and closes the wrapped provider."""
+        self._closed = True
+        self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self.provider.close()
@@ -1,38 +1,175 @@
-import ollama
-import requests
+import asyncio
+import logging
+import httpx
 import numpy as np
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
+from config import settings
 from .base_provider import BaseEmbeddingProvider
+from .http_pool import ClientPool
+
+logger = logging.getLogger(__name__)
+
+EMBED_PATH = "/api/embed"
+LEGACY_PATH = "/api/embeddings"
+# Words in a 400 response that mean the batch exceeded the model's context or input limit
+TOO_LARGE_HINTS = ("context", "length", "too long", "too large", "exceeds")
 
 class OllamaProvider(BaseEmbeddingProvider):
-    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral"):
+    """
+    Embeddings from an Ollama server's batch endpoint, /api/embed.
+
+    get_embeddings() packs the texts into batches of at most batch_size texts and
+    max_batch_chars characters, keeps up to max_concurrency of them in flight and
+    halves any batch the server rejects as too large (HTTP 413, or a 400 citing a
+    context or length limit) until it fits; other errors are raised. Servers that
+    predate /api/embed are served one text per request from /api/embeddings instead. Requests reuse
+    pooled keep-alive connections; the a* variants use an async client and never
+    block the event loop.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "mistral",
+                 batch_size: Optional[int] = None, max_batch_chars: Optional[int] = None,
+                 max_concurrency: Optional[int] = None, timeout: Optional[float] = None):
         self.base_url = base_url
         self.model = model
+        self.batch_size = batch_size or settings.OLLAMA_EMBED_BATCH_SIZE
+        self.max_batch_chars = max_batch_chars or settings.OLLAMA_EMBED_MAX_BATCH_CHARS
+        self.max_concurrency = max_concurrency or settings.OLLAMA_EMBED_CONCURRENCY
+        self.clients = ClientPool(base_url, timeout)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="ollama-embed")
+        # Flipped when the server answers 404 on /api/embed.
+        self._legacy = False
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text, as a float32 vector."""
+        return self._embed_batch([text])[0]
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Get embeddings for multiple texts, one per text.
+
+        Args:
+            texts: Texts to embed, e.g. the chunks of a document
+
+        Returns:
+            A (len(texts), d) float32 array; row i is the embedding of texts[i]
+        """
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        batches = self._batches(texts)
+        if len(batches) == 1:
+            results = [self._embed_batch(texts)]
+        else:
+            results = list(self._pool.map(lambda span: self._embed_batch(texts[span[0]:span[1]]), batches))
+        return self._assemble(len(texts), batches, results)
+
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text without blocking the event loop."""
+        return (await self._aembed_batch([text]))[0]
+
+    async def aget_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for multiple texts without blocking the event loop; see get_embeddings()."""
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        batches = self._batches(texts)
+        in_flight = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed(start: int, end: int) -> np.ndarray:
+            async with in_flight:
+                return await self._aembed_batch(texts[start:end])
+
+        results = await asyncio.gather(*(embed(start, end) for start, end in batches))
+        return self._assemble(len(texts), batches, results)
+
+    async def aclose(self):
+        await self.clients.aclose()
+
+    def close(self):
+        self.clients.close()
+        self._pool.shutdown(wait=False)
+
+    def _batches(self, texts: List[str]) -> List[Tuple[int, int]]:
+        """Splits the texts into (start, end) spans within the batch size and character limits."""
+        spans, start, chars = [], 0, 0
+        for i, text in enumerate(texts):
+            if i > start and (i - start >= self.batch_size or chars + len(text) > self.max_batch_chars):
+                spans.append((start, i))
+                start, chars = i, 0
+            chars += len(text)
+        spans.append((start, len(texts)))
+        return spans
+
+    @staticmethod
+    def _assemble(count: int, batches: List[Tuple[int, int]], results: List[np.ndarray]) -> np.ndarray:
+        embeddings = np.empty((count, results[0].shape[1]), dtype='float32')
+        for (start, end), rows in zip(batches, results):
+            embeddings[start:end] = rows
+        return embeddings
+
+    def _request(self, texts: List[str], legacy: bool) -> Tuple[str, Dict]:
+        """The endpoint and JSON body for one batch; the legacy endpoint takes a single text."""
+        if legacy:
+            return LEGACY_PATH, {"model": self.model, "prompt": texts[0]}
+        return EMBED_PATH, {"model": self.model, "input": texts}
+
+    def _outcome(self, response: httpx.Response, texts: List[str], path: str) -> Optional[np.ndarray]:
+        """
+        Interprets the response to a request sent to `path`: the embeddings, or None when
+        the batch must be retried.
+
+        A retry either follows the switch to the legacy endpoint or should split the batch.
+        """
+        if path == LEGACY_PATH:
+            response.raise_for_status()
+            embeddings = np.asarray([response.json()["embedding"]], dtype='float32')
+        else:
+            if response.status_code == 404 and "model" not in response.text.lower():
+                logger.warning("%s has no /api/embed; falling back to one request per text.", self.base_url)
+                self._legacy = True
+                return None
+            if len(texts) > 1 and self._too_large(response):
+                logger.debug("Splitting a rejected batch of %d texts (HTTP %d)", len(texts), response.status_code)
+                return None
+            response.raise_for_status()
+            embeddings = np.asarray(response.json()["embeddings"], dtype='float32')
+        if embeddings.shape[0] != len(texts):
+            raise RuntimeError(f"Ollama returned {embeddings.shape[0]} embeddings for {len(texts)} texts.")
+        return embeddings
+
+    @staticmethod
+    def _too_large(response: httpx.Response) -> bool:
+        """Whether the server rejected a batch as over its request size or context limit."""
+        if response.status_code == 413:
+            return True
+        return response.status_code == 400 and any(hint in response.text.lower() for hint in TOO_LARGE_HINTS)
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embeds one batch, halving it while the server rejects it as too large."""
+        # Read once: another caller may switch to the legacy endpoint meanwhile.
+        legacy = self._legacy
+        if legacy and len(texts) > 1:
+            return np.vstack([self._embed_batch([text]) for text in texts])
+        path, body = self._request(texts, legacy)
+        embeddings = self._outcome(self.clients.client.post(path, json=body), texts, path)
+        if embeddings is not None:
+            return embeddings
+        if self._legacy:
+            return self._embed_batch(texts)
+        middle = len(texts) // 2
+        return np.vstack([self._embed_batch(texts[:middle]), self._embed_batch(texts[middle:])])
 
-    def get_embedding(self, text: str) -> List[float]:
-        """Get embedding for a single text."""
-        url = f"{self.base_url}/api/embeddings"
-        
-        response = requests.post(
-            url,
-            json={
-                "model": self.model,
-                "prompt": text
-            }
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
-
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings for multiple texts."""
-        url = f"{self.base_url}/api/embeddings"
-        
-        response = requests.post(
-            url,
-            json={
-                "model": self.model,
-                "prompt": "\n".join(texts)
-            }
-        )
-        response.raise_for_status()
-        return response.json()["embedding"]
+    async def _aembed_batch(self, texts: List[str]) -> np.ndarray:
+        """The async counterpart of _embed_batch()."""
+        legacy = self._legacy
+        if legacy and len(texts) > 1:
+            return np.vstack([await self._aembed_batch([text]) for text in texts])
+        path, body = self._request(texts, legacy)
+        embeddings = self._outcome(await self.clients.async_client.post(path, json=body), texts, path)
+        if embeddings is not None:
+            return embeddings
+        if self._legacy:
+            return await self._aembed_batch(texts)
+        # One after the other, so a split batch still holds a single request slot.
+        middle = len(texts) // 2
+        return np.vstack([await self._aembed_batch(texts[:middle]), await self._aembed_batch(texts[middle:])])
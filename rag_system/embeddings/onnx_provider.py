@@ -0,0 +1,132 @@
+import logging
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from config import settings
+from .base_provider import BaseEmbeddingProvider
+
+logger = logging.getLogger(__name__)
+
+# Padded sequence lengths; a batch is padded to the smallest bucket that fits its longest text.
+LENGTH_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048)
+
+class OnnxProvider(BaseEmbeddingProvider):
+    """
+    Sentence embeddings computed in-process by a local ONNX model, with no external service.
+
+    model_path is either a directory holding model.onnx and tokenizer.json (the layout of a
+    Hugging Face ONNX export) or the .onnx file itself, with tokenizer.json next to it.
+    Texts are tokenized, sorted into length buckets so each batch is padded only as far as
+    its bucket, and the batches run on a thread pool; ONNX Runtime sessions are thread-safe.
+    Token embeddings are mean-pooled over the attention mask and L2-normalized, unless the
+    model already outputs one vector per text.
+
+    onnxruntime and tokenizers are optional dependencies, imported only when this provider
+    is created.
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: Optional[str] = None,
+                 max_length: Optional[int] = None, batch_size: Optional[int] = None,
+                 num_threads: Optional[int] = None, max_workers: Optional[int] = None,
+                 normalize: bool = True):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError(
+                "The 'onnx' embedding provider needs onnxruntime and tokenizers: pip install onnxruntime tokenizers"
+            ) from e
+
+        path = Path(model_path)
+        model_file = path / "model.onnx" if path.is_dir() else path
+        tokenizer_file = Path(tokenizer_path) if tokenizer_path else model_file.parent / "tokenizer.json"
+        if not model_file.exists():
+            raise ValueError(f"ONNX model not found: {model_file}")
+        if not tokenizer_file.exists():
+            raise ValueError(f"Tokenizer not found: {tokenizer_file}")
+
+        self.model = path.name if path.is_dir() else path.stem
+        self.max_length = max_length or settings.ONNX_MAX_LENGTH
+        self.batch_size = batch_size or settings.ONNX_BATCH_SIZE
+        self.normalize = normalize
+
+        self.tokenizer = Tokenizer.from_file(str(tokenizer_file))
+        # Padding is done per bucket below; truncation keeps texts within the model's limit.
+        self.tokenizer.no_padding()
+        self.tokenizer.enable_truncation(max_length=self.max_length)
+
+        options = onnxruntime.SessionOptions()
+        num_threads = settings.ONNX_NUM_THREADS if num_threads is None else num_threads
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(str(model_file), options, providers=["CPUExecutionProvider"])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or settings.ONNX_MAX_WORKERS,
+                                        thread_name_prefix="onnx-embed")
+        logger.info("Loaded ONNX embedding model %s", model_file)
+
+    def get_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text, as a float32 vector."""
+        return self.get_embeddings([text])[0]
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """
+        Get embeddings for multiple texts, one per text.
+
+        Args:
+            texts: Texts to embed
+
+        Returns:
+            A (len(texts), d) float32 array; row i is the embedding of texts[i]
+        """
+        if not texts:
+            return np.empty((0, 0), dtype='float32')
+        encodings = self.tokenizer.encode_batch(texts)
+        batches = self._batches([len(encoding.ids) for encoding in encodings])
+        results = list(self._pool.map(lambda batch: self._run(encodings, *batch), batches))
+
+        embeddings = np.empty((len(texts), results[0].shape[1]), dtype='float32')
+        for (rows, _), vectors in zip(batches, results):
+            embeddings[rows] = vectors
+        return embeddings
+
+    def _batches(self, lengths: List[int]) -> List[Tuple[np.ndarray, int]]:
+        """Groups text positions into (rows, padded length) batches, shortest texts first."""
+        order = np.argsort(lengths, kind="stable")
+        buckets: Dict[int, List[int]] = {}
+        for row in order:
+            length = max(lengths[row], 1)
+            bucket = next((size for size in LENGTH_BUCKETS if size >= length), length)
+            buckets.setdefault(min(bucket, self.max_length), []).append(int(row))
+        return [
+            (np.asarray(rows[start:start + self.batch_size]), padded)
+            for padded, rows in sorted(buckets.items())
+            for start in range(0, len(rows), self.batch_size)
+        ]
+
+    def _run(self, encodings: List, rows: np.ndarray, padded: int) -> np.ndarray:
+        """Runs one padded batch through the model and pools it into one vector per text."""
+        input_ids = np.zeros((rows.size, padded), dtype=np.int64)
+        attention_mask = np.zeros((rows.size, padded), dtype=np.int64)
+        token_type_ids = np.zeros((rows.size, padded), dtype=np.int64)
+        for i, row in enumerate(rows):
+            encoding = encodings[row]
+            length = len(encoding.ids)
+            input_ids[i, :length] = encoding.ids
+            attention_mask[i, :length] = encoding.attention_mask
+            token_type_ids[i, :length] = encoding.type_ids
+
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask, "token_type_ids": token_type_ids}
+        output = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        if output.ndim == 3:
+            # Token embeddings: average the ones that are not padding.
+            mask = attention_mask[:, :, None].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        output = output.astype(np.float32, copy=False)
+        if self.normalize:
+            output /= np.maximum(np.linalg.norm(output, axis=1, keepdims=True), 1e-12)
+        return output
+
+    def close(self):
+        self._pool.shutdown(wait=False)
@@ -1,25 +1,105 @@
+import asyncio
+import base64
+import httpx
+import numpy as np
 import openai
-from typing import List, Dict, Optional
+from typing import Any, List, Dict, Optional
+
+from config import settings
 from .base_provider import BaseEmbeddingProvider
+from .http_pool import pool_limits, pool_timeout
+
+# The embeddings endpoint accepts at most this many inputs per request.
+MAX_BATCH_SIZE = 2048
 
 class OpenAIProvider(BaseEmbeddingProvider):
-    def __init__(self, api_key: str, model: str = "text-embedding-ada-002"):
+    """
+    Embeddings from the OpenAI API through the v1 client.
+
+    The sync and async clients each keep a pool of keep-alive connections, so requests
+    skip the TCP and TLS handshakes after the first. Embeddings are requested base64-encoded
+    and decoded straight into float32 rows, so they are never boxed as Python floats. The
+    async path sends at most max_concurrency requests at once, as the Ollama provider does.
+    """
+
+    def __init__(self, api_key: str, model: str = "text-embedding-ada-002", timeout: Optional[float] = None,
+                 max_concurrency: Optional[int] = None):
         self.api_key = api_key
         self.model = model
-        openai.api_key = api_key
+        self.max_concurrency = max_concurrency or settings.OPENAI_EMBED_CONCURRENCY
+        self.client = openai.OpenAI(
+            api_key=api_key,
+            http_client=httpx.Client(limits=pool_limits(), timeout=pool_timeout(timeout)),
+        )
+        self.async_client = openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=httpx.AsyncClient(limits=pool_limits(), timeout=pool_timeout(timeout)),
+        )
 
-    def get_embedding(self, text: str) -> List[float]:
+    def get_embedding(self, text: str) -> np.ndarray:
         """Get embedding for a single text."""
-        response = openai.Embedding.create(
+        response = self.client.embeddings.create(
             input=text,
-            model=self.model
+            model=self.model,
+            encoding_format="base64"
         )
-        return response.data[0].embedding
+        return self._decode(response.data[0].embedding)
 
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        """Get embeddings for multiple texts."""
-        response = openai.Embedding.create(
-            input=texts,
-            model=self.model
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for multiple texts, as a (len(texts), d) float32 array."""
+        responses = [
+            self.client.embeddings.create(input=texts[start:start + MAX_BATCH_SIZE], model=self.model,
+                                          encoding_format="base64")
+            for start in range(0, len(texts), MAX_BATCH_SIZE)
+        ]
+        return self._fill(len(texts), responses)
+
+    async def aget_embedding(self, text: str) -> np.ndarray:
+        """Get embedding for a single text without blocking the event loop."""
+        response = await self.async_client.embeddings.create(
+            input=text,
+            model=self.model,
+            encoding_format="base64"
         )
-        return [item.embedding for item in response.data]
+        return self._decode(response.data[0].embedding)
+
+    async def aget_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Get embeddings for multiple texts without blocking the event loop."""
+        in_flight = asyncio.Semaphore(self.max_concurrency)
+
+        async def embed(start: int) -> Any:
+            async with in_flight:
+                return await self.async_client.embeddings.create(input=texts[start:start + MAX_BATCH_SIZE],
+                                                                 model=self.model, encoding_format="base64")
+
+        responses = await asyncio.gather(*(embed(start) for start in range(0, len(texts), MAX_BATCH_SIZE)))
+        return self._fill(len(texts), responses)
+
+    @staticmethod
+    def _decode(embedding: Any) -> np.ndarray:
+        """A float32 vector from a base64 embedding, or from a float list if the server ignored the encoding."""
+        if isinstance(embedding, str):
+            return np.frombuffer(base64.b64decode(embedding), dtype='<f4')
+        return np.asarray(embedding, dtype='float32')
+
+    @classmethod
+    def _fill(cls, count: int, responses: List[Any]) -> np.ndarray:
+        """Decodes the responses' embeddings, in order, into one preallocated (count, d) matrix."""
+        if count == 0:
+            return np.empty((0, 0), dtype='float32')
+        embeddings = None
+        row = 0
+        for response in responses:
+            for item in response.data:
+                vector = cls._decode(item.embedding)
+                if embeddings is None:
+                    embeddings = np.empty((count, vector.size), dtype='float32')
+                embeddings[row] = vector
+                row += 1
+        return embeddings
+
+    async def aclose(self):
+        await self.async_client.close()
+
+    def close(self):
+        self.client.close()
@@ -1,5 +1,9 @@
 from typing import Dict, Any
+from config import settings
 from .base_provider import BaseEmbeddingProvider
+from .cache import EmbeddingCache, CachedEmbeddingProvider
+from .dispatcher import EmbeddingDispatcher
+from .micro_batching import MicroBatchingProvider
 from .ollama_provider import OllamaProvider
 from .openai_provider import OpenAIProvider
 
@@ -10,21 +14,54 @@ class EmbeddingProviderFactory:
         Create an embedding provider based on the provider type.
         
         Args:
-            provider_type: Type of provider ('ollama' or 'openai')
-            config: Configuration dictionary containing provider-specific settings
+            provider_type: Type of provider ('ollama', 'openai' or 'onnx')
+            config: Configuration dictionary containing provider-specific settings; 'dispatch', 'cache'
+                and 'micro_batch' override EMBEDDING_DISPATCHER_ENABLED, EMBEDDING_CACHE_ENABLED and
+                EMBEDDING_MICROBATCH_ENABLED
         
         Returns:
-            BaseEmbeddingProvider instance
+            BaseEmbeddingProvider instance, behind the dispatcher, the embedding cache and the
+            micro-batcher if they are enabled
         """
+        provider = EmbeddingProviderFactory._create_uncached(provider_type, config)
+        if config.get('dispatch', settings.EMBEDDING_DISPATCHER_ENABLED):
+            # Under the cache, so cache hits never wait for a backend slot.
+            provider = EmbeddingDispatcher(provider)
+        if config.get('cache', settings.EMBEDDING_CACHE_ENABLED):
+            cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_CACHE_MAX_ENTRIES)
+            provider = CachedEmbeddingProvider(provider, cache, namespace=f"{provider_type.lower()}:{provider.model}")
+        if config.get('micro_batch', settings.EMBEDDING_MICROBATCH_ENABLED):
+            provider = MicroBatchingProvider(provider)
+        return provider
+
+    @staticmethod
+    def _create_uncached(provider_type: str, config: Dict[str, Any]) -> BaseEmbeddingProvider:
         if provider_type.lower() == 'ollama':
             return OllamaProvider(
                 base_url=config.get('base_url', 'http://localhost:11434'),
-                model=config.get('model', 'mistral')
+                model=config.get('model', 'mistral'),
+                batch_size=config.get('batch_size'),
+                max_batch_chars=config.get('max_batch_chars'),
+                max_concurrency=config.get('max_concurrency'),
+                timeout=config.get('timeout')
             )
         elif provider_type.lower() == 'openai':
             return OpenAIProvider(
                 api_key=config['api_key'],
-                model=config.get('model', 'text-embedding-ada-002')
+                model=config.get('model', 'text-embedding-ada-002'),
+                timeout=config.get('timeout'),
+                max_concurrency=config.get('max_concurrency')
+            )
+        elif provider_type.lower() == 'onnx':
+            # Imported here so onnxruntime and tokenizers stay optional for the other providers.
+            from .onnx_provider import OnnxProvider
+            return OnnxProvider(
+                model_path=config['model_path'],
+                tokenizer_path=config.get('tokenizer_path'),
+                max_length=config.get('max_length'),
+                batch_size=config.get('batch_size'),
+                num_threads=config.get('num_threads'),
+                max_workers=config.get('max_workers')
             )
         else:
             raise ValueError(f"Unsupported provider type: {provider_type}")
@@ -0,0 +1,366 @@
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import settings
+from .parser_pool import ParserPool
+from .schemas import BulkIngestionProgress, IngestionConfig
+from .services import SUPPORTED_EXTENSIONS
+from ..embeddings.base_provider import BaseEmbeddingProvider
+from ..embeddings.dispatcher import bulk_lane
+
+logger = logging.getLogger(__name__)
+
+# Seconds between saves of the store while ingesting, so an interrupted load keeps most of its work
+SAVE_INTERVAL = 60.0
+# Seconds between progress reports
+PROGRESS_INTERVAL = 1.0
+# How long the batcher waits for more chunks before embedding a partial batch
+FLUSH_WAIT = 0.05
+
+
+class _File:
+    """Bookkeeping for one file in flight."""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.metadata: Dict[str, Any] = {}
+        self.previous = np.empty(0, dtype='int64')
+        # Chunks handed to the batcher so far; set by the batcher
+        self.queued = 0
+        # Chunks in the file, known once it is fully parsed; set by the writer
+        self.total: Optional[int] = None
+        self.written = 0
+        self.added: List[np.ndarray] = []
+        self.error: Optional[str] = None
+        self.finished = False
+
+
+class BulkIngestion:
+    """
+    Ingests many files at once through a parse, embed and write pipeline.
+
+    Parser threads, one per ParserPool process, each stream one file at a time out of the
+    pool. The calling thread packs the chunks of all files into batches of batch_size, so
+    a corpus of small documents still embeds and indexes in full batches, and hands them to
+    `embed_concurrency` threads that embed in the bulk lane. A single writer thread adds
+    the embedded batches to the store, so each add is one delta segment of a full batch,
+    and finishes a file once all its chunks are in: its new chunks, added hidden, become
+    searchable in the same step that deletes the earlier version of the file, or, if the
+    file failed to parse or embed, they are deleted instead. Every stage is bounded, so memory stays flat however large the corpus.
+    """
+
+    def __init__(self, vector_store, provider: BaseEmbeddingProvider, parser_pool: ParserPool,
+                 config: IngestionConfig, embed_concurrency: Optional[int] = None,
+                 batch_size: Optional[int] = None,
+                 progress: Optional[Callable[[BulkIngestionProgress], None]] = None):
+        self.vector_store = vector_store
+        self.provider = provider
+        self.parser_pool = parser_pool
+        self.config = config
+        self.embed_concurrency = embed_concurrency or settings.INGEST_EMBED_CONCURRENCY
+        self.batch_size = batch_size or settings.INGEST_BATCH_SIZE
+        self.progress = progress
+        self._parsed: "queue.Queue[Tuple[Optional[_File], Any]]" = queue.Queue(
+            maxsize=parser_pool.processes * max(1, settings.INGEST_PREFETCH_BATCHES))
+        self._writes: "queue.Queue[Optional[Tuple]]" = queue.Queue()
+        # Batches being embedded or waiting for the writer
+        self._slots = threading.Semaphore(self.embed_concurrency * 2)
+        self._stop = threading.Event()
+        self._files: List[_File] = []
+        self._files_lock = threading.Lock()
+        self._fatal: Optional[BaseException] = None
+        self._failed: Dict[str, str] = {}
+        self._files_total = 0
+        self._files_done = 0
+        self._chunks_indexed = 0
+        self._started = 0.0
+        self._last_report = 0.0
+
+    def run(self, files: Sequence[Tuple[Path, str]]) -> Dict[str, Any]:
+        """
+        Ingests the files, replacing any earlier version of each.
+
+        Args:
+            files: (path, name) pairs; the name is recorded as the chunks' file_origin
+
+        Returns:
+            A summary dict: a message, the files ingested, the failed files with their
+            errors, the chunk count, the elapsed time, and files and chunks per second
+        """
+        self._files_total = len(files)
+        self._started = time.perf_counter()
+        pending = iter(files)
+        parsers = [
+            threading.Thread(target=self._parse, args=(pending,), name=f"bulk-parse-{i}", daemon=True)
+            for i in range(min(self.parser_pool.processes, len(files)))
+        ]
+        writer = threading.Thread(target=self._write, name="bulk-write", daemon=True)
+        embedders = ThreadPoolExecutor(max_workers=self.embed_concurrency, thread_name_prefix="bulk-embed")
+        writer.start()
+        for parser in parsers:
+            parser.start()
+        try:
+            self._batch(len(parsers), embedders)
+        finally:
+            self._stop.set()
+            embedders.shutdown(wait=True)
+            self._writes.put(None)
+            writer.join()
+            for parser in parsers:
+                parser.join()
+            # Files cut short, by an error in the store or an interrupt, are taken back out.
+            for file in self._files:
+                if not file.finished and file.error is None and file.added:
+                    self.vector_store.delete(np.concatenate(file.added))
+            self.vector_store.save()
+        if self._fatal is not None:
+            raise self._fatal
+        return self._summary()
+
+    def _put(self, target: queue.Queue, item: Any) -> bool:
+        """Puts into a bounded queue, giving up once the run stops."""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _parse(self, pending: Iterator[Tuple[Path, str]]):
+        """A parser thread: streams files out of the parser pool, one at a time."""
+        try:
+            while not self._stop.is_set():
+                with self._files_lock:
+                    entry = next(pending, None)
+                    if entry is None:
+                        return
+                    file = _File(entry[1])
+                    self._files.append(file)
+                try:
+                    file.previous = self.vector_store.document_ids(file.filename)
+                    stream = self.parser_pool.parse(entry[0], file.filename, self.config, self.batch_size,
+                                                    settings.INGEST_PREFETCH_BATCHES)
+                    try:
+                        file.metadata = next(stream)
+                        for chunks, _ in stream:
+                            if not self._put(self._parsed, (file, chunks)):
+                                return
+                    finally:
+                        stream.close()
+                except Exception as e:
+                    self._put(self._parsed, (file, e))
+                else:
+                    self._put(self._parsed, (file, None))
+        finally:
+            self._put(self._parsed, (None, None))
+
+    def _batch(self, parsers: int, embedders: ThreadPoolExecutor):
+        """Packs the parsed chunks of all files into full batches and submits them for embedding."""
+        texts: List[str] = []
+        rows: List[Tuple[_File, int]] = []
+
+        def flush():
+            nonlocal texts, rows
+            if not texts:
+                return
+            self._slots.acquire()
+            embedders.submit(self._embed, texts, rows)
+            texts, rows = [], []
+
+        while parsers:
+            if self._fatal is not None:
+                return
+            try:
+                file, item = self._parsed.get(timeout=FLUSH_WAIT)
+            except queue.Empty:
+                # The parsers are behind: embed what there is rather than wait.
+                flush()
+                continue
+            if file is None:
+                parsers -= 1
+            elif isinstance(item, list):
+                for chunk in item:
+                    texts.append(chunk)
+                    rows.append((file, file.queued))
+                    file.queued += 1
+                    if len(texts) == self.batch_size:
+                        flush()
+            elif item is None:
+                self._writes.put(("end", file, file.queued))
+            else:
+                self._writes.put(("error", file, item))
+        flush()
+
+    def _embed(self, texts: List[str], rows: List[Tuple[_File, int]]):
+        """An embedding thread: embeds one batch and hands it to the writer."""
+        try:
+            parts = self._embed_parts(texts, rows)
+        except BaseException as e:
+            parts = [(rows, texts, e)]
+        self._writes.put(("embedded", parts))
+
+    def _embed_parts(self, texts: List[str], rows: List[Tuple[_File, int]]) -> List[Tuple[List, List[str], Any]]:
+        """Returns (rows, texts, embeddings or the error) parts covering the batch."""
+        try:
+            with bulk_lane():
+                return [(rows, texts, self.provider.get_embeddings(texts))]
+        except Exception as e:
+            files = list(dict.fromkeys(file for file, _ in rows))
+            if len(files) == 1:
+                return [(rows, texts, e)]
+            # The batch mixes files: retry each file's rows alone, so a bad file fails alone.
+            parts = []
+            for file in files:
+                positions = [i for i, (owner, _) in enumerate(rows) if owner is file]
+                parts += self._embed_parts([texts[i] for i in positions], [rows[i] for i in positions])
+            return parts
+
+    def _write(self):
+        """The single writer: every change to the store during the run is made here."""
+        last_save = time.monotonic()
+        while True:
+            message = self._writes.get()
+            if message is None:
+                break
+            kind = message[0]
+            try:
+                if self._fatal is None:
+                    if kind == "embedded":
+                        for rows, texts, result in message[1]:
+                            if isinstance(result, BaseException):
+                                for file in {file for file, _ in rows}:
+                                    self._fail(file, result)
+                            else:
+                                self._add(rows, texts, result)
+                    elif kind == "end":
+                        message[1].total = message[2]
+                        self._finish(message[1])
+                    else:
+                        self._fail(message[1], message[2])
+                    if time.monotonic() - last_save > SAVE_INTERVAL:
+                        self.vector_store.save()
+                        last_save = time.monotonic()
+                    self._report()
+            except BaseException as e:
+                logger.exception("Bulk ingestion stopped: the vector store could not be written")
+                self._fatal = e
+                self._stop.set()
+            finally:
+                if kind == "embedded":
+                    self._slots.release()
+        self._report(force=True)
+
+    def _add(self, rows: List[Tuple[_File, int]], texts: List[str], embeddings: np.ndarray):
+        # Rows of files that already failed are dropped.
+        keep = [i for i, (file, _) in enumerate(rows) if file.error is None]
+        if not keep:
+            return
+        if len(keep) < len(rows):
+            texts, embeddings = [texts[i] for i in keep], embeddings[keep]
+            rows = [rows[i] for i in keep]
+        metadatas = [
+            {**file.metadata, "file_origin": file.filename, "chunk_index": chunk_index}
+            for file, chunk_index in rows
+        ]
+        ids = self.vector_store.add(texts, embeddings, metadatas, hidden=True)
+        self._chunks_indexed += len(ids)
+
+        positions: Dict[int, List[int]] = {}
+        files: Dict[int, _File] = {}
+        for position, (file, _) in enumerate(rows):
+            positions.setdefault(id(file), []).append(position)
+            files[id(file)] = file
+        for key, file in files.items():
+            file.added.append(ids[positions[key]])
+            file.written += len(positions[key])
+            self._finish(file)
+
+    def _finish(self, file: _File):
+        """Swaps a file's new chunks in for its earlier version once all of them are in."""
+        if file.finished or file.error is not None or file.total is None or file.written < file.total:
+            return
+        if file.total:
+            self.vector_store.reveal(np.concatenate(file.added), file.previous)
+        file.finished = True
+        self._files_done += 1
+
+    def _fail(self, file: _File, error: BaseException):
+        """Takes a failed file's new chunks back out; its earlier version stays in place."""
+        if file.finished or file.error is not None:
+            return
+        file.error = str(error)
+        if file.added:
+            self.vector_store.delete(np.concatenate(file.added))
+            self._chunks_indexed -= sum(ids.size for ids in file.added)
+            file.added = []
+        self._failed[file.filename] = file.error
+        logger.warning("Bulk ingestion of %s failed: %s", file.filename, error)
+
+    def _stats(self) -> BulkIngestionProgress:
+        elapsed = time.perf_counter() - self._started
+        return BulkIngestionProgress(
+            files_total=self._files_total, files_done=self._files_done, files_failed=len(self._failed),
+            chunks_indexed=self._chunks_indexed, elapsed_seconds=elapsed,
+            files_per_second=self._files_done / elapsed if elapsed else 0.0,
+            chunks_per_second=self._chunks_indexed / elapsed if elapsed else 0.0,
+        )
+
+    def _report(self, force: bool = False):
+        now = time.monotonic()
+        if self.progress is None or (not force and now - self._last_report < PROGRESS_INTERVAL):
+            return
+        self._last_report = now
+        self.progress(self._stats())
+
+    def _summary(self) -> Dict[str, Any]:
+        stats = self._stats()
+        return {
+            "message": (f"Ingested {stats.files_done} of {stats.files_total} files ({stats.chunks_indexed} chunks) "
+                        f"in {stats.elapsed_seconds:.1f}s: {stats.files_per_second:.1f} files/s, "
+                        f"{stats.chunks_per_second:.0f} chunks/s."),
+            "files": stats.files_done,
+            "failed": dict(self._failed),
+            "chunk_count": stats.chunks_indexed,
+            "elapsed_seconds": stats.elapsed_seconds,
+            "files_per_second": stats.files_per_second,
+            "chunks_per_second": stats.chunks_per_second,
+        }
+
+
+def process_directory(directory: Path, config: IngestionConfig, vector_store,
+                      provider: BaseEmbeddingProvider, parser_pool: Optional[ParserPool] = None,
+                      embed_concurrency: Optional[int] = None,
+                      progress: Optional[Callable[[BulkIngestionProgress], None]] = None) -> Dict[str, Any]:
+    """
+    Ingests every supported file under a directory with a BulkIngestion.
+
+    Args:
+        directory: Directory to ingest, recursively
+        config: Chunking settings
+        vector_store: Store of the target collection
+        provider: Embedding provider
+        parser_pool: Parser processes to use; by default a pool of INGEST_PARSE_PROCESSES
+            is started for the call
+        embed_concurrency: Batches embedded at once; defaults to INGEST_EMBED_CONCURRENCY
+        progress: Called with a BulkIngestionProgress about once a second
+
+    Returns:
+        The BulkIngestion summary
+    """
+    paths = sorted(path for path in directory.rglob("*") if path.suffix in SUPPORTED_EXTENSIONS)
+    # Paths relative to the directory keep same-named files in different folders apart
+    files = [(path, path.relative_to(directory).as_posix()) for path in paths]
+    pool = parser_pool or ParserPool()
+    try:
+        return BulkIngestion(vector_store, provider, pool, config, embed_concurrency,
+                             progress=progress).run(files)
+    finally:
+        if parser_pool is None:
+            pool.close()
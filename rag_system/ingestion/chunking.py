@@ -1,8 +1,15 @@
 import re
-from typing import List
+from typing import Iterable, Iterator, List
 
 def chunk_by_length(text: str, chunk_size: int, chunk_overlap: int = 0) -> List[str]:
     """Chunks text into segments of a specified size with optional overlap."""
+    return list(iter_chunks_by_length([text], chunk_size, chunk_overlap))
+
+def iter_chunks_by_length(pieces: Iterable[str], chunk_size: int, chunk_overlap: int = 0) -> Iterator[str]:
+    """
+    Chunks a stream of text pieces, e.g. the pages of a PDF, as chunk_by_length would chunk
+    their concatenation, holding only the current piece and one chunk of carry-over in memory.
+    """
     if chunk_size <= 0:
         raise ValueError("Chunk size must be a positive integer.")
     if chunk_overlap < 0:
@@ -10,13 +17,17 @@ def chunk_by_length(text: str, chunk_size: int, chunk_overlap: int = 0) -> List[
     if chunk_overlap >= chunk_size:
         raise ValueError("Chunk overlap must be smaller than chunk size.")
 
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start += chunk_size - chunk_overlap
-    return chunks
+    step = chunk_size - chunk_overlap
+    buffer, start = "", 0
+    for piece in pieces:
+        buffer, start = buffer[start:] + piece, 0
+        # A chunk is final once the text it spans has fully arrived.
+        while len(buffer) - start >= chunk_size:
+            yield buffer[start:start + chunk_size]
+            start += step
+    while start < len(buffer):
+        yield buffer[start:start + chunk_size]
+        start += step
 
 def chunk_by_headings(text: str) -> List[str]:
     """Chunks Markdown text by headings (levels 1-3)."""
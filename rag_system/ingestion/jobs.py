@@ -0,0 +1,284 @@
+import logging
+import queue
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from . import services
+from .parser_pool import ParserPool
+from .schemas import IngestionConfig, IngestionJobStatus, IngestionProgress
+from ..embeddings.base_provider import BaseEmbeddingProvider
+from ..vector_store.collection_manager import CollectionManager
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class JobInterrupted(Exception):
+    """Raised into a running job when the queue shuts down; the job is retried on the next start."""
+
+
+class IngestionJobQueue:
+    """
+    Runs uploaded documents through ingestion in the background, one IngestionJob row per upload.
+
+    submit() records a pending job and returns at once. `workers` threads take jobs in
+    order: each file is parsed and chunked by a ParserPool process, then embedded in the
+    bulk lane and added to the collection's store in this process, which stays the only
+    writer of the index files; search sees the new version once the whole file is in.
+    The job row follows along with the sections parsed and chunks indexed, and ends up
+    completed or failed with its error. Jobs for the same file of a collection run one at
+    a time, in order: one that comes up while another is running is handed to that job's
+    worker instead of holding up a worker of its own. Jobs interrupted by a shutdown are rolled back and set pending
+    again; resume() requeues them on the next start. One API process owns the queue, as
+    it owns the index files.
+    """
+
+    def __init__(self, collections: CollectionManager, provider: BaseEmbeddingProvider,
+                 workers: Optional[int] = None, parse_processes: Optional[int] = None,
+                 session_factory: Optional[Callable[[], Any]] = None):
+        if session_factory is None:
+            from rag_system.db.database import SessionLocal
+            session_factory = SessionLocal
+        self.collections = collections
+        self.provider = provider
+        self.session_factory = session_factory
+        self.parser_pool = ParserPool(parse_processes)
+        self._queue: "queue.Queue[Optional[int]]" = queue.Queue()
+        self._stopping = threading.Event()
+        # (collection, filename) of every running job, with the jobs for the same file waiting on it.
+        self._running: Dict[Tuple[str, str], List[int]] = {}
+        self._running_lock = threading.Lock()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"ingest-job-{i}", daemon=True)
+            for i in range(workers or settings.INGEST_WORKERS)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, file_path: Path, filename: str, collection: str, config: IngestionConfig,
+               sha256: Optional[str] = None, size_bytes: Optional[int] = None) -> IngestionJobStatus:
+        """
+        Records a pending job for a file already on disk and queues it.
+
+        Args:
+            file_path: Path of the stored upload
+            filename: Name recorded as the chunks' file_origin
+            collection: Resolved name of the target collection
+            config: Chunking settings
+            sha256: Hash of the file's contents
+            size_bytes: Size of the file
+
+        Returns:
+            The new job
+        """
+        from .models import IngestionJob
+
+        if self._stopping.is_set():
+            raise RuntimeError("The ingestion job queue is shut down.")
+        db = self.session_factory()
+        try:
+            job = IngestionJob(
+                status=PENDING, filename=filename, collection=collection, file_path=str(file_path),
+                sha256=sha256, size_bytes=size_bytes, config=config.model_dump_json(),
+            )
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            status = IngestionJobStatus.model_validate(job)
+        finally:
+            db.close()
+        self._queue.put(status.id)
+        return status
+
+    def get(self, job_id: int) -> Optional[IngestionJobStatus]:
+        """Returns a job, or None if there is no such job."""
+        from .models import IngestionJob
+
+        db = self.session_factory()
+        try:
+            job = db.get(IngestionJob, job_id)
+            return IngestionJobStatus.model_validate(job) if job is not None else None
+        finally:
+            db.close()
+
+    def list(self, status: Optional[str] = None, collection: Optional[str] = None,
+             limit: int = 50, offset: int = 0) -> List[IngestionJobStatus]:
+        """
+        Lists jobs, newest first.
+
+        Args:
+            status: Only jobs with this status
+            collection: Only jobs for this collection
+            limit: Maximum number of jobs
+            offset: Jobs to skip, for paging
+
+        Returns:
+            The matching jobs
+        """
+        from .models import IngestionJob
+
+        db = self.session_factory()
+        try:
+            query = db.query(IngestionJob)
+            if status:
+                query = query.filter(IngestionJob.status == status)
+            if collection:
+                query = query.filter(IngestionJob.collection == collection)
+            jobs = query.order_by(IngestionJob.id.desc()).offset(offset).limit(limit).all()
+            return [IngestionJobStatus.model_validate(job) for job in jobs]
+        finally:
+            db.close()
+
+    def resume(self) -> int:
+        """
+        Queues the jobs left pending or running by an earlier process, oldest first.
+
+        Best effort: when the database is unavailable this logs a warning and queues nothing.
+
+        Returns:
+            The number of jobs queued
+        """
+        from .models import IngestionJob
+
+        try:
+            db = self.session_factory()
+            try:
+                jobs = (db.query(IngestionJob)
+                        .filter(IngestionJob.status.in_([PENDING, RUNNING]))
+                        .order_by(IngestionJob.id)
+                        .all())
+                job_ids = []
+                for job in jobs:
+                    if Path(job.file_path).exists():
+                        job.status, job.started_at = PENDING, None
+                        job_ids.append(job.id)
+                    else:
+                        job.status, job.completed_at = FAILED, datetime.utcnow()
+                        job.error_message = f"The uploaded file {job.file_path} no longer exists."
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            logger.warning("Could not resume interrupted ingestion jobs: %s", e)
+            return 0
+        for job_id in job_ids:
+            self._queue.put(job_id)
+        if job_ids:
+            logger.info("Resumed %d interrupted ingestion jobs", len(job_ids))
+        return len(job_ids)
+
+    def _update(self, job_id: int, **fields):
+        from .models import IngestionJob
+
+        db = self.session_factory()
+        try:
+            db.query(IngestionJob).filter(IngestionJob.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None or self._stopping.is_set():
+                # Passed on so every worker sees it; queued jobs stay pending for resume().
+                self._queue.put(None)
+                return
+            try:
+                self._run(job_id)
+            except Exception:
+                logger.exception("Ingestion job %d could not be run", job_id)
+
+    def _run(self, job_id: int):
+        from .models import IngestionJob
+
+        db = self.session_factory()
+        try:
+            job = db.get(IngestionJob, job_id)
+            if job is None or job.status != PENDING:
+                return
+            key = (job.collection, job.filename)
+        finally:
+            db.close()
+        with self._running_lock:
+            if key in self._running:
+                # Deferred rather than run alongside, which would leave both versions in the store.
+                self._running[key].append(job_id)
+                return
+            self._running[key] = []
+        # This worker then runs the jobs that queued up behind it, oldest first.
+        while job_id is not None:
+            try:
+                self._execute(job_id)
+            except Exception:
+                logger.exception("Ingestion job %d could not be run", job_id)
+            with self._running_lock:
+                waiting = self._running[key]
+                if waiting and not self._stopping.is_set():
+                    job_id = waiting.pop(0)
+                else:
+                    # Jobs still waiting at shutdown stay pending for resume().
+                    del self._running[key]
+                    job_id = None
+
+    def _execute(self, job_id: int):
+        from .models import IngestionJob
+
+        db = self.session_factory()
+        try:
+            # Claimed with a conditional update, so a job queued twice still runs once.
+            claimed = (db.query(IngestionJob)
+                       .filter(IngestionJob.id == job_id, IngestionJob.status == PENDING)
+                       .update({"status": RUNNING, "started_at": datetime.utcnow(),
+                                "sections_parsed": 0, "chunks_indexed": 0}))
+            db.commit()
+            if not claimed:
+                return
+            job = db.get(IngestionJob, job_id)
+            file_path, filename, collection, sha256 = Path(job.file_path), job.filename, job.collection, job.sha256
+            config = IngestionConfig.model_validate_json(job.config) if job.config else IngestionConfig()
+        finally:
+            db.close()
+
+        def progress(update: IngestionProgress):
+            if self._stopping.is_set():
+                raise JobInterrupted()
+            services.log_progress(update)
+            self._update(job_id, sections_parsed=update.sections_parsed, chunks_indexed=update.chunks_indexed)
+
+        try:
+            with self.collections.use(collection) as vector_store:
+                result = services.process_file(file_path, config, vector_store, self.provider, filename,
+                                               sha256=sha256, progress=progress, parser_pool=self.parser_pool)
+        except JobInterrupted:
+            self._update(job_id, status=PENDING, started_at=None)
+            logger.info("Ingestion job %d interrupted by shutdown; it will be resumed", job_id)
+        except Exception as e:
+            logger.exception("Ingestion job %d failed", job_id)
+            self._update(job_id, status=FAILED, error_message=str(e), completed_at=datetime.utcnow())
+        else:
+            self._update(job_id, status=COMPLETED, message=result["message"],
+                         chunks_indexed=result.get("chunk_count", 0), completed_at=datetime.utcnow())
+
+    def stats(self) -> Dict[str, int]:
+        """Reports the queued jobs and the concurrency."""
+        return {"queued": self._queue.qsize(), "workers": len(self._workers),
+                "parse_processes": self.parser_pool.processes}
+
+    def close(self):
+        """
+        Stops the workers. Running jobs stop at their next batch, are rolled back and set
+        pending, so resume() picks them up on the next start.
+        """
+        self._stopping.set()
+        self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self.parser_pool.close()
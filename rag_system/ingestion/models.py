@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, DateTime, ForeignKey, String
+from sqlalchemy import BigInteger, Column, Integer, Text, DateTime, ForeignKey, String
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from typing import List
@@ -33,9 +33,19 @@ class IngestionJob(Base):
     __tablename__ = "ingestion_jobs"
 
     id = Column(Integer, primary_key=True, index=True)
-    status = Column(String(50), nullable=False, default="pending")
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
-    started_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String(50), nullable=False, default="pending", index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=True)
+    filename = Column(String(255), nullable=False)
+    collection = Column(String(64), nullable=False)
+    file_path = Column(String(1024), nullable=False)
+    sha256 = Column(String(64), nullable=True)
+    size_bytes = Column(BigInteger, nullable=True)
+    config = Column(Text, nullable=True)  # IngestionConfig as JSON
+    sections_parsed = Column(Integer, nullable=False, default=0)
+    chunks_indexed = Column(Integer, nullable=False, default=0)
+    message = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
     completed_at = Column(DateTime, nullable=True)
     error_message = Column(Text, nullable=True)
     document = relationship("Document")
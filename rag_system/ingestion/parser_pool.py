@@ -0,0 +1,115 @@
+import logging
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+from config import settings
+from .schemas import IngestionConfig
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting reader checks that the parser process is still alive, in seconds
+POLL_INTERVAL = 0.5
+
+
+def _parse_into(channel, stop, file_path: str, filename: str, config: IngestionConfig, batch_size: int):
+    """Runs in a parser process: streams a document's metadata and chunk batches into the channel."""
+    from .services import _parsed_batches
+
+    def put(message) -> bool:
+        while not stop.is_set():
+            try:
+                channel.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for item in _parsed_batches(Path(file_path), filename, config, batch_size):
+            if not put(("item", item)):
+                return
+        put(("done", None))
+    except Exception as e:
+        try:
+            put(("error", e))
+        except Exception:
+            # The exception itself could not be pickled.
+            put(("error", RuntimeError(f"{type(e).__name__}: {e}")))
+
+
+def _parse_whole(file_path: str, filename: str, config: IngestionConfig, batch_size: int) -> List[Any]:
+    """Runs in a parser process: returns a small document's metadata and chunk batches at once."""
+    from .services import _parsed_batches
+
+    return list(_parsed_batches(Path(file_path), filename, config, batch_size))
+
+
+class ParserPool:
+    """
+    A pool of processes that parse and chunk documents, so CPU-heavy parsing such as PDF
+    text extraction never competes with the API process's search threads for the GIL.
+
+    Embedding and indexing stay with the caller: the embedding dispatcher keeps bulk work
+    behind search queries, and the vector store keeps a single writer. Batches stream back
+    over a bounded queue, so a parser runs at most `depth` batches ahead of its reader,
+    just like the in-process prefetch; files small enough to hold about one batch of text
+    come back in one piece instead, which saves a queue per file when ingesting many
+    small documents. Processes are spawned rather than forked, as the
+    API process runs threads.
+    """
+
+    def __init__(self, processes: Optional[int] = None):
+        self.processes = processes or settings.INGEST_PARSE_PROCESSES
+        context = multiprocessing.get_context("spawn")
+        # Plain multiprocessing queues cannot be passed to pool tasks; managed ones can.
+        self._manager = context.Manager()
+        self._pool = ProcessPoolExecutor(max_workers=self.processes, mp_context=context)
+
+    def parse(self, file_path: Path, filename: str, config: IngestionConfig,
+              batch_size: int, depth: int) -> Iterator[Any]:
+        """
+        Parses a document in a pool process; nothing is submitted until the first item is read.
+
+        Args:
+            file_path: Path of the file to parse
+            filename: Name that decides the parser, by its extension
+            config: Chunking settings
+            batch_size: Chunks per batch
+            depth: Batches the parser may run ahead of the reader
+
+        Yields:
+            The document-level metadata, then (chunks, sections parsed) batches; errors
+            raised while parsing are re-raised here
+        """
+        if Path(file_path).stat().st_size <= config.chunk_size * batch_size:
+            yield from self._pool.submit(_parse_whole, str(file_path), filename, config, batch_size).result()
+            return
+
+        channel = self._manager.Queue(maxsize=max(1, depth))
+        stop = self._manager.Event()
+        future = self._pool.submit(_parse_into, channel, stop, str(file_path), filename, config, batch_size)
+        try:
+            while True:
+                try:
+                    kind, item = channel.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    if future.done():
+                        # Raises if the process died, e.g. BrokenProcessPool.
+                        future.result()
+                        raise RuntimeError(f"The parser process stopped before finishing {filename}.")
+                    continue
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise item
+                yield item
+        finally:
+            # Also reached when the reader gives up early; the parser stops at its next batch.
+            stop.set()
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        self._manager.shutdown()
@@ -1,6 +1,9 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Query
 from . import services
-from .schemas import IngestionConfig
+from .jobs import IngestionJobQueue
+from .schemas import IngestionConfig, IngestionJobStatus
+from ..core.registry import get_collections, get_ingestion_jobs
 
 
 router = APIRouter(
@@ -8,21 +11,56 @@ router = APIRouter(
     tags=["Ingestion"],
 )
 
-@router.post("/upload", summary="Upload a document for ingestion")
+@router.post("/upload", status_code=202, response_model=IngestionJobStatus,
+             summary="Upload a document for ingestion")
 def upload_document(
     config: IngestionConfig = Depends(), 
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    collections = Depends(get_collections),
+    jobs: IngestionJobQueue = Depends(get_ingestion_jobs)
 ):
     """
     Upload a document (Markdown, PDF, DOCX, etc.) to the system.
 
-    The file will be saved, and its content and metadata will be extracted.
+    The file is saved and queued for ingestion, and the job is returned right away;
+    poll /ingest/jobs/{job_id} until its status is completed or failed.
     """
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file name provided.")
+    if not file.filename.endswith(services.SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail=f"File type for '{file.filename}' is not supported.")
 
     try:
-        result = services.save_and_process_file(file, config)
-        return {"filename": file.filename, "details": result}
+        collection = collections.resolve(config.collection)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        file_path, sha256, size = services.save_upload(file)
+        return jobs.submit(file_path, file.filename, collection, config, sha256=sha256, size_bytes=size)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobStatus, summary="Get an ingestion job")
+def get_job(job_id: int, jobs: IngestionJobQueue = Depends(get_ingestion_jobs)):
+    """
+    Report an ingestion job's status and progress: sections parsed, chunks indexed,
+    and the outcome once it has completed or failed.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} not found.")
+    return job
+
+@router.get("/jobs", response_model=List[IngestionJobStatus], summary="List ingestion jobs")
+def list_jobs(
+    status: Optional[str] = Query(None, description="pending, running, completed or failed"),
+    collection: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+    jobs: IngestionJobQueue = Depends(get_ingestion_jobs)
+):
+    """
+    List ingestion jobs, newest first.
+    """
+    return jobs.list(status=status, collection=collection, limit=limit, offset=offset)
@@ -1,5 +1,7 @@
+from datetime import datetime
 from enum import Enum
-from pydantic import BaseModel, Field
+from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field
 
 class ChunkingStrategy(str, Enum):
     """Enum for the available chunking strategies."""
@@ -22,3 +24,45 @@ class IngestionConfig(BaseModel):
         ge=0,
         description="The overlap between chunks for length-based chunking."
     )
+    collection: Optional[str] = Field(
+        default=None,
+        description="The collection to ingest into; defaults to the default collection."
+    )
+
+class IngestionProgress(BaseModel):
+    """Progress of one file through the ingestion pipeline, reported after every batch."""
+    filename: str
+    # Pages of a PDF, paragraphs of a DOCX, read blocks of a text file; Markdown is one section
+    sections_parsed: int
+    chunks_indexed: int
+    batches: int
+    elapsed_seconds: float
+
+class IngestionJobStatus(BaseModel):
+    """An ingestion job as reported by the upload and job endpoints."""
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    # pending, running, completed or failed
+    status: str
+    filename: str
+    collection: str
+    sha256: Optional[str] = None
+    size_bytes: Optional[int] = None
+    sections_parsed: int = 0
+    chunks_indexed: int = 0
+    message: Optional[str] = None
+    error_message: Optional[str] = None
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+class BulkIngestionProgress(BaseModel):
+    """Throughput of a bulk directory ingestion, reported as files finish and batches are indexed."""
+    files_total: int
+    files_done: int
+    files_failed: int
+    chunks_indexed: int
+    elapsed_seconds: float
+    files_per_second: float
+    chunks_per_second: float
@@ -1,114 +1,275 @@
 import docx
 import frontmatter
+import hashlib
+import logging
 import pypdf
+import queue
+import threading
+import time
+import uuid
 import numpy as np
 
-from .chunking import chunk_by_length, chunk_by_headings, clean_code_blocks
-from .schemas import IngestionConfig, ChunkingStrategy
+from config import settings
+from .chunking import iter_chunks_by_length, chunk_by_headings, clean_code_blocks
+from .schemas import IngestionConfig, IngestionProgress, ChunkingStrategy
 from ..vector_store.faiss_store import FaissVectorStore
-from ..embeddings.provider_factory import EmbeddingProviderFactory
-import shutil
+from ..embeddings.base_provider import BaseEmbeddingProvider
+from ..embeddings.dispatcher import bulk_lane
 from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
 from fastapi import UploadFile
 
+if TYPE_CHECKING:
+    from .parser_pool import ParserPool
+
+logger = logging.getLogger(__name__)
+
 UPLOAD_DIRECTORY = Path("uploads")
 UPLOAD_DIRECTORY.mkdir(exist_ok=True)
 
-# Initialize the vector store. In a production app, this might be managed differently.
-vector_store = FaissVectorStore()
-# Initialize the embedding provider
-provider_config = {
-    "provider_type": "ollama",
-    "config": {
-        "base_url": "http://localhost:11434",
-        "model": "mistral"
-    }
-}
-provider = EmbeddingProviderFactory.create_provider(**provider_config)
-
 
-def _process_pdf(path: Path) -> str:
-    """Extracts text content from a PDF file."""
+def _process_pdf(path: Path) -> Iterator[str]:
+    """Extracts the text of a PDF file page by page."""
     with path.open("rb") as f:
         reader = pypdf.PdfReader(f)
-        return "\n".join(page.extract_text() for page in reader.pages)
+        for number, page in enumerate(reader.pages):
+            yield ("\n" if number else "") + page.extract_text()
 
 
-def _process_docx(path: Path) -> str:
-    """Extracts text content from a DOCX file."""
+def _process_docx(path: Path) -> Iterator[str]:
+    """Extracts the text of a DOCX file paragraph by paragraph."""
     doc = docx.Document(path)
-    return "\n".join(para.text for para in doc.paragraphs)
+    for number, para in enumerate(doc.paragraphs):
+        yield ("\n" if number else "") + para.text
 
 
-def _process_txt(path: Path) -> str:
-    """Reads content from a plain text file."""
+def _process_txt(path: Path) -> Iterator[str]:
+    """Reads a plain text file block by block."""
     with path.open("r", encoding="utf-8") as f:
-        return f.read()
+        while block := f.read(settings.INGEST_READ_BLOCK_BYTES):
+            yield block
+
+
+SUPPORTED_EXTENSIONS = (".md", ".pdf", ".docx", ".txt")
+
+
+def _open_document(path: Path, filename: str) -> Tuple[Iterator[str], Dict[str, Any]]:
+    """Returns the document's text as a stream of sections, and its document-level metadata."""
+    if filename.endswith(".md"):
+        post = frontmatter.load(path)
+        return iter([clean_code_blocks(post.content)]), post.metadata
+    if filename.endswith(".pdf"):
+        return _process_pdf(path), {}
+    if filename.endswith(".docx"):
+        return _process_docx(path), {}
+    return _process_txt(path), {}
+
+
+def _chunk_batches(sections: Iterator[str], config: IngestionConfig, markdown: bool,
+                   batch_size: int) -> Iterator[Tuple[List[str], int]]:
+    """Chunks a stream of sections into batches of at most batch_size chunks, with the sections parsed so far."""
+    parsed = 0
+
+    def counted() -> Iterator[str]:
+        nonlocal parsed
+        for section in sections:
+            parsed += 1
+            yield section
 
+    if config.chunking_strategy == ChunkingStrategy.HEADINGS and markdown:
+        chunks = (chunk for section in counted() for chunk in chunk_by_headings(section))
+    else:
+        # Default to length-based chunking for non-markdown files or if specified
+        chunks = iter_chunks_by_length(counted(), config.chunk_size, config.chunk_overlap)
 
-def save_and_process_file(file: UploadFile, config: IngestionConfig):
-    """Saves an uploaded file and processes it to extract metadata and content."""
+    batch: List[str] = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch, parsed
+            batch = []
+    if batch:
+        yield batch, parsed
+
+
+def _parsed_batches(path: Path, filename: str, config: IngestionConfig,
+                    batch_size: int) -> Iterator[Any]:
+    """
+    Parses and chunks a document: yields its document-level metadata first, then its
+    chunk batches with the sections parsed so far.
+    """
+    sections, metadata = _open_document(path, filename)
+    yield metadata
+    yield from _chunk_batches(sections, config, filename.endswith(".md"), batch_size)
+
+
+def _prefetch(items: Iterator[Any], depth: int) -> Iterator[Any]:
+    """
+    Runs a generator on a background thread, at most `depth` items ahead of the consumer.
+
+    The bounded queue is the backpressure: parsing pauses while embedding falls behind, so
+    at most depth + 1 batches are in memory however large the document is. Errors in the
+    generator are re-raised to the consumer.
+    """
+    buffer: "queue.Queue[Tuple[Any, Optional[BaseException]]]" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(entry: Tuple[Any, Optional[BaseException]]) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+        finally:
+            items.close()
+
+    producer = threading.Thread(target=produce, name="ingest-parse", daemon=True)
+    producer.start()
     try:
-        # Save the uploaded file
-        file_path = UPLOAD_DIRECTORY / file.filename
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # Process the file
-        content = ""
-        metadata = {}
-
-        # Process the file based on its extension
-        if file.filename.endswith(".md"):
-            post = frontmatter.load(file_path)
-            content = clean_code_blocks(post.content)
-            metadata = post.metadata
-        elif file.filename.endswith(".pdf"):
-            content = _process_pdf(file_path)
-        elif file.filename.endswith(".docx"):
-            content = _process_docx(file_path)
-        elif file.filename.endswith(".txt"):
-            content = _process_txt(file_path)
-        else:
-            return {"message": f"File type for '{file.filename}' is not supported."}
-
-        # Select chunking strategy
-        chunks = []
-        if config.chunking_strategy == ChunkingStrategy.HEADINGS and file.filename.endswith(".md"):
-            chunks = chunk_by_headings(content)
-        else:
-            # Default to length-based chunking for non-markdown files or if specified
-            chunks = chunk_by_length(
-                content,
-                chunk_size=config.chunk_size,
-                chunk_overlap=config.chunk_overlap
-            )
-
-        if not chunks:
-            return {"message": f"File '{file.filename}' processed, but no content was chunked."}
-
-        # Generate embeddings for the chunks
-        embeddings = provider.get_embeddings(chunks)
-
-        # Prepare metadata for each chunk
-        chunk_metadatas = [
-            {
-                **metadata, # Document-level metadata
-                "file_origin": file.filename,
-                "chunk_index": i,
-            }
-            for i in range(len(chunks))
-        ]
-
-        # Add to the vector store
-        vector_store.add(chunks, embeddings, chunk_metadatas)
-        vector_store.save()
-
-        return {
-            "message": f"Successfully ingested and indexed {len(chunks)} chunks from {file.filename}.",
-            "chunk_count": len(chunks),
-            "file_metadata": metadata,
-        }
+        while True:
+            item, error = buffer.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # Also reached when the consumer gives up early, e.g. on an embedding error.
+        stop.set()
+
+
+def save_upload(file: UploadFile) -> Tuple[Path, str, int]:
+    """
+    Streams an uploaded file to disk block by block, hashing it in the same pass.
+
+    The file is stored under a name prefixed with its content hash, so a later upload of
+    another file with the same name cannot overwrite it while it waits to be ingested.
+
+    Returns:
+        The stored file's path, its SHA-256 and its size in bytes
+    """
+    part_path = UPLOAD_DIRECTORY / f".{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with part_path.open("wb") as buffer:
+            while block := file.file.read(settings.INGEST_READ_BLOCK_BYTES):
+                digest.update(block)
+                buffer.write(block)
+                size += len(block)
+        file_path = UPLOAD_DIRECTORY / f"{digest.hexdigest()[:16]}_{Path(file.filename).name}"
+        part_path.replace(file_path)
     finally:
         # The file object must be closed.
         file.file.close()
+        part_path.unlink(missing_ok=True)
+    return file_path, digest.hexdigest(), size
+
+
+def log_progress(update: IngestionProgress):
+    """A progress callback that logs every batch."""
+    logger.info("Ingesting %s: %d chunks indexed from %d sections in %.1fs",
+                update.filename, update.chunks_indexed, update.sections_parsed, update.elapsed_seconds)
+
+
+def process_file(file_path: Path, config: IngestionConfig, vector_store: FaissVectorStore,
+                 provider: BaseEmbeddingProvider, filename: Optional[str] = None,
+                 sha256: Optional[str] = None,
+                 progress: Optional[Callable[[IngestionProgress], None]] = None,
+                 parser_pool: Optional["ParserPool"] = None):
+    """
+    Chunks, embeds and indexes a file already on disk, replacing any earlier version of it.
+
+    The file is streamed through the pipeline: sections are parsed and chunked on a
+    background thread, or in a process of parser_pool, and every INGEST_BATCH_SIZE chunks
+    are embedded and added to the store while the next batch is being parsed. Memory stays bounded by a few batches
+    whatever the size of the file. New batches are added hidden, and once the last one
+    is in they become searchable in the same step that deletes the earlier version, so
+    searches see one version of the file or the other, never both. If ingestion fails
+    the batches already added are deleted again and the earlier version stays in place.
+
+    Args:
+        file_path: Path of the file to ingest
+        config: Chunking settings
+        vector_store: Store of the target collection
+        provider: Embedding provider
+        filename: Name recorded as the chunks' file_origin; defaults to the file's name
+        sha256: Hash of the file's contents, recorded as the chunks' content_sha256
+        progress: Called with an IngestionProgress after every batch; an exception it raises
+            stops the ingestion like any other error
+        parser_pool: Parses the file in a separate process, off this process's CPU
+
+    Returns:
+        A summary dict with a message, the chunk count and the file's metadata
+    """
+    filename = filename or file_path.name
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        return {"message": f"File type for '{filename}' is not supported."}
+
+    previous = vector_store.document_ids(filename)
+    if parser_pool is not None:
+        batches = parser_pool.parse(file_path, filename, config, settings.INGEST_BATCH_SIZE,
+                                    settings.INGEST_PREFETCH_BATCHES)
+    else:
+        batches = _prefetch(_parsed_batches(file_path, filename, config, settings.INGEST_BATCH_SIZE),
+                            settings.INGEST_PREFETCH_BATCHES)
+
+    started = time.perf_counter()
+    added: List[np.ndarray] = []
+    chunk_count = 0
+    try:
+        metadata = next(batches)
+        for chunks, sections_parsed in batches:
+            # Generate embeddings for the chunks, as bulk work that yields to search queries
+            with bulk_lane():
+                embeddings = provider.get_embeddings(chunks)
+
+            # Prepare metadata for each chunk
+            chunk_metadatas = [
+                {
+                    **metadata, # Document-level metadata
+                    "file_origin": filename,
+                    "chunk_index": chunk_count + i,
+                    **({"content_sha256": sha256} if sha256 else {}),
+                }
+                for i in range(len(chunks))
+            ]
+            added.append(vector_store.add(chunks, embeddings, chunk_metadatas, hidden=True))
+            chunk_count += len(chunks)
+            if progress is not None:
+                progress(IngestionProgress(
+                    filename=filename, sections_parsed=sections_parsed, chunks_indexed=chunk_count,
+                    batches=len(added), elapsed_seconds=time.perf_counter() - started,
+                ))
+    except BaseException:
+        # Take back the partial new version; the earlier one was never touched.
+        if added:
+            vector_store.delete(np.concatenate(added))
+        raise
+    finally:
+        batches.close()
+
+    if not chunk_count:
+        return {"message": f"File '{filename}' processed, but no content was chunked."}
+
+    # The new version is complete: swap it in for the earlier one
+    vector_store.reveal(np.concatenate(added), previous)
+    vector_store.save()
+
+    return {
+        "message": f"Successfully ingested and indexed {chunk_count} chunks from {filename}.",
+        "chunk_count": chunk_count,
+        "file_metadata": metadata,
+    }
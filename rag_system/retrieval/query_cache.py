@@ -0,0 +1,179 @@
+import logging
+import re
+import threading
+import time
+import unicodedata
+import numpy as np
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, TextIO, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a query: NFKC-normalized with runs of whitespace collapsed and trimmed."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class QueryEmbeddingCache:
+    """
+    An in-memory LRU cache of query embeddings with a time-to-live.
+
+    Keys are (namespace, normalized query), where the namespace names the embedding provider
+    and model. Entries older than ttl_seconds are treated as misses. The cache also times
+    the embedding calls made for misses, so stats() can estimate the time the hits saved.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, ttl_seconds: Optional[float] = None):
+        self.max_entries = settings.QUERY_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.ttl_seconds = settings.QUERY_CACHE_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.embedded_queries = 0
+        self.embed_seconds = 0.0
+
+    def get_many(self, namespace: str, queries: List[str], record: bool = True) -> List[Optional[np.ndarray]]:
+        """
+        Returns the cached embedding of each normalized query, or None where it is missing or expired.
+
+        Args:
+            namespace: Embedding provider and model
+            queries: Normalized query texts
+            record: Count the lookups in the hit and miss stats (off for warm-up)
+        """
+        now = time.monotonic()
+        results: List[Optional[np.ndarray]] = []
+        with self._lock:
+            for query in queries:
+                key = (namespace, query)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] < now:
+                    del self._entries[key]
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    self.misses += record
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += record
+                    results.append(entry[0])
+        return results
+
+    def put_many(self, namespace: str, queries: List[str], embeddings: np.ndarray):
+        """Caches the embeddings of normalized queries, evicting the least recently used beyond max_entries."""
+        expires = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for query, embedding in zip(queries, embeddings):
+                key = (namespace, query)
+                self._entries[key] = (embedding, expires)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_embedding(self, queries: int, seconds: float):
+        """Records the cost of embedding cache misses, for the time-saved estimate."""
+        with self._lock:
+            self.embedded_queries += queries
+            self.embed_seconds += seconds
+
+    def stats(self) -> Dict[str, float]:
+        """Reports hit rate, size and the embedding time the hits are estimated to have saved."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            seconds_per_query = self.embed_seconds / self.embedded_queries if self.embedded_queries else 0.0
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "embed_seconds": self.embed_seconds,
+                "avg_embed_seconds": seconds_per_query,
+                "estimated_seconds_saved": self.hits * seconds_per_query,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class QueryLog:
+    """
+    An append-only file of the normalized queries searched, one per line, so the query cache
+    can be warmed with the recent ones after a restart.
+
+    Writes are buffered and reach the file on close(), or when the buffer fills; a crash
+    loses at most the buffered tail, which only makes the next warm-up a little colder.
+    Once the file holds twice max_entries lines it is rewritten with the max_entries most
+    recent distinct queries, so it stays bounded.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: Optional[int] = None):
+        self.path = Path(path or settings.QUERY_LOG_PATH)
+        self.max_entries = settings.QUERY_LOG_MAX_ENTRIES if max_entries is None else max_entries
+        self._file: Optional[TextIO] = None
+        self._lines = 0
+        self._lock = threading.Lock()
+
+    def append(self, queries: List[str]):
+        """Records normalized queries, which never contain a line break."""
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._lines = len(self._read())
+                self._file = self.path.open("a", encoding="utf-8")
+            queries = [query for query in queries if query]
+            self._file.writelines(f"{query}\n" for query in queries)
+            self._lines += len(queries)
+            if self._lines >= 2 * self.max_entries:
+                self._compact()
+
+    def recent(self, limit: Optional[int] = None) -> List[str]:
+        """
+        The most recent distinct queries, newest first.
+
+        Args:
+            limit: Maximum number of queries (default QUERY_CACHE_WARM_LIMIT)
+        """
+        limit = settings.QUERY_CACHE_WARM_LIMIT if limit is None else limit
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            lines = self._read()
+        return list(dict.fromkeys(reversed(lines)))[:limit]
+
+    def _read(self) -> List[str]:
+        if not self.path.exists():
+            return []
+        with self.path.open("r", encoding="utf-8", newline="\n") as f:
+            return [line.rstrip("\n") for line in f if line.strip()]
+
+    def _compact(self):
+        """Rewrites the file with the most recent distinct queries, oldest first. Callers hold the lock."""
+        self._file.close()
+        kept = list(dict.fromkeys(reversed(self._read())))[:self.max_entries][::-1]
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            f.writelines(f"{query}\n" for query in kept)
+        tmp_path.replace(self.path)
+        self._file = self.path.open("a", encoding="utf-8")
+        self._lines = len(kept)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
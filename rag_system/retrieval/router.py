@@ -1,25 +1,16 @@
 from fastapi import APIRouter, Depends, HTTPException
 from rag_system.retrieval.schemas import SearchRequest, SearchResponse
 from rag_system.retrieval.services import SearchService
-from rag_system.vector_store.faiss_store import FaissVectorStore
-from rag_system.embeddings.provider_factory import EmbeddingProviderFactory
+from rag_system.core.registry import get_search_service, get_collections
+from rag_system.vector_store.collection_manager import CollectionManager
 
 router = APIRouter(prefix="/retrieve", tags=["retrieval"])
 
-# Initialize dependencies
-vector_store = FaissVectorStore()
-provider_config = {
-    "provider_type": "ollama",
-    "config": {
-        "base_url": "http://localhost:11434",
-        "model": "mistral"
-    }
-}
-provider = EmbeddingProviderFactory.create_provider(**provider_config)
-search_service = SearchService(vector_store, "ollama", provider_config)
-
 @router.post("/search", response_model=SearchResponse)
-async def search_endpoint(request: SearchRequest) -> SearchResponse:
+async def search_endpoint(
+    request: SearchRequest,
+    search_service: SearchService = Depends(get_search_service)
+) -> SearchResponse:
     """
     Perform semantic search on the vector store.
     
@@ -30,6 +21,25 @@ async def search_endpoint(request: SearchRequest) -> SearchResponse:
         SearchResponse containing the retrieved results
     """
     try:
-        return search_service.search(request)
+        return await search_service.asearch(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/collections")
+async def list_collections(collections: CollectionManager = Depends(get_collections)):
+    """
+    List the collections and which of them are loaded.
+
+    Returns:
+        The collection names and the memory budget, resident bytes and loaded collections (coldest first)
+    """
+    return {"collections": collections.names(), **collections.stats()}
+
+@router.get("/query-cache")
+async def query_cache_stats(search_service: SearchService = Depends(get_search_service)):
+    """
+    Report the query embedding cache's hit rate, size and estimated embedding time saved.
+    """
+    if search_service.query_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **search_service.query_cache.stats()}
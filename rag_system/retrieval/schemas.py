@@ -1,16 +1,32 @@
-from pydantic import BaseModel
-from typing import Dict, List, Optional
+import numpy as np
+from pydantic import BaseModel, ConfigDict, PlainSerializer, WithJsonSchema
+from typing import Annotated, Any, Dict, List, Optional
+
+# A float32 vector kept as an ndarray in Python and turned into a list of floats only when
+# rendered as JSON, i.e. at the API edge.
+Embedding = Annotated[
+    np.ndarray,
+    PlainSerializer(lambda vector: vector.tolist(), return_type=List[float], when_used="json"),
+    WithJsonSchema({"type": "array", "items": {"type": "number"}}),
+]
 
 class SearchRequest(BaseModel):
     query: str
     top_k: int = 5
-    score_threshold: float = 0.5
-    metadata_filters: Optional[Dict[str, str]] = None
+    # Collection to search; None means the default collection
+    collection: Optional[str] = None
+    # Maximum L2 distance, or minimum ip/cosine similarity, of a result; pushed down into the index search
+    score_threshold: Optional[float] = None
+    # Equality, IN (list), {"$prefix": ...} and {"$gt"/"$gte"/"$lt"/"$lte": ...} conditions, ANDed across keys
+    metadata_filters: Optional[Dict[str, Any]] = None
+    # Per-request ANN tuning; None falls back to the store's persisted defaults
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
 
 class SearchResult(BaseModel):
     text: str
     score: float
-    metadata: Dict[str, str]
+    metadata: Dict[str, Any]
     document_id: str
 
     class Config:
@@ -28,6 +44,8 @@ class SearchResult(BaseModel):
         }
 
 class SearchResponse(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
     results: List[SearchResult]
     total_results: int
-    query_embedding: List[float]
+    query_embedding: Embedding
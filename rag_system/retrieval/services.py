@@ -1,42 +1,191 @@
-from typing import List, Optional, Dict
+import asyncio
+import json
+import time
+from typing import Any, List, Optional, Dict, Tuple
 from rag_system.retrieval.schemas import SearchRequest, SearchResponse, SearchResult
-from rag_system.vector_store.faiss_store import FaissVectorStore
-from rag_system.embeddings.provider_factory import EmbeddingProviderFactory
+from rag_system.retrieval.query_cache import QueryEmbeddingCache, QueryLog, normalize_query
+from rag_system.vector_store.collection_manager import CollectionManager
+from rag_system.embeddings.base_provider import BaseEmbeddingProvider
+from rag_system.embeddings.dispatcher import bulk_lane
 import numpy as np
 
 class SearchService:
-    def __init__(self, vector_store: FaissVectorStore, provider_type: str, provider_config: Dict):
-        self.vector_store = vector_store
-        self.provider = EmbeddingProviderFactory.create_provider(provider_type, provider_config)
+    def __init__(self, collections: CollectionManager, provider: BaseEmbeddingProvider,
+                 query_cache: Optional[QueryEmbeddingCache] = None, query_log: Optional[QueryLog] = None):
+        self.collections = collections
+        self.provider = provider
+        # Hot query embeddings; None disables caching
+        self.query_cache = query_cache
+        # Searched queries, read back to warm the cache on the next start; None disables logging
+        self.query_log = query_log
+        self.cache_namespace = (getattr(provider, "namespace", None) or
+                                f"{type(provider).__name__}:{getattr(provider, 'model', '')}")
+
+    def higher_is_better(self, collection: Optional[str] = None) -> bool:
+        """Whether larger scores are better in a collection, i.e. it uses an ip or cosine metric."""
+        return self.collections.get(collection).higher_is_better
 
     def search(self, request: SearchRequest) -> SearchResponse:
-        # Generate embedding for the query
+        return self.search_many([request])[0]
+
+    async def asearch(self, request: SearchRequest) -> SearchResponse:
+        return (await self.asearch_many([request]))[0]
+
+    def search_many(self, requests: List[SearchRequest]) -> List[SearchResponse]:
+        """
+        Answers several search requests with one embedding call and one vector store call
+        per distinct collection, set of ANN knobs, metadata filters and score threshold.
+
+        Args:
+            requests: Search requests, e.g. an evaluation set or the parts of a multi-part prompt
+
+        Returns:
+            One SearchResponse per request, in order
+        """
+        if not requests:
+            return []
+
+        # Generate embeddings for the queries not in the query cache
+        queries, cached = self._cached_embeddings(requests)
+        missing = self._missing(queries, cached)
         try:
-            query_embedding = self.provider.get_embedding(request.query)
+            started = time.perf_counter()
+            if len(missing) == 1:
+                embedded = self.provider.get_embedding(missing[0])[np.newaxis]
+            elif missing:
+                embedded = self.provider.get_embeddings(missing)
         except Exception as e:
             raise ValueError(f"Failed to generate embedding: {str(e)}")
-        
-        # Perform semantic search
-        results = self.vector_store.search(
-            query_embedding,
-            top_k=request.top_k,
-            score_threshold=request.score_threshold,
-            metadata_filters=request.metadata_filters
-        )
-        
+        if missing:
+            self._remember(missing, embedded, time.perf_counter() - started)
+
+        return self._search_embedded(requests, self._assemble(queries, cached, missing, embedded if missing else None))
+
+    async def asearch_many(self, requests: List[SearchRequest]) -> List[SearchResponse]:
+        """
+        The async counterpart of search_many(), for use inside request handlers.
+
+        The queries are embedded through the provider's async client, and the FAISS search runs
+        on a worker thread, so the event loop keeps serving other requests meanwhile.
+        """
+        if not requests:
+            return []
+
+        queries, cached = self._cached_embeddings(requests)
+        missing = self._missing(queries, cached)
+        try:
+            started = time.perf_counter()
+            if len(missing) == 1:
+                embedded = (await self.provider.aget_embedding(missing[0]))[np.newaxis]
+            elif missing:
+                embedded = await self.provider.aget_embeddings(missing)
+        except Exception as e:
+            raise ValueError(f"Failed to generate embedding: {str(e)}")
+        if missing:
+            self._remember(missing, embedded, time.perf_counter() - started)
+
+        query_embeddings = self._assemble(queries, cached, missing, embedded if missing else None)
+        return await asyncio.to_thread(self._search_embedded, requests, query_embeddings)
+
+    def warm_query_cache(self, queries: List[str], batch_size: int = 256) -> int:
+        """
+        Pre-embeds queries into the query cache, e.g. the recent ones from the search log.
+
+        Args:
+            queries: Query texts; duplicates and already cached ones are skipped
+            batch_size: Queries per embedding call
+
+        Returns:
+            Number of queries embedded
+        """
+        if self.query_cache is None:
+            return 0
+        queries = list(dict.fromkeys(normalize_query(query) for query in queries))
+        missing = self._missing(queries, self.query_cache.get_many(self.cache_namespace, queries, record=False))
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            # Bulk work: warm-up must not delay live queries
+            with bulk_lane():
+                embeddings = self.provider.get_embeddings(batch)
+            self.query_cache.put_many(self.cache_namespace, batch, embeddings)
+        return len(missing)
+
+    def _cached_embeddings(self, requests: List[SearchRequest]) -> Tuple[List[str], List[Optional[np.ndarray]]]:
+        """The normalized queries and, with a query cache, their cached embeddings (None if missing)."""
+        queries = [normalize_query(request.query) for request in requests]
+        if self.query_log is not None:
+            self.query_log.append(queries)
+        if self.query_cache is None:
+            return queries, [None] * len(queries)
+        return queries, self.query_cache.get_many(self.cache_namespace, queries)
+
+    @staticmethod
+    def _missing(queries: List[str], cached: List[Optional[np.ndarray]]) -> List[str]:
+        # Each distinct query is embedded once, however many requests repeat it.
+        return list(dict.fromkeys(query for query, embedding in zip(queries, cached) if embedding is None))
+
+    def _remember(self, queries: List[str], embeddings: np.ndarray, seconds: float):
+        if self.query_cache is not None:
+            self.query_cache.put_many(self.cache_namespace, queries, embeddings)
+            self.query_cache.record_embedding(len(queries), seconds)
+
+    @staticmethod
+    def _assemble(queries: List[str], cached: List[Optional[np.ndarray]], missing: List[str],
+                  embedded: Optional[np.ndarray]) -> np.ndarray:
+        if embedded is not None and missing == queries:
+            # Nothing cached and no repeats: the provider's matrix is already the answer.
+            return embedded
+        fresh = dict(zip(missing, embedded)) if embedded is not None else {}
+        rows = [embedding if embedding is not None else fresh[query] for query, embedding in zip(queries, cached)]
+        embeddings = np.empty((len(rows), rows[0].shape[0]), dtype='float32')
+        for i, row in enumerate(rows):
+            embeddings[i] = row
+        return embeddings
+
+    def _search_embedded(self, requests: List[SearchRequest], query_embeddings: np.ndarray) -> List[SearchResponse]:
+        # Requests sharing the same collection, knobs, filters and threshold are searched together, at the largest top_k among them
+        groups: Dict[Tuple[str, Optional[int], Optional[int], str, Optional[float]], List[int]] = {}
+        for i, request in enumerate(requests):
+            collection = self.collections.resolve(request.collection)
+            filters_key = json.dumps(request.metadata_filters, sort_keys=True, default=str)
+            groups.setdefault((collection, request.nprobe, request.ef_search, filters_key, request.score_threshold), []).append(i)
+
+        results: List[List[Tuple[Dict[str, Any], float]]] = [[] for _ in requests]
+        for (collection, nprobe, ef_search, _, score_threshold), positions in groups.items():
+            # Filters and thresholds are pushed down into the index search, so top_k counts qualifying chunks only
+            with self.collections.use(collection) as vector_store:
+                batch = vector_store.search_batch(
+                    query_embeddings[positions],
+                    k=max(requests[i].top_k for i in positions),
+                    nprobe=nprobe,
+                    ef_search=ef_search,
+                    filters=requests[positions[0]].metadata_filters,
+                    score_threshold=score_threshold
+                )
+            for i, hits in zip(positions, batch):
+                results[i] = hits[:requests[i].top_k]
+
+        return [
+            self._to_response(request, hits, embedding)
+            for request, hits, embedding in zip(requests, results, query_embeddings)
+        ]
+
+    def _to_response(self, request: SearchRequest, results: List[Tuple[Dict[str, Any], float]],
+                     query_embedding: np.ndarray) -> SearchResponse:
         # Convert results to SearchResult objects
-        search_results = [
-            SearchResult(
-                text=result['text'],
-                score=result['score'],
-                metadata=result['metadata'],
-                document_id=result['document_id']
+        search_results = []
+        for metadata, score in results:
+            search_results.append(
+                SearchResult(
+                    text=metadata['chunk_text'],
+                    score=float(score),
+                    metadata={key: value for key, value in metadata.items() if key != 'chunk_text'},
+                    document_id=str(metadata.get('file_origin', ''))
+                )
             )
-            for result in results
-        ]
-        
+
         return SearchResponse(
             results=search_results,
             total_results=len(search_results),
-            query_embedding=query_embedding.tolist()
+            query_embedding=query_embedding
         )
@@ -0,0 +1,229 @@
+import json
+import threading
+import numpy as np
+from pathlib import Path
+from typing import Iterator, List, Dict, Any, Optional, Tuple
+
+from .columns import ColumnFile, BlobFile
+
+class ChunkStore:
+    """
+    Columnar, memory-mapped storage for chunk texts and metadata.
+
+    Document-level metadata is stored once per document; each chunk keeps only its text,
+    its document row, its chunk_index and any metadata that differs between chunks of the
+    same document. Row numbers are the stable chunk ids stored in the FAISS index; rows are
+    never renumbered. Nothing is read into memory on open; get() materializes only the rows
+    asked for.
+    """
+
+    def __init__(self, directory: str, read_only: bool = False):
+        self.directory = Path(directory)
+        self.read_only = read_only
+        if not read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+        self.header_path = self.directory / "header.json"
+        self.documents_path = self.directory / "documents.jsonl"
+
+        self.texts = BlobFile(self.directory / "texts.bin", read_only)
+        self.text_offsets = ColumnFile(self.directory / "text_offsets.i64", "int64", read_only=read_only)
+        self.extras = BlobFile(self.directory / "extras.bin", read_only)
+        self.extra_offsets = ColumnFile(self.directory / "extra_offsets.i64", "int64", read_only=read_only)
+        self.doc_rows = ColumnFile(self.directory / "doc_rows.i32", "int32", read_only=read_only)
+        self.chunk_indexes = ColumnFile(self.directory / "chunk_index.i32", "int32", read_only=read_only)
+
+        self._documents: Optional[List[Dict[str, Any]]] = None
+        self._documents_by_origin: Optional[Dict[Any, List[int]]] = None
+        self._pending_documents: List[str] = []
+        # Loading the documents file happens once, even when several readers ask at the same time.
+        self._documents_lock = threading.Lock()
+        self._recover()
+
+    def _recover(self):
+        """Trims anything an interrupted flush wrote past the last committed header."""
+        header = {"num_chunks": 0, "text_bytes": 0, "extra_bytes": 0}
+        if self.header_path.exists():
+            with self.header_path.open("r") as f:
+                header = json.load(f)
+        for column in (self.text_offsets, self.extra_offsets, self.doc_rows, self.chunk_indexes):
+            column.truncate(header["num_chunks"])
+        self.texts.truncate(header["text_bytes"])
+        self.extras.truncate(header["extra_bytes"])
+        # Headers written before this field existed cover the whole documents file.
+        self._documents_bytes = header.get("documents_bytes")
+        if self._documents_bytes is not None and not self.read_only and self.documents_path.exists():
+            if self.documents_path.stat().st_size > self._documents_bytes:
+                with self.documents_path.open("r+b") as f:
+                    f.truncate(self._documents_bytes)
+        self._documents = None
+        self._documents_by_origin = None
+
+    def __len__(self) -> int:
+        return len(self.doc_rows)
+
+    @property
+    def documents(self) -> List[Dict[str, Any]]:
+        """Document-level metadata, indexed by document row. Loaded on first use."""
+        documents = self._documents
+        if documents is not None:
+            return documents
+        with self._documents_lock:
+            if self._documents is None:
+                documents = []
+                if self.documents_path.exists():
+                    with self.documents_path.open("rb") as f:
+                        data = f.read() if self._documents_bytes is None else f.read(self._documents_bytes)
+                    documents = [json.loads(line) for line in data.decode("utf-8").splitlines()]
+                self._documents = documents
+            return self._documents
+
+    def document_rows(self, file_origin: Any) -> np.ndarray:
+        """
+        Returns the rows of every document ingested from file_origin, deleted or not.
+
+        A document's chunks occupy consecutive rows and documents are appended in order, so the
+        doc_rows column is sorted and each document's rows are found by binary search.
+        """
+        if self._documents_by_origin is None:
+            self._documents_by_origin = {}
+            for doc_row, document in enumerate(self.documents):
+                self._documents_by_origin.setdefault(document.get("file_origin"), []).append(doc_row)
+        rows = [
+            np.arange(self.doc_rows.searchsorted(doc_row, "left"), self.doc_rows.searchsorted(doc_row, "right"))
+            for doc_row in self._documents_by_origin.get(file_origin, [])
+        ]
+        return np.concatenate(rows) if rows else np.empty(0, dtype=np.int64)
+
+    def document_ranges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the first row and one past the last row of every document, indexed by document row."""
+        doc_rows = self.doc_rows.read_all()[:, 0]
+        doc_ids = np.arange(len(self.documents))
+        return np.searchsorted(doc_rows, doc_ids, "left"), np.searchsorted(doc_rows, doc_ids, "right")
+
+    def chunk_extras(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Yields (row, metadata) for the rows whose metadata differs from the rest of their document."""
+        ends = self.extra_offsets.read_all()[:, 0]
+        starts = np.concatenate([[0], ends[:-1]])
+        for row in np.flatnonzero(ends > starts):
+            yield int(row), json.loads(self.extras.read(int(starts[row]), int(ends[row])))
+
+    def _add_document(self, metadata: Dict[str, Any]) -> int:
+        # Frontmatter may hold dates and other non-JSON values; they come back as strings.
+        line = json.dumps(metadata, default=str)
+        self.documents.append(json.loads(line))
+        self._pending_documents.append(line)
+        doc_row = len(self.documents) - 1
+        if self._documents_by_origin is not None:
+            self._documents_by_origin.setdefault(metadata.get("file_origin"), []).append(doc_row)
+        return doc_row
+
+    def append(self, chunks: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Appends chunks and their metadata as new rows.
+
+        Consecutive chunks with the same file_origin form one document; the metadata they all
+        share is stored once for that document.
+        """
+        start = 0
+        while start < len(chunks):
+            end = start + 1
+            origin = metadatas[start].get("file_origin")
+            while end < len(chunks) and metadatas[end].get("file_origin") == origin:
+                end += 1
+            self._append_document(chunks[start:end], metadatas[start:end])
+            start = end
+
+    def _append_document(self, chunks: List[str], metadatas: List[Dict[str, Any]]):
+        first = metadatas[0]
+        shared = {
+            key: value for key, value in first.items()
+            if key != "chunk_index" and all(key in m and m[key] == value for m in metadatas[1:])
+        }
+        doc_row = self._add_document(shared)
+
+        text_ends = np.empty(len(chunks), dtype=np.int64)
+        extra_ends = np.empty(len(chunks), dtype=np.int64)
+        chunk_indexes = np.empty(len(chunks), dtype=np.int32)
+        for i, (chunk, metadata) in enumerate(zip(chunks, metadatas)):
+            text_ends[i] = self.texts.append(chunk.encode("utf-8"))
+            extra = {key: value for key, value in metadata.items() if key not in shared and key != "chunk_index"}
+            extra_ends[i] = self.extras.append(json.dumps(extra, default=str).encode("utf-8") if extra else b"")
+            chunk_indexes[i] = metadata.get("chunk_index", -1)
+
+        self.text_offsets.append(text_ends)
+        self.extra_offsets.append(extra_ends)
+        self.doc_rows.append(np.full(len(chunks), doc_row, dtype=np.int32))
+        self.chunk_indexes.append(chunk_indexes)
+
+    def get(self, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """Materializes the metadata dicts (with "chunk_text") for the given rows only."""
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        if rows.size == 0:
+            return []
+        text_ends = self.text_offsets.take(rows)[:, 0]
+        text_starts = np.where(rows > 0, self.text_offsets.take(np.maximum(rows - 1, 0))[:, 0], 0)
+        extra_ends = self.extra_offsets.take(rows)[:, 0]
+        extra_starts = np.where(rows > 0, self.extra_offsets.take(np.maximum(rows - 1, 0))[:, 0], 0)
+        doc_rows = self.doc_rows.take(rows)[:, 0]
+        chunk_indexes = self.chunk_indexes.take(rows)[:, 0]
+
+        results = []
+        for i in range(rows.size):
+            metadata = {
+                "chunk_text": self.texts.read(int(text_starts[i]), int(text_ends[i])).decode("utf-8"),
+                **self.documents[doc_rows[i]],
+            }
+            if extra_ends[i] > extra_starts[i]:
+                metadata.update(json.loads(self.extras.read(int(extra_starts[i]), int(extra_ends[i]))))
+            if chunk_indexes[i] >= 0:
+                metadata["chunk_index"] = int(chunk_indexes[i])
+            results.append(metadata)
+        return results
+
+    def flush(self):
+        """Appends buffered rows to disk, then commits them by rewriting the small header."""
+        for store in (self.texts, self.extras, self.text_offsets, self.extra_offsets, self.doc_rows, self.chunk_indexes):
+            store.flush()
+        if self._pending_documents:
+            with self.documents_path.open("ab") as f:
+                f.write("".join(line + "\n" for line in self._pending_documents).encode("utf-8"))
+            self._pending_documents = []
+        self._documents_bytes = self.documents_path.stat().st_size if self.documents_path.exists() else 0
+        self._write_header(len(self), len(self.texts), len(self.extras))
+
+    def _write_header(self, num_chunks: int, text_bytes: int, extra_bytes: int):
+        tmp_path = self.header_path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump({"num_chunks": num_chunks, "text_bytes": text_bytes, "extra_bytes": extra_bytes,
+                       "documents_bytes": self._documents_bytes}, f)
+        tmp_path.replace(self.header_path)
+
+    def files(self) -> List[Path]:
+        """The data files backing the store, e.g. for prewarming the page cache."""
+        return [store.path for store in (self.texts, self.extras, self.text_offsets, self.extra_offsets,
+                                         self.doc_rows, self.chunk_indexes) if store.path.exists()]
+
+    def truncate(self, num_chunks: int):
+        """Drops committed rows past `num_chunks`, e.g. ones whose vectors never reached the index."""
+        if num_chunks >= len(self):
+            return
+        if self.read_only:
+            for column in (self.text_offsets, self.extra_offsets, self.doc_rows, self.chunk_indexes):
+                column.truncate(num_chunks)
+            return
+        self.flush()
+        text_bytes = int(self.text_offsets.take([num_chunks - 1])[0, 0]) if num_chunks else 0
+        extra_bytes = int(self.extra_offsets.take([num_chunks - 1])[0, 0]) if num_chunks else 0
+        self._write_header(num_chunks, text_bytes, extra_bytes)
+        self._recover()
+
+    def clear(self):
+        """Removes every chunk and document."""
+        for store in (self.texts, self.extras, self.text_offsets, self.extra_offsets, self.doc_rows, self.chunk_indexes):
+            store.clear()
+        self.documents_path.unlink(missing_ok=True)
+        self.header_path.unlink(missing_ok=True)
+        self._documents = []
+        self._documents_by_origin = None
+        self._documents_bytes = None
+        self._pending_documents = []
@@ -0,0 +1,165 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from config import settings
+from .faiss_store import FaissVectorStore
+from .sharded_store import ShardedVectorStore
+from .store_factory import VectorStoreFactory
+
+logger = logging.getLogger(__name__)
+
+VectorStore = Union[FaissVectorStore, ShardedVectorStore]
+
+COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+class CollectionManager:
+    """
+    Named collections, each with its own vector store, loaded on first use.
+
+    The default collection keeps the original layout (data/vector_store.faiss or data/shards);
+    every other collection lives under data/collections/<name>/. Loaded collections are kept
+    in least-recently-used order and, once their indexes take more than the memory budget,
+    the coldest ones are saved and dropped until the next request loads them again. A
+    collection in use (see use()) is never evicted, so no store is ever open twice.
+    """
+
+    def __init__(self, root: str = "./data", memory_budget_mb: Optional[int] = None,
+                 store_type: Optional[str] = None, **store_kwargs: Any):
+        self.root = Path(root)
+        self.memory_budget = (settings.VECTOR_STORE_MEMORY_BUDGET_MB if memory_budget_mb is None
+                              else memory_budget_mb) * 1024 * 1024
+        self.store_type = (store_type or settings.VECTOR_STORE_TYPE).lower()
+        self.store_kwargs = store_kwargs
+        self._stores: "OrderedDict[str, VectorStore]" = OrderedDict()
+        # Collections currently handed out by use(), with how many callers hold each.
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        # One lock per collection, so loading a large collection does not hold up the others.
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def resolve(name: Optional[str]) -> str:
+        """Returns the collection name to use, validating it; None means DEFAULT_COLLECTION."""
+        name = name or settings.DEFAULT_COLLECTION
+        if not COLLECTION_NAME.match(name):
+            raise ValueError(f"Invalid collection name '{name}': use letters, digits, '_' and '-' (at most 64).")
+        return name
+
+    def _directory(self, name: str) -> Path:
+        return self.root if name == settings.DEFAULT_COLLECTION else self.root / "collections" / name
+
+    def _create(self, name: str) -> VectorStore:
+        directory = self._directory(name)
+        if self.store_type == "sharded":
+            return VectorStoreFactory.create_store(self.store_type, directory=str(directory / "shards"), **self.store_kwargs)
+        return VectorStoreFactory.create_store(
+            self.store_type,
+            index_path=str(directory / "vector_store.faiss"),
+            metadata_path=str(directory / "metadata.pkl"),
+            **self.store_kwargs,
+        )
+
+    def get(self, name: Optional[str] = None) -> VectorStore:
+        """
+        Returns a collection's store, loading it if needed.
+
+        The store may be evicted as soon as this returns; callers that write to it or hold
+        on to it should use use() instead.
+        """
+        with self.use(name) as store:
+            return store
+
+    @contextmanager
+    def use(self, name: Optional[str] = None) -> Iterator[VectorStore]:
+        """
+        Pins a collection's store for the duration of the block, loading it if needed.
+
+        Args:
+            name: Collection name; None means DEFAULT_COLLECTION
+
+        Yields:
+            The collection's vector store
+        """
+        name = self.resolve(name)
+        with self._lock:
+            self._pins[name] = self._pins.get(name, 0) + 1
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        try:
+            store = self._stores.get(name)
+            if store is None:
+                with load_lock:
+                    store = self._stores.get(name)
+                    if store is None:
+                        store = self._create(name)
+                        logger.info("Loaded collection '%s' (%d vectors)", name, store.ntotal)
+            with self._lock:
+                self._stores[name] = store
+                self._stores.move_to_end(name)
+            self._evict()
+            yield store
+        finally:
+            with self._lock:
+                self._pins[name] -= 1
+                if not self._pins[name]:
+                    del self._pins[name]
+            self._evict()
+
+    def _evict(self):
+        """Saves and drops the least recently used unpinned collections until the budget holds."""
+        evicted = []
+        with self._lock:
+            sizes = {name: store.memory_stats()["index_bytes"] for name, store in self._stores.items()}
+            total = sum(sizes.values())
+            for name in list(self._stores):
+                if total <= self.memory_budget:
+                    break
+                # Held until the store is saved, so a new use() cannot reopen the files before then.
+                load_lock = self._load_locks[name]
+                if name in self._pins or not load_lock.acquire(blocking=False):
+                    continue
+                evicted.append((name, self._stores.pop(name), load_lock))
+                total -= sizes[name]
+        for name, store, load_lock in evicted:
+            try:
+                # Nobody holds the store any more, so nothing can write to it after this save.
+                if not store.read_only:
+                    store.save()
+                store.close()
+                logger.info("Evicted collection '%s' (%d bytes)", name, sizes[name])
+            finally:
+                load_lock.release()
+
+    def names(self) -> List[str]:
+        """Every collection on disk or loaded, default first."""
+        on_disk = set()
+        if (self.root / "collections").is_dir():
+            on_disk = {path.name for path in (self.root / "collections").iterdir() if path.is_dir()}
+        with self._lock:
+            loaded = set(self._stores)
+        others = sorted((on_disk | loaded) - {settings.DEFAULT_COLLECTION})
+        return [settings.DEFAULT_COLLECTION] + others
+
+    def stats(self) -> Dict[str, Any]:
+        """Reports which collections are resident and how much of the memory budget they take."""
+        with self._lock:
+            resident = {name: store.memory_stats()["index_bytes"] for name, store in self._stores.items()}
+        return {
+            "memory_budget_bytes": self.memory_budget,
+            "resident_bytes": sum(resident.values()),
+            # Least recently used first.
+            "resident": resident,
+        }
+
+    def close(self):
+        """Saves and closes every loaded collection."""
+        with self._lock:
+            stores, self._stores = list(self._stores.values()), OrderedDict()
+        for store in stores:
+            if not store.read_only:
+                store.save()
+            store.close()
@@ -0,0 +1,171 @@
+import mmap
+import numpy as np
+from pathlib import Path
+from typing import Any, Optional, Tuple
+
+class ColumnFile:
+    """
+    An append-only, fixed-width column of numbers stored as a raw binary file.
+
+    Rows that have been flushed are read through a read-only memory map, so opening a
+    column costs nothing and only the rows actually touched are paged in. Appended rows
+    are buffered in memory until flush(). A read_only column never modifies its file.
+
+    One writer may append and flush while other threads read: the row counts and pending
+    buffers are swapped as one tuple, so a reader always sees a consistent set of rows.
+    """
+
+    def __init__(self, path: Path, dtype: str, width: int = 1, read_only: bool = False):
+        self.path = Path(path)
+        self.dtype = np.dtype(dtype)
+        self.width = width
+        self.read_only = read_only
+        self._mmap: Optional[np.memmap] = None
+        # (flushed rows, pending arrays, pending rows); replaced, never mutated.
+        self._state: Tuple[int, Tuple[np.ndarray, ...], int] = (self._rows_on_disk(), (), 0)
+
+    def _rows_on_disk(self) -> int:
+        if not self.path.exists():
+            return 0
+        return self.path.stat().st_size // (self.dtype.itemsize * self.width)
+
+    def _mapped(self, flushed: int) -> np.ndarray:
+        """Returns the first `flushed` rows as a memory map, remapping after the file has grown."""
+        if flushed == 0:
+            return np.empty((0, self.width), dtype=self.dtype)
+        mapped = self._mmap
+        if mapped is None or mapped.shape[0] < flushed:
+            mapped = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(flushed, self.width))
+            self._mmap = mapped
+        return mapped[:flushed]
+
+    def __len__(self) -> int:
+        flushed, _, pending_rows = self._state
+        return flushed + pending_rows
+
+    def append(self, values: np.ndarray):
+        """Buffers rows for the next flush()."""
+        if self.read_only:
+            raise RuntimeError(f"{self.path} is open read-only.")
+        values = np.ascontiguousarray(values, dtype=self.dtype).reshape(-1, self.width)
+        flushed, pending, pending_rows = self._state
+        self._state = (flushed, pending + (values,), pending_rows + values.shape[0])
+
+    def flush(self):
+        """Appends the buffered rows to the file; existing bytes are never rewritten."""
+        flushed, pending, pending_rows = self._state
+        if not pending:
+            return
+        with self.path.open("ab") as f:
+            for values in pending:
+                f.write(values.tobytes())
+        self._state = (flushed + pending_rows, (), 0)
+
+    def take(self, rows: np.ndarray) -> np.ndarray:
+        """Gathers the given row numbers into a new (len(rows), width) array."""
+        rows = np.asarray(rows, dtype=np.int64)
+        flushed, pending, _ = self._state
+        if not pending or (rows.size and rows.max() < flushed):
+            return np.asarray(self._mapped(flushed)[rows])
+        return np.concatenate([self._mapped(flushed), *pending])[rows]
+
+    def searchsorted(self, value: Any, side: str = "left") -> int:
+        """Binary search over a sorted single-width column, touching only O(log n) pages."""
+        flushed, pending, _ = self._state
+        position = int(np.searchsorted(self._mapped(flushed)[:, 0], value, side=side)) if flushed else 0
+        if position < flushed or not pending:
+            return position
+        return flushed + int(np.searchsorted(np.concatenate(pending)[:, 0], value, side=side))
+
+    def read_all(self) -> np.ndarray:
+        """Returns every row, flushed and pending, as one array."""
+        flushed, pending, _ = self._state
+        return np.concatenate([self._mapped(flushed), *pending]) if pending else np.asarray(self._mapped(flushed))
+
+    def truncate(self, rows: int):
+        """Drops flushed rows past `rows`, e.g. ones written by an interrupted save."""
+        flushed, pending, pending_rows = self._state
+        if rows < flushed:
+            self._mmap = None
+            # Read-only columns just stop short of the extra rows.
+            if not self.read_only:
+                with self.path.open("r+b") as f:
+                    f.truncate(rows * self.dtype.itemsize * self.width)
+            self._state = (rows, pending, pending_rows)
+
+    def clear(self):
+        """Removes every row and deletes the file."""
+        self._mmap = None
+        self._state = (0, (), 0)
+        self.path.unlink(missing_ok=True)
+
+
+class BlobFile:
+    """
+    An append-only byte blob addressed by offsets, e.g. concatenated UTF-8 chunk texts.
+
+    Flushed bytes are read through a read-only memory map; appended bytes are buffered
+    in memory until flush(). A read_only blob never modifies its file. Like ColumnFile,
+    it may be read by other threads while one writer appends.
+    """
+
+    def __init__(self, path: Path, read_only: bool = False):
+        self.path = Path(path)
+        self.read_only = read_only
+        self._mmap: Optional[mmap.mmap] = None
+        # (flushed size, pending bytes); the buffer only grows until flush() swaps in a new one.
+        self._state: Tuple[int, bytearray] = (self.path.stat().st_size if self.path.exists() else 0, bytearray())
+
+    def _mapped(self, flushed: int) -> mmap.mmap:
+        mapped = self._mmap
+        if mapped is None or len(mapped) < flushed:
+            with self.path.open("rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._mmap = mapped
+        return mapped
+
+    def __len__(self) -> int:
+        flushed, pending = self._state
+        return flushed + len(pending)
+
+    def append(self, data: bytes) -> int:
+        """Buffers bytes for the next flush() and returns the new end offset."""
+        if self.read_only:
+            raise RuntimeError(f"{self.path} is open read-only.")
+        flushed, pending = self._state
+        pending += data
+        return flushed + len(pending)
+
+    def read(self, start: int, end: int) -> bytes:
+        """Returns the bytes in [start, end)."""
+        flushed, pending = self._state
+        if end <= flushed:
+            return self._mapped(flushed)[start:end] if end > start else b""
+        if start >= flushed:
+            return bytes(pending[start - flushed:end - flushed])
+        return self._mapped(flushed)[start:flushed] + bytes(pending[:end - flushed])
+
+    def flush(self):
+        """Appends the buffered bytes to the file."""
+        flushed, pending = self._state
+        if not pending:
+            return
+        with self.path.open("ab") as f:
+            f.write(pending)
+        self._state = (flushed + len(pending), bytearray())
+
+    def truncate(self, size: int):
+        """Drops flushed bytes past `size`."""
+        flushed, pending = self._state
+        if size < flushed:
+            self._mmap = None
+            if not self.read_only:
+                with self.path.open("r+b") as f:
+                    f.truncate(size)
+            self._state = (size, pending)
+
+    def clear(self):
+        """Removes every byte and deletes the file."""
+        self._mmap = None
+        self._state = (0, bytearray())
+        self.path.unlink(missing_ok=True)
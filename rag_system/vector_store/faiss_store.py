@@ -1,67 +1,1008 @@
 import faiss
+import json
+import logging
 import numpy as np
 import pickle
+import threading
+from dataclasses import replace
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Tuple, Optional
+
+from config import settings
+from .chunk_store import ChunkStore
+from .columns import ColumnFile
+from .index_factory import FaissIndexFactory, COMPRESSED_INDEX_TYPES, SIMILARITY_METRICS
+from .metadata_index import MetadataIndex
+from .reduction import VectorReducer, training_sample
+from .segments import Segment, SegmentManifest
+from .snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
 
 class FaissVectorStore:
-    """A vector store that uses FAISS for indexing and a separate file for metadata."""
+    """
+    A vector store that uses FAISS for indexing and a memory-mapped chunk store for texts and metadata.
+
+    Vectors live in a base index plus small append-only delta segments. Each add() becomes a new
+    delta segment, so save() only writes what is new; a compactor folds the deltas back into the
+    base in the background. The segment manifest is the commit point that load() replays.
+
+    Every chunk has a stable 64-bit id, its row in the chunk store. Deletes are tombstones that
+    searches skip until compaction physically removes the vectors. Chunks can also be added
+    hidden, so a new version of a document is swapped in all at once by reveal().
 
-    def __init__(self, index_path: str = "./data/vector_store.faiss", metadata_path: str = "./data/metadata.pkl"):
+    Searches run against an immutable Snapshot and never take the lock. Writers (add, delete,
+    save, compaction) are serialized by the lock and publish a new snapshot atomically once
+    everything it references has been written, so readers never see a half-applied update.
+
+    An optional reduction stage (PCA or Matryoshka truncation, see VectorReducer) maps
+    embeddings and queries alike to fewer dimensions. Until a PCA store holds
+    VECTOR_REDUCTION_TRAINING_SIZE chunks it keeps their full vectors in a flat index; the
+    projection is then fitted on a sample of them, persisted with the index, and the index is
+    rebuilt in the reduced space.
+    """
+
+    def __init__(self, index_path: str = "./data/vector_store.faiss", metadata_path: str = "./data/metadata.pkl",
+                 index_type: Optional[str] = None, index_config: Optional[Dict[str, Any]] = None,
+                 read_only: Optional[bool] = None, prewarm: Optional[bool] = None,
+                 reducer: Optional[VectorReducer] = None):
         self.index_path = Path(index_path)
         self.metadata_path = Path(metadata_path)
-        self.index: faiss.Index | None = None
-        self.metadata: Dict[int, Dict[str, Any]] = {}
+        self.config_path = self.index_path.with_suffix(".json")
+        self.vectors_path = self.index_path.with_suffix(".vectors")
+        self.chunks_path = self.index_path.with_suffix(".chunks")
+        self.segments_path = self.index_path.with_suffix(".segments")
+        self.reduction_path = self.index_path.with_suffix(".reduction")
+        self.manifest = SegmentManifest(self.segments_path)
+        # The current searchable state: base index, delta segments, tombstones and chunk count.
+        self._snapshot = Snapshot()
+        self._tombstone_selector: Tuple[Optional[np.ndarray], Optional[np.ndarray], Optional[faiss.IDSelector]] = (
+            None, None, None)
+        # Append-only log of every deleted id, and its sorted in-memory copy.
+        self.deleted_log: ColumnFile | None = None
+        self._deleted: Optional[np.ndarray] = None
+        # Chunk rows covered by the last committed manifest.
+        self._committed_next_id = 0
+        # Inverted index for filtered search; built from the chunk store on first use.
+        self._metadata_index: Optional[MetadataIndex] = None
+        self.generation = 0
+        self._base_file: Optional[str] = None
+        self._base_dirty = False
+        # Serializes writers; readers only ever read self._snapshot.
+        self._lock = threading.RLock()
+        self._compaction: Optional[threading.Thread] = None
+        self._files_in_progress: set = set()
+        # Full-precision copy of the vectors for compressed indexes, kept on disk and memory-mapped.
+        self.vectors: ColumnFile | None = None
+        self.chunks: ChunkStore | None = None
+        # Dimensionality reduction applied to every vector before it reaches FAISS; a sharded
+        # store passes one reducer to all of its shards, and trains it itself.
+        self._shared_reducer = reducer
+        self.reducer = reducer or VectorReducer()
+
+        # Read-only serving mode memory-maps the index so worker processes share the OS page cache.
+        self.read_only = settings.VECTOR_STORE_READ_ONLY if read_only is None else read_only
+
+        # Index type and tuning knobs; persisted values take precedence once an index exists on disk.
+        self.index_type = (index_type or settings.FAISS_INDEX_TYPE).lower()
+        self.index_config: Dict[str, Any] = {
+            "nlist": settings.FAISS_NLIST,
+            "nprobe": settings.FAISS_NPROBE,
+            "hnsw_m": settings.FAISS_HNSW_M,
+            "ef_construction": settings.FAISS_EF_CONSTRUCTION,
+            "ef_search": settings.FAISS_EF_SEARCH,
+            "pq_m": settings.FAISS_PQ_M,
+            "pq_nbits": settings.FAISS_PQ_NBITS,
+            "rescore": settings.FAISS_RESCORE,
+            "rescore_factor": settings.FAISS_RESCORE_FACTOR,
+            "metric": settings.FAISS_METRIC,
+            "reduction": settings.VECTOR_REDUCTION,
+            "reduced_dimension": settings.VECTOR_REDUCED_DIMENSION,
+            **(index_config or {}),
+        }
 
         # Ensure the data directory exists
         self.index_path.parent.mkdir(parents=True, exist_ok=True)
         self.load()
+        if settings.VECTOR_STORE_PREWARM if prewarm is None else prewarm:
+            self.prewarm()
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError(f"Vector store at {self.index_path} is open read-only.")
+
+    def _create_index(self, dimension: int, training_vectors: Optional[np.ndarray] = None) -> faiss.Index:
+        """Creates an index of the configured type, training it on the given vectors if required."""
+        index_type = self._index_type_for(dimension)
+        config = dict(self.index_config)
+        if index_type in ("ivf_flat", "ivf_pq"):
+            if training_vectors is None or training_vectors.shape[0] == 0:
+                raise ValueError("IVF indexes need training vectors.")
+            # The configured sizes are kept as targets; a small sample just gets a coarser index for now.
+            config["nlist"] = FaissIndexFactory.effective_nlist(config["nlist"], training_vectors.shape[0])
+            config["pq_nbits"] = FaissIndexFactory.effective_pq_nbits(config["pq_nbits"], training_vectors.shape[0])
+
+        index = FaissIndexFactory.create_index(index_type, dimension, config)
+        if not index.is_trained:
+            index.train(training_vectors)
+        FaissIndexFactory.apply_search_params(index, config.get("nprobe"), config.get("ef_search"))
+        return index
+
+    def _index_type_for(self, dimension: int) -> str:
+        """The configured index type, or flat for full vectors held until a PCA reduction is trained."""
+        if self.reducer.enabled and dimension != self.reducer.dimension:
+            return "flat"
+        return self.index_type
+
+    def snapshot(self) -> Snapshot:
+        """Returns the current immutable state. Holding it pins that generation for as long as needed."""
+        return self._snapshot
+
+    def _publish(self, **changes: Any):
+        """Makes a new snapshot visible to readers. Callers hold the writer lock."""
+        self._snapshot = replace(self._snapshot, version=self._snapshot.version + 1, **changes)
 
-    def add(self, chunks: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]]):
-        """Adds chunks, their embeddings, and metadata to the store."""
-        if self.index is None:
-            dimension = embeddings.shape[1]
-            # Using IndexFlatL2 for simplicity, good for exact search.
-            self.index = faiss.IndexFlatL2(dimension)
+    @property
+    def index(self) -> Optional[faiss.Index]:
+        """The base index of the current snapshot."""
+        return self._snapshot.base
 
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        """The delta segments of the current snapshot, in id order."""
+        return self._snapshot.segments
+
+    @property
+    def tombstones(self) -> np.ndarray:
+        """Sorted ids deleted but still present in the base or a segment."""
+        return self._snapshot.tombstones
+
+    @property
+    def ntotal(self) -> int:
+        """Number of live vectors across the base index and every delta segment."""
+        return self._snapshot.ntotal
+
+    @property
+    def next_id(self) -> int:
+        """The id the next added chunk will get. Chunk ids are chunk-store rows and are never reused."""
+        return self._snapshot.next_id
+
+    @property
+    def metadata_index(self) -> MetadataIndex:
+        """The inverted metadata index, built on first use and kept current by add()."""
+        metadata_index = self._metadata_index
+        if metadata_index is not None:
+            return metadata_index
+        with self._lock:
+            if self._metadata_index is None:
+                self._metadata_index = MetadataIndex.from_chunk_store(self.chunks)
+            return self._metadata_index
+
+    def _selector(self, snapshot: Snapshot, filters: Optional[Dict[str, Any]] = None) -> Optional[faiss.IDSelector]:
+        """An id selector that skips tombstoned and hidden chunks and, if given, the chunks not matching the filters."""
+        tombstones, hidden = snapshot.tombstones, snapshot.hidden
+        if filters:
+            mask = self.metadata_index.select(filters, snapshot.next_id)
+            mask[tombstones[tombstones < mask.size]] = False
+            mask[hidden[hidden < mask.size]] = False
+            bitmap = np.packbits(mask, bitorder="little")
+            selector = faiss.IDSelectorBitmap(bitmap.size, faiss.swig_ptr(bitmap))
+            selector.referenced_objects = [bitmap]
+            return selector
+        if tombstones.size == 0 and hidden.size == 0:
+            return None
+        cached_tombstones, cached_hidden, selector = self._tombstone_selector
+        if cached_tombstones is not tombstones or cached_hidden is not hidden:
+            batch = faiss.IDSelectorBatch(np.union1d(tombstones, hidden))
+            selector = faiss.IDSelectorNot(batch)
+            # The negation only holds a pointer; keep the batch selector alive alongside it.
+            selector.referenced_objects = [batch]
+            self._tombstone_selector = (tombstones, hidden, selector)
+        return selector
+
+    def _deleted_ids(self) -> np.ndarray:
+        """Every id ever deleted, sorted. Loaded from the deletion log on first use."""
+        if self._deleted is None:
+            deleted = self.deleted_log.read_all()[:, 0] if self.deleted_log is not None else np.empty(0)
+            self._deleted = np.unique(deleted[deleted < self.next_id]).astype('int64')
+        return self._deleted
+
+    def _live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the ids and vectors of every live chunk in id order, at full precision when the index is lossy."""
+        snapshot = self._snapshot
+        base, segments, tombstones = snapshot.base, snapshot.segments, snapshot.tombstones
+        contents = [FaissIndexFactory.contents(base)] + [FaissIndexFactory.contents(s.index) for s in segments]
+        ids = np.concatenate([c[0] for c in contents])
+        live = ~np.isin(ids, tombstones)
+        ids = ids[live]
+        if self.vectors is not None and len(self.vectors) >= snapshot.next_id:
+            return ids, self.vectors.take(ids)
+        return ids, np.concatenate([c[1] for c in contents])[live]
+
+    def add(self, chunks: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+            hidden: bool = False) -> np.ndarray:
+        """
+        Adds chunks, their embeddings, and metadata to the store.
+
+        Args:
+            chunks, embeddings, metadatas: The new chunks
+            hidden: Keep the chunks out of searches until reveal() is called with their ids
+
+        Returns:
+            The stable ids assigned to the new chunks
+        """
+        self._check_writable()
         if embeddings.shape[0] != len(chunks) or len(chunks) != len(metadatas):
             raise ValueError("The number of chunks, embeddings, and metadatas must be the same.")
 
-        start_index = self.index.ntotal
-        self.index.add(embeddings.astype('float32'))
-
-        for i, (chunk, metadata) in enumerate(zip(chunks, metadatas)):
-            doc_id = start_index + i
-            self.metadata[doc_id] = {
-                "chunk_text": chunk,
-                **metadata,
-            }
-
-    def search(self, query_embedding: np.ndarray, k: int = 5) -> List[Tuple[Dict[str, Any], float]]:
-        """Searches the vector store for the most similar chunks."""
-        if self.index is None or self.index.ntotal == 0:
-            return []
-
-        distances, indices = self.index.search(query_embedding.astype('float32'), k)
-        
-        results = []
-        for i, doc_id in enumerate(indices[0]):
-            if doc_id != -1: # FAISS returns -1 for no result
-                score = distances[0][i]
-                results.append((self.metadata[doc_id], score))
-        return results
+        with self._lock:
+            embeddings = self._prepare(embeddings)
+            ids = np.arange(self.next_id, self.next_id + len(chunks), dtype='int64')
+            if self.index is None:
+                # The first batch becomes the base index and doubles as the IVF training sample.
+                base = FaissIndexFactory.with_ids(self._create_index(embeddings.shape[1], embeddings))
+                base.add_with_ids(embeddings, ids)
+                changes = {"base": base}
+                self._base_dirty = True
+                if self._index_type_for(embeddings.shape[1]) in COMPRESSED_INDEX_TYPES:
+                    self.vectors = ColumnFile(self.vectors_path, "float32", width=embeddings.shape[1])
+                    self.vectors.clear()
+            else:
+                # Later batches go to a new exact delta segment; the base is left untouched.
+                delta = FaissIndexFactory.create_delta(embeddings.shape[1], self.index_config)
+                delta.add_with_ids(embeddings, ids)
+                changes = {"segments": self.segments + (Segment(delta, int(ids[0])),)}
+            if hidden:
+                changes["hidden"] = np.union1d(self._snapshot.hidden, ids)
+
+            if self.vectors is not None:
+                self.vectors.append(embeddings)
+            # The new chunk-store rows are exactly the ids given to FAISS.
+            self.chunks.append(chunks, metadatas)
+            if self._metadata_index is not None:
+                self._metadata_index.add(ids, metadatas)
+            # Published last, so a reader that finds the new ids also finds their rows.
+            self._publish(next_id=len(self.chunks), **changes)
+            if self._reduction_due():
+                self._reduce_index()
+        return ids
+
+    def delete(self, ids: np.ndarray) -> int:
+        """
+        Deletes chunks by id.
+
+        Deleted chunks are tombstoned: searches skip them right away and compaction later
+        removes their vectors from the index files.
+
+        Args:
+            ids: Chunk ids; unknown and already deleted ids are ignored
+
+        Returns:
+            Number of chunks deleted
+        """
+        self._check_writable()
+        with self._lock:
+            ids = self._log_deletes(ids)
+            if ids.size == 0:
+                return 0
+            self._publish(tombstones=np.union1d(self.tombstones, ids),
+                          hidden=np.setdiff1d(self._snapshot.hidden, ids, assume_unique=True))
+        return int(ids.size)
+
+    def _log_deletes(self, ids: np.ndarray) -> np.ndarray:
+        """Records the deletion of ids and returns the ones that were live. Callers hold the writer lock."""
+        ids = np.unique(np.asarray(ids, dtype='int64'))
+        ids = ids[(ids >= 0) & (ids < self.next_id)]
+        ids = ids[~np.isin(ids, self._deleted_ids())]
+        if ids.size:
+            self.deleted_log.append(ids)
+            self._deleted = np.union1d(self._deleted, ids)
+        return ids
+
+    def reveal(self, ids: np.ndarray, replaced: Optional[np.ndarray] = None) -> int:
+        """
+        Makes chunks added hidden searchable, deleting the chunks they replace in the same step.
+
+        Searches see either the replaced chunks or the revealed ones, never both or neither.
+
+        Args:
+            ids: Ids returned by add(hidden=True)
+            replaced: Chunk ids to delete, e.g. the earlier version of the document
+
+        Returns:
+            Number of chunks deleted
+        """
+        self._check_writable()
+        with self._lock:
+            deleted = self._log_deletes(replaced if replaced is not None else np.empty(0, dtype='int64'))
+            hidden = np.setdiff1d(self._snapshot.hidden, np.asarray(ids, dtype='int64'))
+            self._publish(tombstones=np.union1d(self.tombstones, deleted),
+                          hidden=np.setdiff1d(hidden, deleted, assume_unique=True))
+        return int(deleted.size)
+
+    def upsert(self, ids: np.ndarray, chunks: List[str], embeddings: np.ndarray,
+               metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Replaces chunks: deletes `ids` and adds the new chunks in one step.
+
+        Searches never see both the old and the new chunks, or neither. Ids are never reused,
+        so the replacements get fresh ids.
+
+        Returns:
+            The ids assigned to the new chunks
+        """
+        if embeddings.shape[0] != len(chunks) or len(chunks) != len(metadatas):
+            raise ValueError("The number of chunks, embeddings, and metadatas must be the same.")
+        with self._lock:
+            self.delete(ids)
+            return self.add(chunks, embeddings, metadatas)
+
+    def live_ids(self) -> np.ndarray:
+        """Returns the ids of every live chunk, sorted."""
+        with self._lock:
+            ids = np.arange(self.next_id, dtype='int64')
+            return ids[~np.isin(ids, self._deleted_ids())]
+
+    def document_ids(self, file_origin: str) -> np.ndarray:
+        """Returns the ids of the live chunks ingested from file_origin."""
+        with self._lock:
+            rows = self.chunks.document_rows(file_origin)
+            return rows[~np.isin(rows, self._deleted_ids())]
+
+    def replace_document(self, file_origin: str, chunks: List[str], embeddings: np.ndarray,
+                         metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Replaces every chunk of a document with a new version of it.
+
+        Only that document's chunks are touched, so re-ingesting a changed file costs the
+        size of the file rather than a full re-index.
+
+        Args:
+            file_origin: The document's file_origin metadata value
+            chunks, embeddings, metadatas: The new version, as for add()
+
+        Returns:
+            The ids assigned to the new chunks
+        """
+        with self._lock:
+            return self.upsert(self.document_ids(file_origin), chunks, embeddings, metadatas)
+
+    def delete_document(self, file_origin: str) -> int:
+        """Deletes every chunk ingested from file_origin and returns how many were deleted."""
+        with self._lock:
+            return self.delete(self.document_ids(file_origin))
+
+    def rebuild(self, index_type: Optional[str] = None):
+        """
+        Rebuilds the index from the vectors already stored, optionally switching index type.
+
+        This is the bootstrap path for IVF: the existing vectors are used as the training sample.
+        Every delta segment is folded into the new base and deleted chunks are dropped.
+        """
+        self._check_writable()
+        with self._lock:
+            if index_type:
+                self.index_type = index_type.lower()
+            if self.index is None:
+                return
+
+            ids, vectors = self._live_vectors()
+            if ids.size == 0:
+                return
+            base = FaissIndexFactory.with_ids(self._create_index(vectors.shape[1], vectors))
+            base.add_with_ids(vectors, ids)
+            self._base_dirty = True
+            if self._index_type_for(vectors.shape[1]) in COMPRESSED_INDEX_TYPES:
+                if self.vectors is None:
+                    # The full-precision copy is addressed by id; deleted rows are left as zeros.
+                    full = np.zeros((self.next_id, vectors.shape[1]), dtype='float32')
+                    full[ids] = vectors
+                    self.vectors = ColumnFile(self.vectors_path, "float32", width=vectors.shape[1])
+                    self.vectors.clear()
+                    self.vectors.append(full)
+            # Before the old full-precision copy goes away, so no reader rescores against a missing copy.
+            self._publish(base=base, segments=(), tombstones=np.empty(0, dtype='int64'))
+            if self._index_type_for(vectors.shape[1]) not in COMPRESSED_INDEX_TYPES and self.vectors is not None:
+                # Lossless indexes reconstruct exactly, so the extra copy is no longer needed.
+                vectors, self.vectors = self.vectors, None
+                vectors.clear()
+
+    def _reduction_due(self) -> bool:
+        """Whether this store holds full vectors and can move them into the trained, or trainable, PCA space."""
+        if self.reducer.method != 'pca' or self._shared_reducer is not None or self._reduces(self._snapshot):
+            return False
+        return self.reducer.is_trained or self.ntotal >= max(settings.VECTOR_REDUCTION_TRAINING_SIZE,
+                                                             self.reducer.dimension)
+
+    def _reduce_index(self):
+        """
+        Moves a store that holds full vectors into the reduced space.
+
+        The PCA projection, unless already trained, is fitted on a sample of every live vector,
+        and the index is rebuilt from the projected vectors in the configured index type.
+        """
+        self._check_writable()
+        with self._lock:
+            if self._reduces(self._snapshot):
+                return
+            ids, vectors = self._live_vectors()
+            if ids.size == 0:
+                return
+            if not self.reducer.is_trained:
+                self.reducer.train(training_sample(vectors, settings.VECTOR_REDUCTION_TRAINING_SIZE))
+            reduced = self._normalized(self.reducer.apply(vectors))
+            base = FaissIndexFactory.with_ids(self._create_index(reduced.shape[1], reduced))
+            base.add_with_ids(reduced, ids)
+            self._base_dirty = True
+            self._publish(base=base, segments=(), tombstones=np.empty(0, dtype='int64'))
+            if self.index_type in COMPRESSED_INDEX_TYPES:
+                # Only after the publish, so no reader rescores full-dimensional candidates against it.
+                full = np.zeros((self.next_id, reduced.shape[1]), dtype='float32')
+                full[ids] = reduced
+                vectors = ColumnFile(self.vectors_path, "float32", width=reduced.shape[1])
+                vectors.clear()
+                vectors.append(full)
+                self.vectors = vectors
+            logger.info("Reduced %d vectors at %s to %d dimensions", ids.size, self.index_path, reduced.shape[1])
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Updates the default search-time tuning knobs; they are persisted on the next save()."""
+        if nprobe is not None:
+            self.index_config["nprobe"] = nprobe
+        if ef_search is not None:
+            self.index_config["ef_search"] = ef_search
+        if self.index is not None:
+            FaissIndexFactory.apply_search_params(self.index, nprobe, ef_search)
+
+    def _can_rescore(self, snapshot: Optional[Snapshot] = None) -> bool:
+        vectors, snapshot = self.vectors, snapshot or self._snapshot
+        # A snapshot from before the PCA reduction holds full vectors and cannot use the reduced copy.
+        return (self.index_config.get("rescore", False) and vectors is not None
+                and len(vectors) >= snapshot.next_id
+                and snapshot.base is not None and vectors.width == snapshot.base.d)
+
+    @property
+    def higher_is_better(self) -> bool:
+        """True when scores are similarities (ip, cosine) rather than L2 distances."""
+        return self.index_config.get("metric", "l2") in SIMILARITY_METRICS
+
+    def _normalized(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Returns vectors as a C-contiguous float32 matrix, normalized for the cosine metric.
+
+        Provider output already has that layout and is used as is; it is only copied to be
+        normalized, since the caller's array may be shared, e.g. by the query cache.
+        """
+        prepared = np.ascontiguousarray(np.atleast_2d(vectors), dtype='float32')
+        if self.index_config.get("metric") == "cosine":
+            if np.may_share_memory(prepared, vectors):
+                prepared = prepared.copy()
+            faiss.normalize_L2(prepared)
+        return prepared
+
+    def _reduces(self, snapshot: Snapshot) -> bool:
+        """Whether the snapshot's index holds reduced vectors; a PCA store holds full ones until it is trained."""
+        if not self.reducer.enabled:
+            return False
+        if snapshot.base is not None:
+            return snapshot.base.d == self.reducer.dimension
+        return self.reducer.is_trained
+
+    def _prepare(self, vectors: np.ndarray, snapshot: Optional[Snapshot] = None) -> np.ndarray:
+        """Converts embeddings or queries to the vectors the snapshot's index holds: normalized, then reduced if it is."""
+        vectors = self._normalized(vectors)
+        if not self._reduces(snapshot or self._snapshot):
+            return vectors
+        # A reduced unit vector is shorter than unit length, so cosine needs it normalized again.
+        return self._normalized(self.reducer.apply(vectors))
+
+    def _missing_score(self) -> float:
+        # Sorts after every real score.
+        return -np.inf if self.higher_is_better else np.inf
+
+    def _best_first(self, distances: np.ndarray, k: int) -> np.ndarray:
+        """Column order that sorts each row best-first and keeps k."""
+        keys = -distances if self.higher_is_better else distances
+        return np.argsort(keys, axis=1, kind="stable")[:, :k]
+
+    def _rescore(self, vectors: ColumnFile, queries: np.ndarray, candidates: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-ranks candidate ids by their exact score against the full-precision vectors."""
+        distances = np.full((queries.shape[0], k), self._missing_score(), dtype='float32')
+        indices = np.full((queries.shape[0], k), -1, dtype='int64')
+        for q, row in enumerate(candidates):
+            row = row[row != -1]
+            if row.size == 0:
+                continue
+            rows = vectors.take(row)
+            if self.higher_is_better:
+                exact = rows @ queries[q]
+                order = np.argsort(-exact)[:k]
+            else:
+                exact = ((rows - queries[q]) ** 2).sum(axis=1)
+                order = np.argsort(exact)[:k]
+            distances[q, :order.size] = exact[order]
+            indices[q, :order.size] = row[order]
+        return distances, indices
+
+    def _range_top_k(self, index: faiss.Index, queries: np.ndarray, radius: float, k: int,
+                     params: Optional[faiss.SearchParameters]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Runs a FAISS range search and keeps the best k results of each query.
+
+        Only vectors within the radius are ever collected, so a tight threshold visits few
+        results no matter how large k is.
+        """
+        lims, range_distances, range_indices = index.range_search(queries, radius, params=params)
+        distances = np.full((queries.shape[0], k), self._missing_score(), dtype='float32')
+        indices = np.full((queries.shape[0], k), -1, dtype='int64')
+        for q in range(queries.shape[0]):
+            row_distances = range_distances[lims[q]:lims[q + 1]]
+            order = np.argsort(-row_distances if self.higher_is_better else row_distances, kind="stable")[:k]
+            distances[q, :order.size] = row_distances[order]
+            indices[q, :order.size] = range_indices[lims[q]:lims[q + 1]][order]
+        return distances, indices
+
+    def _search_index(self, index: faiss.Index, queries: np.ndarray, k: int,
+                      params: Optional[faiss.SearchParameters],
+                      score_threshold: Optional[float]) -> Tuple[np.ndarray, np.ndarray]:
+        if score_threshold is None:
+            return index.search(queries, k, params=params)
+        return self._range_top_k(index, queries, score_threshold, k, params)
+
+    def _tightened(self, score_threshold: Optional[float], distances: np.ndarray) -> Optional[float]:
+        """
+        Narrows a threshold once every query already has k results better than it.
+
+        Later segments then only need to return results that beat the current k-th best.
+        """
+        if score_threshold is None or distances.size == 0:
+            return score_threshold
+        kth = distances[:, -1]
+        if self.higher_is_better:
+            return max(score_threshold, float(kth.min())) if np.isfinite(kth).all() else score_threshold
+        return min(score_threshold, float(kth.max())) if np.isfinite(kth).all() else score_threshold
+
+    def _search_ids(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None,
+                    score_threshold: Optional[float] = None,
+                    snapshot: Optional[Snapshot] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Searches the base and every delta segment and merges them into raw top-k distances and ids.
+
+        With a score_threshold the searches become FAISS range searches: an L2 distance below the
+        threshold, or an ip/cosine similarity above it. Queries must be prepared for `snapshot`,
+        the current one by default.
+        """
+        snapshot = snapshot or self._snapshot
+        base, segments = snapshot.base, snapshot.segments
+        selector = self._selector(snapshot, filters)
+        params = FaissIndexFactory.search_params(base, nprobe, ef_search, selector)
+        # Read once: rebuild() may drop the full-precision copy while this search runs.
+        vectors = self.vectors
+        if self._can_rescore(snapshot) and vectors is not None:
+            # Over-fetch from the compressed index, then re-rank the candidates exactly.
+            _, candidates = self._search_index(base, queries, k * self.index_config["rescore_factor"],
+                                               params, score_threshold)
+            distances, indices = self._rescore(vectors, queries, candidates, k)
+            if score_threshold is not None:
+                # The compressed scores were approximate; apply the threshold to the exact ones.
+                beyond = distances <= score_threshold if self.higher_is_better else distances >= score_threshold
+                distances[beyond], indices[beyond] = self._missing_score(), -1
+        else:
+            distances, indices = self._search_index(base, queries, k, params, score_threshold)
+        if not segments:
+            return distances, indices
+
+        all_distances, all_indices = [distances], [indices]
+        for segment in segments:
+            segment_params = FaissIndexFactory.search_params(segment.index, selector=selector)
+            segment_distances, segment_indices = self._search_index(
+                segment.index, queries, k, segment_params, self._tightened(score_threshold, distances)
+            )
+            all_distances.append(segment_distances)
+            all_indices.append(segment_indices)
+            distances, indices = np.hstack(all_distances), np.hstack(all_indices)
+            # Missing results carry the worst possible score, so they sort last.
+            order = self._best_first(distances, k)
+            distances, indices = np.take_along_axis(distances, order, axis=1), np.take_along_axis(indices, order, axis=1)
+            all_distances, all_indices = [distances], [indices]
+        return distances, indices
+
+    def search(self, query_embedding: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, filters: Optional[Dict[str, Any]] = None,
+               score_threshold: Optional[float] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """
+        Searches the vector store for the most similar chunks.
+
+        Args:
+            query_embedding: Query vector of shape (1, d)
+            k: Number of neighbours to return
+            nprobe: Per-request override for the number of IVF lists visited
+            ef_search: Per-request override for the HNSW candidate list size
+            filters: Metadata conditions applied inside the search (see MetadataIndex)
+            score_threshold: Maximum L2 distance, or minimum ip/cosine similarity, of a result
+
+        Returns:
+            List of (metadata, score) tuples, best first. Metadata includes the "chunk_id".
+        """
+        return self.search_batch(query_embedding.reshape(1, -1), k, nprobe, ef_search, filters, score_threshold)[0]
+
+    def search_batch(self, query_matrix: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, filters: Optional[Dict[str, Any]] = None,
+                     score_threshold: Optional[float] = None) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """
+        Searches for several queries in one FAISS call.
+
+        Args:
+            query_matrix: Query vectors of shape (n, d)
+            k: Number of neighbours to return per query
+            nprobe: Per-request override for the number of IVF lists visited
+            ef_search: Per-request override for the HNSW candidate list size
+            filters: Metadata conditions shared by every query (see MetadataIndex)
+            score_threshold: Maximum L2 distance, or minimum ip/cosine similarity, of a result
+
+        Returns:
+            One list of (metadata, score) tuples per query, best first
+        """
+        query_matrix = np.atleast_2d(query_matrix)
+        if self.ntotal == 0:
+            return [[] for _ in range(query_matrix.shape[0])]
+
+        # One snapshot for both, as the reduction may change the index's dimension meanwhile.
+        snapshot = self._snapshot
+        distances, indices = self._search_ids(self._prepare(query_matrix, snapshot), k, nprobe, ef_search, filters,
+                                              score_threshold, snapshot)
+
+        # Each chunk is materialized once, however many queries hit it.
+        found = indices != -1 # FAISS returns -1 for no result
+        ids = np.unique(indices[found])
+        positions = np.searchsorted(ids, indices)
+        metadatas = self.get_chunks(ids)
+
+        return [
+            [(metadatas[position], distance) for position, distance, hit in zip(row, row_distances, row_found) if hit]
+            for row, row_distances, row_found in zip(positions, distances, found)
+        ]
+
+    def get_chunks(self, ids: np.ndarray) -> List[Dict[str, Any]]:
+        """Returns the metadata (with "chunk_text" and "chunk_id") of the given chunk ids."""
+        ids = np.asarray(ids, dtype='int64')
+        return [{**metadata, "chunk_id": int(chunk_id)} for metadata, chunk_id in zip(self.chunks.get(ids), ids)]
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Reports how much memory the index takes, per vector and in total."""
+        snapshot = self._snapshot
+        base, segments, tombstones = snapshot.base, snapshot.segments, snapshot.tombstones
+        if base is None:
+            return {"index_type": self.index_type, "ntotal": 0, "bytes_per_vector": 0.0, "index_bytes": 0}
+        # Delta segments are exact flat indexes until they are compacted into the base.
+        index_bytes = (FaissIndexFactory.bytes_per_vector(base) * base.ntotal +
+                       sum(FaissIndexFactory.bytes_per_vector(segment.index) * segment.ntotal for segment in segments))
+        ntotal = snapshot.ntotal
+        return {
+            "index_type": self.index_type,
+            "ntotal": ntotal,
+            "segments": len(segments),
+            # Deleted vectors still taking space until the next compaction.
+            "tombstones": int(tombstones.size),
+            "bytes_per_vector": index_bytes / max(1, ntotal),
+            "index_bytes": int(index_bytes),
+            # Raw float32 size, for reading off the compression ratio.
+            "uncompressed_bytes_per_vector": base.d * 4,
+            "reduction": self.reducer.method,
+            "dimension": base.d,
+            "rescore": self._can_rescore(snapshot),
+        }
+
+    def recall_at_k(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None) -> float:
+        """
+        Measures the recall of the index against exact brute-force search.
+
+        Args:
+            queries: Sample query vectors of shape (n, d)
+            k: Number of neighbours compared per query
+            nprobe: Optional IVF override, as for search()
+            ef_search: Optional HNSW override, as for search()
+
+        Returns:
+            Fraction of the exact top-k neighbours that search() also returns
+        """
+        if self.ntotal == 0:
+            return 1.0
+
+        with self._lock:
+            snapshot = self._snapshot
+            queries = self._prepare(queries, snapshot)
+            ids, vectors = self._live_vectors()
+        _, exact = faiss.knn(queries, vectors, k, metric=FaissIndexFactory.metric_type(self.index_config.get("metric", "l2")))
+        exact = np.where(exact == -1, -1, ids[exact])
+        _, approximate = self._search_ids(queries, k, nprobe, ef_search, snapshot=snapshot)
+
+        hits = sum(len(set(e[e != -1]) & set(a[a != -1])) for e, a in zip(exact, approximate))
+        return hits / max(1, int((exact != -1).sum()))
+
+    def _base_path(self) -> Path:
+        return self.segments_path / self._base_file if self._base_file else self.index_path
+
+    def _commit_manifest(self):
+        """Writes the manifest for the current base and saved segments, then drops unreferenced files."""
+        saved = [segment for segment in self.segments if segment.path is not None]
+        # Deletes are durable as soon as a manifest records them, even one written by compaction.
+        self.deleted_log.flush()
+        self.manifest.write(self._base_file, self.index.ntotal, self.generation, saved,
+                            self._committed_next_id, self.tombstones, len(self.deleted_log))
+        keep = {self._base_file, *(segment.path.name for segment in saved), *self._files_in_progress}
+        self.manifest.remove_unreferenced(keep)
 
     def save(self):
-        """Saves the FAISS index and metadata to disk."""
-        if self.index:
-            faiss.write_index(self.index, str(self.index_path))
-        with self.metadata_path.open("wb") as f:
-            pickle.dump(self.metadata, f)
+        """
+        Persists whatever is new since the last save.
+
+        Only new delta segments and appended chunk rows are written, so the cost of a save
+        grows with the size of the batch rather than the size of the corpus. The base index is
+        rewritten only when it is new or was rebuilt.
+        """
+        self._check_writable()
+        with self._lock:
+            if self.index is None:
+                return
+            # Vectors and chunks go first: load() trims any rows the manifest does not account for.
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.chunks.flush()
+            self._committed_next_id = self.next_id
+            self.segments_path.mkdir(parents=True, exist_ok=True)
+            # Before the manifest, which commits vectors in the reduced space.
+            self.reducer.save()
+
+            if self._base_dirty:
+                self.generation += 1
+                self._base_file = self.manifest.base_file(self.generation)
+                faiss.write_index(self.index, str(self.segments_path / self._base_file))
+                self._base_dirty = False
+            for segment in self.segments:
+                if segment.path is None:
+                    path = self.segments_path / self.manifest.segment_file(segment.start, segment.end)
+                    faiss.write_index(segment.index, str(path))
+                    segment.path = path
+
+            with self.config_path.open("w") as f:
+                json.dump({"index_type": self.index_type, **self.index_config}, f, indent=2)
+            self._commit_manifest()
+            if self.index_path.exists():
+                # The pre-segment single-file index now lives on as base segment.
+                self.index_path.rename(self.index_path.with_suffix(".faiss.migrated"))
+
+        if self._needs_compaction():
+            self.compact(background=True)
+
+    def _needs_compaction(self) -> bool:
+        if len(self.segments) >= settings.VECTOR_STORE_MAX_SEGMENTS:
+            return True
+        snapshot = self._snapshot
+        return (snapshot.tombstones.size > 0 and
+                snapshot.tombstones.size >= settings.VECTOR_STORE_COMPACT_RATIO * snapshot.physical_ntotal)
+
+    def _without(self, index: faiss.Index, ids: np.ndarray) -> faiss.Index:
+        """Returns a copy of the index with the given ids removed."""
+        index = faiss.clone_index(index)
+        if ids.size == 0:
+            return index
+        try:
+            index.remove_ids(faiss.IDSelectorBatch(ids))
+            return index
+        except RuntimeError:
+            # HNSW graphs cannot remove vectors, so the live ones are re-inserted into a fresh index.
+            live_ids, vectors = FaissIndexFactory.contents(index)
+            keep = ~np.isin(live_ids, ids)
+            live_ids = live_ids[keep]
+            vectors = self.vectors.take(live_ids) if self._can_rescore() else vectors[keep]
+            rebuilt = FaissIndexFactory.with_ids(self._create_index(index.d, vectors))
+            rebuilt.add_with_ids(vectors, live_ids)
+            return rebuilt
+
+    def compact(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Merges saved delta segments and reclaims the space of deleted chunks.
+
+        While the deltas are small next to the base they are merged into one delta segment,
+        which costs only their own size. Once they reach VECTOR_STORE_COMPACT_RATIO of the base,
+        or that share of the base has been deleted, they are folded into a new base generation.
+        Either way the tombstoned vectors of the merged files are dropped. Searches keep running
+        against the old state until the merged one is swapped in.
+
+        Args:
+            background: Run on a daemon thread and return it (at most one runs at a time)
+        """
+        self._check_writable()
+        if background:
+            if self._compaction is not None and self._compaction.is_alive():
+                return self._compaction
+            self._compaction = threading.Thread(target=self.compact, name="vector-store-compaction", daemon=True)
+            self._compaction.start()
+            return self._compaction
+
+        with self._lock:
+            base, generation, tombstones = self.index, self.generation, self.tombstones
+            # Saved segments always form a prefix of the segment list.
+            merged = tuple(segment for segment in self.segments if segment.path is not None)
+            if base is None or self._base_dirty or not (merged or tombstones.size):
+                return None
+            # Ids only grow, so the base holds ids below the first segment and unsaved segments hold the newest.
+            base_end = self.segments[0].start if self.segments else self.next_id
+            merged_end = merged[-1].end if merged else base_end
+
+        reclaimed = tombstones[tombstones < merged_end]
+        base_deleted = reclaimed[reclaimed < base_end]
+        contents = [FaissIndexFactory.contents(segment.index) for segment in merged]
+        ids = np.concatenate([np.empty(0, dtype='int64')] + [c[0] for c in contents])
+        live = ~np.isin(ids, reclaimed)
+        ids = ids[live]
+        vectors = np.concatenate([np.empty((0, base.d), dtype='float32')] + [c[1] for c in contents])[live]
+
+        threshold = settings.VECTOR_STORE_COMPACT_RATIO * base.ntotal
+        if ids.size >= threshold or (base_deleted.size and base_deleted.size >= threshold):
+            new_base = self._without(base, base_deleted)
+            if ids.size:
+                new_base.add_with_ids(vectors, ids)
+            file_name = self.manifest.base_file(generation + 1)
+            replacement = None
+        else:
+            reclaimed = reclaimed[reclaimed >= base_end]
+            if not merged or (len(merged) < 2 and reclaimed.size == 0):
+                return None
+            delta = FaissIndexFactory.create_delta(base.d, self.index_config)
+            delta.add_with_ids(vectors, ids)
+            file_name = self.manifest.segment_file(merged[0].start, merged[-1].end)
+            replacement = Segment(delta, merged[0].start, merged[-1].end, self.segments_path / file_name)
+
+        # The merged file is written outside the lock; only the swap below blocks writers.
+        self._files_in_progress.add(file_name)
+        try:
+            faiss.write_index(new_base if replacement is None else replacement.index, str(self.segments_path / file_name))
+            with self._lock:
+                if self.index is not base or self.generation != generation or self.segments[:len(merged)] != merged:
+                    # A rebuild replaced the state we merged; drop the result.
+                    (self.segments_path / file_name).unlink(missing_ok=True)
+                    return None
+                # Deletes that arrived meanwhile stay tombstoned.
+                tombstones = np.setdiff1d(self.tombstones, reclaimed)
+                if replacement is None:
+                    FaissIndexFactory.apply_search_params(
+                        new_base, self.index_config.get("nprobe"), self.index_config.get("ef_search")
+                    )
+                    self.generation = generation + 1
+                    self._base_file = file_name
+                    self._publish(base=new_base, segments=self.segments[len(merged):], tombstones=tombstones)
+                else:
+                    self._publish(segments=(replacement,) + self.segments[len(merged):], tombstones=tombstones)
+                self._commit_manifest()
+                logger.info("Compacted %d segments (%d vectors, %d deleted) into %s",
+                            len(merged), ids.size, reclaimed.size, file_name)
+        finally:
+            self._files_in_progress.discard(file_name)
+        return None
+
+    def close(self):
+        """Waits for a running background compaction, e.g. before the process exits."""
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
 
     def load(self):
-        """Loads the FAISS index and metadata from disk."""
-        if self.index_path.exists():
-            self.index = faiss.read_index(str(self.index_path))
-        if self.metadata_path.exists():
-            with self.metadata_path.open("rb") as f:
-                self.metadata = pickle.load(f)
+        """Opens the FAISS index, replaying the segment manifest, and the chunk store from disk."""
+        self.chunks = ChunkStore(str(self.chunks_path), read_only=self.read_only)
+        self.deleted_log = ColumnFile(self.segments_path / "deleted.i64", "int64", read_only=self.read_only)
+        # Indexes written before the settings file existed are always flat.
+        persisted = {"index_type": "flat", "metric": "l2", "reduction": "none"}
+        if self.config_path.exists():
+            with self.config_path.open("r") as f:
+                # So are settings files written before the metric and the reduction were configurable.
+                persisted = {"metric": "l2", "reduction": "none", **json.load(f)}
+
+        next_id, deleted = 0, 0
+        base, segments, tombstones = None, (), np.empty(0, dtype='int64')
+        if self.manifest.exists():
+            manifest = self.manifest.read()
+            self.generation = manifest["generation"]
+            self._base_file = manifest["base"]["file"]
+            # Manifests from before ids were stable have no deletes: ids are positions.
+            next_id = manifest.get("next_id", manifest["ntotal"])
+            deleted = manifest.get("deleted", 0)
+            tombstones = np.asarray(manifest.get("tombstones", []), dtype='int64')
+            tombstones = tombstones[tombstones < next_id]
+            base = FaissIndexFactory.adopt_positional(
+                faiss.read_index(str(self._base_path()), self._io_flags(persisted["index_type"]))
+            )
+            segments = tuple(
+                Segment(FaissIndexFactory.adopt_positional(
+                            faiss.read_index(str(self.segments_path / entry["file"]), self._io_flags("flat")),
+                            entry["start"]),
+                        entry["start"], entry.get("end"), self.segments_path / entry["file"])
+                for entry in manifest["segments"]
+            )
+        elif self.index_path.exists():
+            # A single-file index from before segments existed; the next save moves it into a base segment.
+            base = FaissIndexFactory.adopt_positional(
+                faiss.read_index(str(self.index_path), self._io_flags(persisted["index_type"]))
+            )
+            next_id = base.ntotal
+            self._base_dirty = True
+        self.deleted_log.truncate(deleted)
+        self._deleted = None
+        self._metadata_index = None
+
+        if base is not None:
+            if persisted["index_type"] != self.index_type:
+                logger.warning(
+                    "Index at %s is '%s' but '%s' is configured; call rebuild() to convert it.",
+                    self.index_path, persisted["index_type"], self.index_type,
+                )
+            if persisted["reduction"] != self.index_config["reduction"]:
+                logger.warning(
+                    "Index at %s uses reduction '%s' but '%s' is configured; re-ingest to change it.",
+                    self.index_path, persisted["reduction"], self.index_config["reduction"],
+                )
+            self.index_type = persisted.pop("index_type")
+            self.index_config.update(persisted)
+            FaissIndexFactory.apply_search_params(
+                base, self.index_config.get("nprobe"), self.index_config.get("ef_search")
+            )
+            if self.index_type in COMPRESSED_INDEX_TYPES and self.vectors_path.exists():
+                self.vectors = ColumnFile(self.vectors_path, "float32", width=base.d, read_only=self.read_only)
+                self.vectors.truncate(next_id)
+        self.reducer = self._shared_reducer or VectorReducer(self.index_config.get("reduction", "none"),
+                                                             self.index_config.get("reduced_dimension", 0),
+                                                             self.reduction_path)
+        self.chunks.truncate(next_id)
+        if self.metadata_path.exists() and len(self.chunks) == 0 and not self.read_only:
+            self._import_pickled_metadata()
+        self._snapshot = Snapshot(base=base, segments=segments, tombstones=tombstones, next_id=len(self.chunks))
+        self._committed_next_id = len(self.chunks)
+
+    def _io_flags(self, index_type: str) -> int:
+        """FAISS read flags: memory-map the inverted lists (IVF) or the flat codes (everything else)."""
+        if not self.read_only:
+            return 0
+        if index_type.startswith("ivf"):
+            return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+        return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+    def prewarm(self, block_size: int = 1 << 20) -> threading.Thread:
+        """
+        Pulls the store's files into the OS page cache on a background thread.
+
+        Memory-mapped readers then start with warm pages, and since the page cache is shared,
+        one worker prewarming benefits every process serving the same files.
+        """
+        segments = self._snapshot.segments
+        paths = [path for path in (self._base_path(), self.vectors_path) if path.exists()]
+        paths += [segment.path for segment in segments if segment.path is not None] + self.chunks.files()
+
+        def touch_pages():
+            buffer = bytearray(block_size)
+            for path in paths:
+                with path.open("rb", buffering=0) as f:
+                    while f.readinto(buffer):
+                        pass
+            logger.info("Prewarmed %d files for %s", len(paths), self.index_path)
+
+        thread = threading.Thread(target=touch_pages, name="vector-store-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def _import_pickled_metadata(self):
+        """One-off migration of the legacy pickled metadata dict into the chunk store."""
+        with self.metadata_path.open("rb") as f:
+            metadata = pickle.load(f)
+        rows = [metadata[doc_id] for doc_id in sorted(metadata)]
+        self.chunks.append(
+            [row.get("chunk_text", "") for row in rows],
+            [{key: value for key, value in row.items() if key != "chunk_text"} for row in rows],
+        )
+        self.chunks.flush()
+        self.metadata_path.rename(self.metadata_path.with_suffix(".pkl.migrated"))
+        logger.info("Migrated %d chunks from %s to %s", len(rows), self.metadata_path, self.chunks_path)
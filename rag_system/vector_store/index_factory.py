@@ -0,0 +1,208 @@
+import faiss
+import numpy as np
+from typing import Dict, Any, Optional, Tuple
+
+# FAISS warns when an IVF quantizer gets fewer than ~39 training points per centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+# Index types whose stored codes only approximate the original vectors.
+COMPRESSED_INDEX_TYPES = {'ivf_pq', 'sq8', 'fp16'}
+
+# Metrics whose scores are similarities (higher is better) rather than distances.
+SIMILARITY_METRICS = {'ip', 'cosine'}
+
+class FaissIndexFactory:
+    @staticmethod
+    def create_index(index_type: str, dimension: int, config: Dict[str, Any]) -> faiss.Index:
+        """
+        Create an empty FAISS index of the requested type.
+
+        Args:
+            index_type: Type of index ('flat', 'ivf_flat', 'hnsw', 'ivf_pq', 'sq8' or 'fp16')
+            dimension: Dimensionality of the vectors
+            config: Index-specific settings (metric, nlist, hnsw_m, ef_construction, pq_m, pq_nbits)
+
+        Returns:
+            faiss.Index instance. IVF indexes must be trained before vectors are added.
+        """
+        index_type = index_type.lower()
+        metric = FaissIndexFactory.metric_type(config.get('metric', 'l2'))
+        if index_type == 'flat':
+            return faiss.IndexFlat(dimension, metric)
+        elif index_type == 'ivf_flat':
+            quantizer = faiss.IndexFlat(dimension, metric)
+            return faiss.IndexIVFFlat(quantizer, dimension, config.get('nlist', 1024), metric)
+        elif index_type == 'hnsw':
+            index = faiss.IndexHNSWFlat(dimension, config.get('hnsw_m', 32), metric)
+            index.hnsw.efConstruction = config.get('ef_construction', 200)
+            return index
+        elif index_type == 'ivf_pq':
+            quantizer = faiss.IndexFlat(dimension, metric)
+            pq_m = FaissIndexFactory.effective_pq_m(config.get('pq_m', 16), dimension)
+            return faiss.IndexIVFPQ(quantizer, dimension, config.get('nlist', 1024), pq_m,
+                                    config.get('pq_nbits', 8), metric)
+        elif index_type == 'sq8':
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, metric)
+        elif index_type == 'fp16':
+            return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric)
+        else:
+            raise ValueError(f"Unsupported index type: {index_type}")
+
+    @staticmethod
+    def create_delta(dimension: int, config: Dict[str, Any]) -> faiss.Index:
+        """Create an empty exact index with caller-assigned ids, as used for delta segments."""
+        return faiss.IndexIDMap2(faiss.IndexFlat(dimension, FaissIndexFactory.metric_type(config.get('metric', 'l2'))))
+
+    @staticmethod
+    def metric_type(metric: str) -> int:
+        """
+        Map a metric name to the FAISS metric.
+
+        'cosine' is inner product over L2-normalized vectors; normalizing is up to the caller.
+        """
+        metric = metric.lower()
+        if metric == 'l2':
+            return faiss.METRIC_L2
+        elif metric in SIMILARITY_METRICS:
+            return faiss.METRIC_INNER_PRODUCT
+        else:
+            raise ValueError(f"Unsupported metric: {metric}")
+
+    @staticmethod
+    def with_ids(index: faiss.Index) -> faiss.Index:
+        """
+        Prepare an empty index to store caller-assigned 64-bit ids.
+
+        IVF indexes keep arbitrary ids in their inverted lists natively; everything else is
+        wrapped in an IndexIDMap2.
+        """
+        if faiss.try_extract_index_ivf(index) is not None:
+            return index
+        return faiss.IndexIDMap2(index)
+
+    @staticmethod
+    def adopt_positional(index: faiss.Index, start: int = 0) -> faiss.Index:
+        """
+        Give a populated index without an id map the ids [start, start + ntotal).
+
+        Indexes written before ids were stable used their positions as ids. FAISS refuses to
+        wrap a non-empty index, so the populated one is swapped in behind an empty wrapper.
+        """
+        if isinstance(index, faiss.IndexIDMap) or (faiss.try_extract_index_ivf(index) is not None and start == 0):
+            return index
+        wrapper = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+        wrapper.index = index
+        wrapper.referenced_objects = [index]
+        wrapper.ntotal = index.ntotal
+        wrapper.metric_type = index.metric_type
+        faiss.copy_array_to_vector(np.arange(start, start + index.ntotal, dtype=np.int64), wrapper.id_map)
+        wrapper.construct_rev_map()
+        return wrapper
+
+    @staticmethod
+    def inner(index: faiss.Index) -> faiss.Index:
+        """Returns the index behind an id map, or the index itself."""
+        if isinstance(index, faiss.IndexIDMap):
+            return faiss.downcast_index(index.index)
+        return index
+
+    @staticmethod
+    def contents(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Read back every stored vector along with its id.
+
+        Args:
+            index: An index prepared with with_ids() or adopt_positional()
+
+        Returns:
+            (ids, vectors) sorted by id. Vectors of compressed indexes are approximations.
+        """
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            invlists = ivf.invlists
+            ids = np.concatenate([np.empty(0, dtype=np.int64)] + [
+                faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+                for list_no in range(ivf.nlist) if invlists.list_size(list_no)
+            ])
+            # A temporary id -> (list, offset) hashtable lets FAISS reconstruct by id.
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+            try:
+                vectors = index.reconstruct_batch(ids) if ids.size else np.empty((0, index.d), dtype='float32')
+            finally:
+                ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+        else:
+            ids = faiss.vector_to_array(index.id_map)
+            vectors = FaissIndexFactory.inner(index).reconstruct_n(0, index.ntotal)
+        order = np.argsort(ids, kind="stable")
+        return ids[order], vectors[order]
+
+    @staticmethod
+    def effective_nlist(nlist: int, num_training_vectors: int) -> int:
+        """Clamp the number of IVF lists so that every centroid gets enough training points."""
+        return max(1, min(nlist, num_training_vectors // MIN_POINTS_PER_CENTROID))
+
+    @staticmethod
+    def effective_pq_m(pq_m: int, dimension: int) -> int:
+        """Returns the largest number of PQ sub-quantizers not above pq_m that divides the dimension."""
+        return next(m for m in range(min(pq_m, dimension), 0, -1) if dimension % m == 0)
+
+    @staticmethod
+    def effective_pq_nbits(pq_nbits: int, num_training_vectors: int) -> int:
+        """Shrinks the PQ codebooks so that every codeword gets enough training points."""
+        return max(1, min(pq_nbits, (num_training_vectors // MIN_POINTS_PER_CENTROID).bit_length() - 1))
+
+    @staticmethod
+    def bytes_per_vector(index: faiss.Index) -> float:
+        """
+        Estimate the resident bytes each stored vector costs in an index.
+
+        Args:
+            index: Any index created by this factory
+
+        Returns:
+            Code size plus per-vector bookkeeping (inverted-list ids, HNSW links)
+        """
+        index = FaissIndexFactory.inner(index)
+        if hasattr(index, 'invlists'):
+            # Inverted lists store an int64 id next to every code.
+            return float(index.code_size + 8)
+        if hasattr(index, 'hnsw'):
+            # Level-0 neighbour lists dominate the graph; upper levels add a few percent.
+            return float(index.storage.sa_code_size() + index.hnsw.nb_neighbors(0) * 4)
+        return float(index.sa_code_size())
+
+    @staticmethod
+    def apply_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Sets the default search-time tuning knobs on an index, where they apply."""
+        index = FaissIndexFactory.inner(index)
+        if nprobe is not None and hasattr(index, 'nprobe'):
+            index.nprobe = nprobe
+        if ef_search is not None and hasattr(index, 'hnsw'):
+            index.hnsw.efSearch = ef_search
+
+    @staticmethod
+    def search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                      selector: Optional[faiss.IDSelector] = None) -> Optional[faiss.SearchParameters]:
+        """
+        Build per-request search parameters without mutating the shared index.
+
+        Args:
+            index: The index that will be searched
+            nprobe: Number of IVF lists to visit (IVF indexes only)
+            ef_search: Size of the HNSW candidate list (HNSW indexes only)
+            selector: Restricts the search to the ids it accepts
+
+        Returns:
+            faiss.SearchParameters, or None when nothing applies to this index.
+            FAISS may modify the parameters during a search, so never share them between calls.
+        """
+        index = FaissIndexFactory.inner(index)
+        if hasattr(index, 'nprobe'):
+            if nprobe is None and selector is None:
+                return None
+            return faiss.SearchParametersIVF(nprobe=nprobe or index.nprobe, sel=selector)
+        if hasattr(index, 'hnsw'):
+            if ef_search is None and selector is None:
+                return None
+            return faiss.SearchParametersHNSW(efSearch=ef_search or index.hnsw.efSearch, sel=selector)
+        return faiss.SearchParameters(sel=selector) if selector is not None else None
@@ -0,0 +1,151 @@
+import json
+import numpy as np
+from datetime import date
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from .chunk_store import ChunkStore
+
+# Per-chunk bookkeeping keys that are not worth indexing.
+UNINDEXED_KEYS = {"chunk_text", "chunk_index"}
+
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+OPERATORS = {"$eq", "$in", "$prefix"} | RANGE_OPERATORS
+
+class MetadataIndex:
+    """
+    Inverted index from metadata key/value pairs to the chunk ids that carry them.
+
+    Each posting list is run-length encoded: a document's chunks have consecutive ids, so a
+    value shared by a whole document costs one (start, end) run however many chunks it has.
+    Filters are evaluated into a bitmap over the id space that FAISS consumes as an IDSelector,
+    so filtering happens inside the search rather than on its top-k.
+
+    add() may run while other threads call select(): readers iterate over copies of the
+    dictionaries and clip every run to the id space they were asked about.
+
+    Filter language, one condition per key, all keys ANDed:
+        {"author": "ada"}                         equality (values are also compared as strings)
+        {"tags": ["python", "go"]}                IN; list-valued metadata matches any element
+        {"title": {"$prefix": "Getting"}}         string prefix
+        {"year": {"$gte": 2020, "$lt": 2024}}     numeric range
+        {"date": {"$gte": "2024-01-01"}}          date range over ISO-formatted strings
+    """
+
+    def __init__(self):
+        # key -> value -> ([run starts], [run ends])
+        self._postings: Dict[str, Dict[Hashable, Tuple[List[int], List[int]]]] = {}
+        # key -> str(value) -> raw values, so "3" still matches 3 as the old post-filter did
+        self._values_by_str: Dict[str, Dict[str, Set[Hashable]]] = {}
+
+    @classmethod
+    def from_chunk_store(cls, chunks: ChunkStore) -> "MetadataIndex":
+        """Builds the index from the document and chunk metadata already in a chunk store."""
+        index = cls()
+        starts, ends = chunks.document_ranges()
+        for metadata, start, end in zip(chunks.documents, starts, ends):
+            if end > start:
+                index._add_run(metadata, int(start), int(end))
+        for row, metadata in chunks.chunk_extras():
+            index._add_run(metadata, row, row + 1)
+        return index
+
+    def add(self, ids: np.ndarray, metadatas: List[Dict[str, Any]]):
+        """Indexes newly added chunks. Ids must be larger than any indexed so far."""
+        for chunk_id, metadata in zip(ids, metadatas):
+            # Round-trip through JSON so values look exactly like the ones read back from the chunk store.
+            self._add_run(json.loads(json.dumps(metadata, default=str)), int(chunk_id), int(chunk_id) + 1)
+
+    def _add_run(self, metadata: Dict[str, Any], start: int, end: int):
+        for key, value in metadata.items():
+            if key in UNINDEXED_KEYS:
+                continue
+            for term in self._terms(value):
+                starts, ends = self._postings.setdefault(key, {}).setdefault(term, ([], []))
+                if ends and ends[-1] == start:
+                    # Extends the previous run, e.g. the next chunk of the same document.
+                    ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+                self._values_by_str.setdefault(key, {}).setdefault(str(term), set()).add(term)
+
+    @staticmethod
+    def _terms(value: Any) -> Iterable[Hashable]:
+        if isinstance(value, list):
+            return [term for item in value for term in MetadataIndex._terms(item)]
+        if isinstance(value, dict):
+            return [json.dumps(value, sort_keys=True)]
+        return [value]
+
+    def select(self, filters: Dict[str, Any], size: int) -> np.ndarray:
+        """
+        Evaluates a filter over the ids [0, size).
+
+        Args:
+            filters: Conditions per metadata key, see the class docstring
+            size: Number of ids in the store
+
+        Returns:
+            Boolean mask of the ids that match every condition
+        """
+        mask = np.ones(size, dtype=bool)
+        for key, condition in filters.items():
+            mask &= self._runs_mask(key, self._matching_terms(key, condition), size)
+        return mask
+
+    def _matching_terms(self, key: str, condition: Any) -> Set[Hashable]:
+        values = self._postings.get(key, {})
+        if isinstance(condition, list):
+            condition = {"$in": condition}
+        elif not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        unknown = set(condition) - OPERATORS
+        if unknown:
+            raise ValueError(f"Unsupported filter operator(s) for '{key}': {', '.join(sorted(unknown))}")
+
+        matched: Optional[Set[Hashable]] = None
+        if "$eq" in condition or "$in" in condition:
+            wanted = [condition["$eq"]] if "$eq" in condition else condition["$in"]
+            by_str = self._values_by_str.get(key, {})
+            matched = {term for value in wanted for term in tuple(by_str.get(str(self._bound(value)), ()))}
+        if "$prefix" in condition:
+            prefix = condition["$prefix"]
+            candidates = matched if matched is not None else list(values)
+            matched = {term for term in candidates if isinstance(term, str) and term.startswith(prefix)}
+        ranges = {op: self._bound(bound) for op, bound in condition.items() if op in RANGE_OPERATORS}
+        if ranges:
+            candidates = matched if matched is not None else list(values)
+            matched = {term for term in candidates if self._in_range(term, ranges)}
+        return matched or set()
+
+    @staticmethod
+    def _bound(value: Any) -> Any:
+        # Dates are stored the way json.dumps(default=str) wrote them.
+        return str(value) if isinstance(value, date) else value
+
+    @staticmethod
+    def _in_range(term: Hashable, ranges: Dict[str, Any]) -> bool:
+        for op, bound in ranges.items():
+            numeric = isinstance(bound, (int, float)) and not isinstance(bound, bool)
+            if numeric:
+                if not isinstance(term, (int, float)) or isinstance(term, bool):
+                    return False
+            elif not isinstance(term, str) or not isinstance(bound, str):
+                return False
+            if ((op == "$gt" and not term > bound) or (op == "$gte" and not term >= bound) or
+                    (op == "$lt" and not term < bound) or (op == "$lte" and not term <= bound)):
+                return False
+        return True
+
+    def _runs_mask(self, key: str, terms: Set[Hashable], size: int) -> np.ndarray:
+        """Unions the runs of the given terms into a boolean mask."""
+        values = self._postings.get(key, {})
+        # Pairs the runs up front: add() may append to the lists while they are read.
+        runs = [run for term in terms for run in zip(*values[term])]
+        starts = np.fromiter((start for start, _ in runs), dtype=np.int64, count=len(runs))
+        ends = np.fromiter((end for _, end in runs), dtype=np.int64, count=len(runs))
+        # +1 at each run start and -1 at each run end; ids covered by any run have a positive sum.
+        coverage = np.zeros(size + 1, dtype=np.int32)
+        np.add.at(coverage, np.minimum(starts, size), 1)
+        np.add.at(coverage, np.minimum(ends, size), -1)
+        return np.cumsum(coverage[:size]) > 0
@@ -0,0 +1,159 @@
+import faiss
+import numpy as np
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from .index_factory import FaissIndexFactory
+
+# 'none' stores vectors as the provider returns them.
+REDUCTION_METHODS = ('none', 'pca', 'truncate')
+
+class VectorReducer:
+    """
+    Maps embeddings to fewer dimensions before they are indexed, and queries the same way.
+
+    'pca' projects onto the top principal components of a training sample with a
+    faiss.PCAMatrix, which is written to `path` so the store keeps using the same
+    projection; stores fit it on a sample of their corpus once they hold enough vectors. 'truncate' keeps the first `dimension` components, for Matryoshka-style
+    models whose embeddings stay meaningful when cut to a prefix; it needs no training.
+    Index memory and distance computations shrink in proportion to the dimension.
+    """
+
+    def __init__(self, method: str = 'none', dimension: int = 0, path: Optional[Path] = None):
+        method = (method or 'none').lower()
+        if method not in REDUCTION_METHODS:
+            raise ValueError(f"Unsupported reduction: {method}")
+        if method != 'none' and dimension <= 0:
+            raise ValueError("A reduction needs a positive target dimension.")
+        self.method = method
+        self.dimension = dimension
+        self.path = Path(path) if path is not None else None
+        self.transform: Optional[faiss.VectorTransform] = None
+        self._saved = False
+        if method == 'pca' and self.path is not None and self.path.exists():
+            self.transform = faiss.read_VectorTransform(str(self.path))
+            self._saved = True
+
+    @property
+    def enabled(self) -> bool:
+        return self.method != 'none'
+
+    @property
+    def is_trained(self) -> bool:
+        return self.method != 'pca' or self.transform is not None
+
+    def train(self, sample: np.ndarray):
+        """
+        Fits the PCA projection on a sample of full-dimensional vectors; a no-op for the other methods.
+
+        Args:
+            sample: Training vectors of shape (n, d); PCA needs at least `dimension` of them
+        """
+        if self.is_trained:
+            return
+        self._check_input(sample.shape[1])
+        if sample.shape[0] < self.dimension:
+            raise ValueError(
+                f"PCA to {self.dimension} dimensions needs at least {self.dimension} training vectors, "
+                f"got {sample.shape[0]}."
+            )
+        transform = faiss.PCAMatrix(sample.shape[1], self.dimension)
+        transform.train(np.ascontiguousarray(sample, dtype='float32'))
+        self.transform = transform
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        """Returns the reduced vectors, of shape (n, dimension); the input itself when reduction is off."""
+        if not self.enabled:
+            return vectors
+        self._check_input(vectors.shape[1])
+        if self.method == 'truncate':
+            return np.ascontiguousarray(vectors[:, :self.dimension])
+        if self.transform is None:
+            raise RuntimeError("The PCA reduction has not been trained yet.")
+        return self.transform.apply(np.ascontiguousarray(vectors, dtype='float32'))
+
+    def _check_input(self, input_dimension: int):
+        if self.transform is not None and input_dimension != self.transform.d_in:
+            raise ValueError(f"The PCA reduction expects {self.transform.d_in}-dimensional vectors, got {input_dimension}.")
+        if input_dimension <= self.dimension:
+            raise ValueError(f"Cannot reduce {input_dimension}-dimensional vectors to {self.dimension} dimensions.")
+
+    def save(self):
+        """Writes a newly trained PCA projection next to the index; later calls do nothing."""
+        if self.transform is None or self._saved or self.path is None:
+            return
+        tmp_path = self.path.with_suffix(".tmp")
+        faiss.write_VectorTransform(self.transform, str(tmp_path))
+        tmp_path.replace(self.path)
+        self._saved = True
+
+
+def training_sample(vectors: np.ndarray, size: int, seed: int = 0) -> np.ndarray:
+    """Returns at most `size` rows of vectors, drawn uniformly without replacement."""
+    if vectors.shape[0] <= size:
+        return vectors
+    rows = np.random.default_rng(seed).choice(vectors.shape[0], size, replace=False)
+    return vectors[np.sort(rows)]
+
+
+def recall_report(vectors: np.ndarray, queries: np.ndarray, dimensions: Sequence[int],
+                  methods: Sequence[str] = ('pca', 'truncate'), k: int = 10,
+                  metric: str = 'l2') -> List[Dict[str, Any]]:
+    """
+    Measures what each reduction costs in recall and saves in memory and search time.
+
+    Ground truth is exact search over the full-dimensional vectors. Each method and dimension
+    is then searched exactly in its reduced space, so the recall loss is due to the reduction
+    alone and not to an approximate index.
+
+    Args:
+        vectors: Full-dimensional corpus sample of shape (n, d), e.g. freshly embedded chunks
+        queries: Full-dimensional query vectors of shape (m, d), not part of the corpus sample
+        dimensions: Target dimensions to try; those not below d are skipped
+        methods: Reduction methods to try
+        k: Number of neighbours compared per query
+        metric: 'l2', 'ip' or 'cosine', as configured for the store
+
+    Returns:
+        One dict per configuration, starting with the full-dimensional baseline: method,
+        dimension, recall_at_k, bytes_per_vector, search_ms (per query) and speedup
+    """
+    metric_type = FaissIndexFactory.metric_type(metric)
+    vectors = np.array(vectors, dtype='float32', ndmin=2)
+    queries = np.array(queries, dtype='float32', ndmin=2)
+    if metric == 'cosine':
+        faiss.normalize_L2(vectors)
+        faiss.normalize_L2(queries)
+
+    def timed_knn(corpus: np.ndarray, probes: np.ndarray):
+        started = time.perf_counter()
+        _, neighbours = faiss.knn(probes, corpus, k, metric=metric_type)
+        return neighbours, (time.perf_counter() - started) * 1000 / max(1, probes.shape[0])
+
+    exact, full_ms = timed_knn(vectors, queries)
+    report = [{"method": "none", "dimension": vectors.shape[1], "recall_at_k": 1.0,
+               "bytes_per_vector": vectors.shape[1] * 4, "search_ms": full_ms, "speedup": 1.0}]
+    for method in methods:
+        for dimension in sorted(set(dimensions)):
+            if not 0 < dimension < vectors.shape[1]:
+                continue
+            if method == 'pca' and vectors.shape[0] < dimension:
+                continue
+            reducer = VectorReducer(method, dimension)
+            reducer.train(vectors)
+            reduced_vectors, reduced_queries = reducer.apply(vectors), reducer.apply(queries)
+            if metric == 'cosine':
+                faiss.normalize_L2(reduced_vectors)
+                faiss.normalize_L2(reduced_queries)
+            approximate, reduced_ms = timed_knn(reduced_vectors, reduced_queries)
+            hits = sum(len(set(e[e != -1]) & set(a[a != -1])) for e, a in zip(exact, approximate))
+            report.append({
+                "method": method,
+                "dimension": dimension,
+                "recall_at_k": hits / max(1, int((exact != -1).sum())),
+                "bytes_per_vector": dimension * 4,
+                "search_ms": reduced_ms,
+                "speedup": full_ms / reduced_ms if reduced_ms else 0.0,
+            })
+    return report
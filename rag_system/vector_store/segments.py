@@ -0,0 +1,89 @@
+import faiss
+import json
+import numpy as np
+import os
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+class Segment:
+    """
+    An immutable delta segment: a small exact index holding chunk ids from [start, end).
+
+    Ids inside the range may be missing once compaction has dropped deleted chunks.
+    """
+
+    def __init__(self, index: faiss.Index, start: int, end: Optional[int] = None, path: Optional[Path] = None):
+        self.index = index
+        self.start = start
+        self.end = start + index.ntotal if end is None else end
+        # None until the segment has been written by save().
+        self.path = path
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+
+class SegmentManifest:
+    """
+    The manifest is the commit point of the segmented layout.
+
+    It names the current base index file and every delta segment file in id order, along with
+    the tombstones: ids that were deleted but are still physically present in those files.
+    Writing it atomically replaces the previous state; files it does not reference are
+    leftovers of interrupted saves or compactions and can be deleted.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.path = self.directory / "manifest.json"
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def read(self) -> Dict[str, Any]:
+        with self.path.open("r") as f:
+            return json.load(f)
+
+    def write(self, base_file: Optional[str], base_ntotal: int, generation: int, segments: List[Segment],
+              next_id: int, tombstones: np.ndarray, deleted: int):
+        """
+        Atomically records the base index, the saved delta segments and the deletions.
+
+        Args:
+            base_file: File name of the base index
+            base_ntotal: Number of vectors in the base index
+            generation: Base generation, bumped whenever the base is rewritten
+            segments: Saved delta segments, in id order
+            next_id: Number of committed chunk rows; ids at or past it were never committed
+            tombstones: Sorted ids to skip at search time until compaction removes them
+            deleted: Number of committed entries in the deletion log
+        """
+        manifest = {
+            "generation": generation,
+            "base": {"file": base_file, "ntotal": base_ntotal},
+            "segments": [{"file": segment.path.name, "start": segment.start, "end": segment.end,
+                          "count": segment.ntotal} for segment in segments],
+            "ntotal": base_ntotal + sum(segment.ntotal for segment in segments),
+            "next_id": next_id,
+            "deleted": deleted,
+            "tombstones": [int(i) for i in tombstones],
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with tmp_path.open("w") as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(self.path)
+
+    def remove_unreferenced(self, keep: List[str]):
+        """Deletes segment and base files that the committed manifest no longer references."""
+        for path in self.directory.glob("*.faiss"):
+            if path.name not in keep:
+                path.unlink(missing_ok=True)
+
+    def base_file(self, generation: int) -> str:
+        return f"base-{generation:06d}.faiss"
+
+    def segment_file(self, start: int, end: int) -> str:
+        return f"delta-{start:012d}-{end:012d}.faiss"
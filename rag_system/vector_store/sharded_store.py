@@ -0,0 +1,337 @@
+import faiss
+import heapq
+import json
+import logging
+import numpy as np
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import List, Dict, Any, Tuple, Optional
+
+from config import settings
+from .faiss_store import FaissVectorStore
+from .index_factory import FaissIndexFactory
+from .reduction import VectorReducer, training_sample
+
+logger = logging.getLogger(__name__)
+
+# Global chunk ids carry the shard number in their top bits and the shard-local id below.
+SHARD_ID_SHIFT = 48
+
+class ShardedVectorStore:
+    """
+    A vector store that hashes chunks across several independent FaissVectorStore shards.
+
+    Chunks are assigned by file_origin, so all chunks of a document live on one shard and
+    document-level replaces stay local to it. Searches fan out to every shard on a thread
+    pool (FAISS releases the GIL while it searches) and the per-shard top-k lists are merged
+    with a heap. Each shard keeps its own files and manifest, so it is saved, loaded and
+    compacted on its own and no single index file grows with the whole corpus. Searches read
+    each shard's current snapshot, so ingestion into one shard never blocks them.
+
+    A dimensionality reduction is shared by all shards, so every shard indexes and is searched
+    in the same reduced space and their scores stay comparable. A PCA reduction is fitted here
+    on a sample drawn from every shard, once they hold VECTOR_REDUCTION_TRAINING_SIZE chunks
+    between them; until then the shards keep full vectors.
+    """
+
+    def __init__(self, directory: str = "./data/shards", num_shards: Optional[int] = None,
+                 index_type: Optional[str] = None, index_config: Optional[Dict[str, Any]] = None,
+                 read_only: Optional[bool] = None, prewarm: Optional[bool] = None,
+                 max_workers: Optional[int] = None):
+        self.directory = Path(directory)
+        self.config_path = self.directory / "shards.json"
+        self.read_only = settings.VECTOR_STORE_READ_ONLY if read_only is None else read_only
+
+        # The shard count is fixed when the store is created; changing it would move chunks between shards.
+        self.num_shards = num_shards or settings.VECTOR_STORE_SHARDS
+        # So is the reduction: the shards' vectors are already in the reduced space.
+        index_config = dict(index_config or {})
+        reduction = {
+            "reduction": index_config.pop("reduction", settings.VECTOR_REDUCTION),
+            "reduced_dimension": index_config.pop("reduced_dimension", settings.VECTOR_REDUCED_DIMENSION),
+        }
+        if self.config_path.exists():
+            with self.config_path.open("r") as f:
+                # Stores created before reductions existed have none.
+                persisted = {"reduction": "none", "reduced_dimension": 0, **json.load(f)}
+            if num_shards and num_shards != persisted["num_shards"]:
+                logger.warning("Store at %s has %d shards; ignoring num_shards=%d.",
+                               self.directory, persisted["num_shards"], num_shards)
+            self.num_shards = persisted["num_shards"]
+            reduction = {"reduction": persisted["reduction"], "reduced_dimension": persisted["reduced_dimension"]}
+        elif not self.read_only:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with self.config_path.open("w") as f:
+                json.dump({"num_shards": self.num_shards, **reduction}, f)
+        if self.num_shards >= 1 << (64 - SHARD_ID_SHIFT - 1):
+            raise ValueError(f"At most {(1 << (64 - SHARD_ID_SHIFT - 1)) - 1} shards are supported.")
+
+        self.reducer = VectorReducer(reduction["reduction"], reduction["reduced_dimension"],
+                                     self.directory / "vector_store.reduction")
+        self._reducer_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or self.num_shards,
+                                        thread_name_prefix="vector-store-shard")
+        self.shards: List[FaissVectorStore] = list(self._pool.map(
+            lambda shard: FaissVectorStore(
+                index_path=str(self._shard_path(shard) / "vector_store.faiss"),
+                metadata_path=str(self._shard_path(shard) / "metadata.pkl"),
+                index_type=index_type, index_config={**index_config, "reduction": "none"},
+                read_only=self.read_only, prewarm=prewarm, reducer=self.reducer,
+            ),
+            range(self.num_shards),
+        ))
+
+    def _shard_path(self, shard: int) -> Path:
+        return self.directory / f"shard-{shard:03d}"
+
+    def shard_for(self, file_origin: Any) -> int:
+        """Returns the shard a document hashes to. The hash is stable across processes."""
+        return zlib.crc32(str(file_origin).encode("utf-8")) % self.num_shards
+
+    @staticmethod
+    def _global_ids(shard: int, ids: np.ndarray) -> np.ndarray:
+        return (np.int64(shard) << SHARD_ID_SHIFT) | np.asarray(ids, dtype='int64')
+
+    @staticmethod
+    def _split_ids(ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.asarray(ids, dtype='int64')
+        return ids >> SHARD_ID_SHIFT, ids & ((1 << SHARD_ID_SHIFT) - 1)
+
+    @property
+    def ntotal(self) -> int:
+        """Number of live vectors across every shard."""
+        return sum(shard.ntotal for shard in self.shards)
+
+    def add(self, chunks: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+            hidden: bool = False) -> np.ndarray:
+        """
+        Adds chunks, their embeddings, and metadata, building the shards in parallel.
+
+        With hidden, the chunks stay out of searches until reveal() is called with their ids.
+
+        Returns:
+            The global ids assigned to the new chunks, in input order
+        """
+        if embeddings.shape[0] != len(chunks) or len(chunks) != len(metadatas):
+            raise ValueError("The number of chunks, embeddings, and metadatas must be the same.")
+
+        assignment = np.array([
+            self.shard_for(metadata.get("file_origin", chunk)) for chunk, metadata in zip(chunks, metadatas)
+        ], dtype='int64')
+
+        def add_to_shard(shard: int) -> Tuple[np.ndarray, np.ndarray]:
+            positions = np.flatnonzero(assignment == shard)
+            local_ids = self.shards[shard].add(
+                [chunks[i] for i in positions], embeddings[positions], [metadatas[i] for i in positions],
+                hidden=hidden,
+            )
+            return positions, self._global_ids(shard, local_ids)
+
+        ids = np.empty(len(chunks), dtype='int64')
+        for positions, shard_ids in self._pool.map(add_to_shard, np.unique(assignment)):
+            ids[positions] = shard_ids
+        self._reduce_shards()
+        return ids
+
+    def _reduce_shards(self):
+        """Fits a PCA reduction once the shards hold enough vectors, and moves every shard into the reduced space."""
+        if self.reducer.method != 'pca':
+            return
+        with self._reducer_lock:
+            pending = [shard for shard in self.shards if shard.ntotal > 0 and not shard._reduces(shard.snapshot())]
+            if not pending:
+                return
+            if not self.reducer.is_trained:
+                size = settings.VECTOR_REDUCTION_TRAINING_SIZE
+                if self.ntotal < max(size, self.reducer.dimension):
+                    return
+                vectors = np.concatenate([shard._live_vectors()[1] for shard in self.shards if shard.ntotal > 0])
+                self.reducer.train(training_sample(vectors, size))
+            list(self._pool.map(lambda shard: shard._reduce_index(), pending))
+
+    def delete(self, ids: np.ndarray) -> int:
+        """Deletes chunks by global id and returns how many were deleted."""
+        shards, local_ids = self._split_ids(ids)
+        return sum(
+            self.shards[shard].delete(local_ids[shards == shard])
+            for shard in np.unique(shards) if 0 <= shard < self.num_shards
+        )
+
+    def reveal(self, ids: np.ndarray, replaced: Optional[np.ndarray] = None) -> int:
+        """
+        Makes chunks added hidden searchable, deleting the chunks they replace in the same step.
+
+        Atomic per shard, so a document, which lives in a single shard, is swapped all at once.
+        """
+        shards, local_ids = self._split_ids(ids)
+        replaced_shards, replaced_local = self._split_ids(
+            replaced if replaced is not None else np.empty(0, dtype='int64'))
+        return sum(
+            self.shards[shard].reveal(local_ids[shards == shard], replaced_local[replaced_shards == shard])
+            for shard in np.union1d(shards, replaced_shards) if 0 <= shard < self.num_shards
+        )
+
+    def upsert(self, ids: np.ndarray, chunks: List[str], embeddings: np.ndarray,
+               metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """
+        Deletes `ids` and adds the new chunks.
+
+        Unlike FaissVectorStore.upsert this is not atomic across shards; use replace_document()
+        to swap a document atomically.
+        """
+        self.delete(ids)
+        return self.add(chunks, embeddings, metadatas)
+
+    def document_ids(self, file_origin: str) -> np.ndarray:
+        """Returns the global ids of the live chunks ingested from file_origin."""
+        shard = self.shard_for(file_origin)
+        return self._global_ids(shard, self.shards[shard].document_ids(file_origin))
+
+    def replace_document(self, file_origin: str, chunks: List[str], embeddings: np.ndarray,
+                         metadatas: List[Dict[str, Any]]) -> np.ndarray:
+        """Replaces every chunk of a document; only the document's shard is touched."""
+        shard = self.shard_for(file_origin)
+        return self._global_ids(shard, self.shards[shard].replace_document(file_origin, chunks, embeddings, metadatas))
+
+    def delete_document(self, file_origin: str) -> int:
+        """Deletes every chunk ingested from file_origin and returns how many were deleted."""
+        return self.shards[self.shard_for(file_origin)].delete_document(file_origin)
+
+    @property
+    def higher_is_better(self) -> bool:
+        """True when scores are similarities (ip, cosine) rather than L2 distances."""
+        return self.shards[0].higher_is_better
+
+    def _search_ids(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None,
+                    filters: Optional[Dict[str, Any]] = None,
+                    score_threshold: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Scatters the queries to every shard and heap-merges the answers into top-k scores and global ids."""
+        searched = [shard for shard in range(self.num_shards) if self.shards[shard].ntotal > 0]
+
+        def search_shard(shard: int) -> Tuple[np.ndarray, np.ndarray]:
+            # Prepared per shard: while the reduction is applied, some shards may still hold full vectors.
+            store = self.shards[shard]
+            snapshot = store.snapshot()
+            return store._search_ids(store._prepare(queries, snapshot), k, nprobe, ef_search, filters,
+                                     score_threshold, snapshot)
+
+        answers = list(self._pool.map(search_shard, searched))
+
+        sign = -1 if self.higher_is_better else 1
+        distances = np.full((queries.shape[0], k), sign * np.inf, dtype='float32')
+        indices = np.full((queries.shape[0], k), -1, dtype='int64')
+        for q in range(queries.shape[0]):
+            # Each shard's row is already sorted, so a k-way merge only looks at the heads.
+            rows = [
+                zip(shard_distances[q], self._global_ids(shard, shard_indices[q]), shard_indices[q] != -1)
+                for shard, (shard_distances, shard_indices) in zip(searched, answers)
+            ]
+            merged = heapq.merge(*[(hit for hit in row if hit[2]) for row in rows], key=lambda hit: sign * hit[0])
+            for rank, (distance, chunk_id, _) in enumerate(islice(merged, k)):
+                distances[q, rank] = distance
+                indices[q, rank] = chunk_id
+        return distances, indices
+
+    def search(self, query_embedding: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None, filters: Optional[Dict[str, Any]] = None,
+               score_threshold: Optional[float] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """Searches every shard for the most similar chunks; see FaissVectorStore.search."""
+        return self.search_batch(query_embedding.reshape(1, -1), k, nprobe, ef_search, filters, score_threshold)[0]
+
+    def search_batch(self, query_matrix: np.ndarray, k: int = 5, nprobe: Optional[int] = None,
+                     ef_search: Optional[int] = None, filters: Optional[Dict[str, Any]] = None,
+                     score_threshold: Optional[float] = None) -> List[List[Tuple[Dict[str, Any], float]]]:
+        """Searches every shard for several queries at once; see FaissVectorStore.search_batch."""
+        query_matrix = np.atleast_2d(query_matrix)
+        if self.ntotal == 0:
+            return [[] for _ in range(query_matrix.shape[0])]
+        distances, indices = self._search_ids(query_matrix, k, nprobe, ef_search, filters, score_threshold)
+
+        # Only the merged winners are materialized, each by the shard that owns it.
+        found = indices != -1
+        ids = np.unique(indices[found])
+        metadatas = self.get_chunks(ids)
+        positions = np.searchsorted(ids, indices)
+        return [
+            [(metadatas[position], distance) for position, distance, hit in zip(row, row_distances, row_found) if hit]
+            for row, row_distances, row_found in zip(positions, distances, found)
+        ]
+
+    def get_chunks(self, ids: np.ndarray) -> List[Dict[str, Any]]:
+        """Returns the metadata (with "chunk_text" and global "chunk_id") of the given global ids."""
+        ids = np.asarray(ids, dtype='int64')
+        shards, local_ids = self._split_ids(ids)
+        metadatas: List[Dict[str, Any]] = [{} for _ in range(ids.size)]
+        for shard in np.unique(shards):
+            positions = np.flatnonzero(shards == shard)
+            for position, metadata in zip(positions, self.shards[shard].get_chunks(local_ids[positions])):
+                metadatas[position] = {**metadata, "chunk_id": int(ids[position])}
+        return metadatas
+
+    def save(self):
+        """Saves every shard in parallel; shards without changes write next to nothing."""
+        self.reducer.save()
+        list(self._pool.map(lambda shard: shard.save(), self.shards))
+
+    def load(self):
+        """Reloads every shard from disk in parallel."""
+        list(self._pool.map(lambda shard: shard.load(), self.shards))
+
+    def close(self):
+        """Waits for every shard's background work, then stops the thread pool."""
+        list(self._pool.map(lambda shard: shard.close(), self.shards))
+        self._pool.shutdown()
+
+    def compact(self):
+        """Compacts every shard in parallel."""
+        list(self._pool.map(lambda shard: shard.compact(), self.shards))
+
+    def rebuild(self, index_type: Optional[str] = None):
+        """Rebuilds every shard in parallel, optionally switching index type."""
+        list(self._pool.map(lambda shard: shard.rebuild(index_type), self.shards))
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """Updates the default search-time tuning knobs of every shard."""
+        for shard in self.shards:
+            shard.set_search_params(nprobe, ef_search)
+
+    def prewarm(self):
+        """Pulls every shard's files into the OS page cache in the background."""
+        return [shard.prewarm() for shard in self.shards]
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Reports how much memory the index takes, per shard and in total."""
+        shards = [shard.memory_stats() for shard in self.shards]
+        ntotal = sum(stats["ntotal"] for stats in shards)
+        index_bytes = sum(stats["index_bytes"] for stats in shards)
+        return {
+            "num_shards": self.num_shards,
+            "ntotal": ntotal,
+            "bytes_per_vector": index_bytes / max(1, ntotal),
+            "index_bytes": index_bytes,
+            "reduction": self.reducer.method,
+            "shards": shards,
+        }
+
+    def recall_at_k(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None,
+                    ef_search: Optional[int] = None) -> float:
+        """Measures the recall of the merged search against exact brute-force search over every shard."""
+        if self.ntotal == 0:
+            return 1.0
+
+        queries = np.atleast_2d(queries)
+        live = [(shard, *self.shards[shard]._live_vectors()) for shard in range(self.num_shards)
+                if self.shards[shard].ntotal > 0]
+        ids = np.concatenate([self._global_ids(shard, shard_ids) for shard, shard_ids, _ in live])
+        vectors = np.concatenate([shard_vectors for _, _, shard_vectors in live])
+        metric = FaissIndexFactory.metric_type(self.shards[0].index_config.get("metric", "l2"))
+        _, exact = faiss.knn(self.shards[0]._prepare(queries), vectors, k, metric=metric)
+        exact = np.where(exact == -1, -1, ids[exact])
+        _, approximate = self._search_ids(queries, k, nprobe, ef_search)
+
+        hits = sum(len(set(e[e != -1]) & set(a[a != -1])) for e, a in zip(exact, approximate))
+        return hits / max(1, int((exact != -1).sum()))
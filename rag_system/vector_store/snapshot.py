@@ -0,0 +1,40 @@
+import faiss
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Optional, Tuple
+
+from .segments import Segment
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    One immutable, searchable state of a vector store.
+
+    Writers build the next snapshot on the side and publish it with a single attribute
+    assignment; readers take the current one without locking and see a consistent base,
+    segment list, tombstone and hidden sets and chunk count for as long as they hold it. Indexes and
+    segments inside a snapshot are never modified once published.
+    """
+    version: int = 0
+    base: Optional[faiss.Index] = None
+    segments: Tuple[Segment, ...] = ()
+    # Sorted ids deleted but still present in the base or a segment.
+    tombstones: np.ndarray = field(default_factory=lambda: np.empty(0, dtype='int64'))
+    # Sorted ids added but not searchable yet: a document version still being ingested.
+    # Kept in memory only; after a restart such chunks are searchable until their document
+    # is ingested again or deleted.
+    hidden: np.ndarray = field(default_factory=lambda: np.empty(0, dtype='int64'))
+    # Chunk rows visible to readers; every id below it has its chunk-store row written.
+    next_id: int = 0
+
+    @property
+    def physical_ntotal(self) -> int:
+        """Number of vectors stored in the base and segments, deleted or not."""
+        if self.base is None:
+            return 0
+        return self.base.ntotal + sum(segment.ntotal for segment in self.segments)
+
+    @property
+    def ntotal(self) -> int:
+        """Number of live vectors."""
+        return self.physical_ntotal - self.tombstones.size
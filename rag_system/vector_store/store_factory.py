@@ -0,0 +1,26 @@
+from typing import Any, Optional, Union
+
+from config import settings
+from .faiss_store import FaissVectorStore
+from .sharded_store import ShardedVectorStore
+
+class VectorStoreFactory:
+    @staticmethod
+    def create_store(store_type: Optional[str] = None, **kwargs: Any) -> Union[FaissVectorStore, ShardedVectorStore]:
+        """
+        Create a vector store based on the store type.
+
+        Args:
+            store_type: Type of store ('faiss' or 'sharded'); defaults to VECTOR_STORE_TYPE
+            **kwargs: Constructor arguments of the chosen store
+
+        Returns:
+            A FaissVectorStore or a ShardedVectorStore; both expose the same add/search/save interface
+        """
+        store_type = (store_type or settings.VECTOR_STORE_TYPE).lower()
+        if store_type == 'faiss':
+            return FaissVectorStore(**kwargs)
+        elif store_type == 'sharded':
+            return ShardedVectorStore(**kwargs)
+        else:
+            raise ValueError(f"Unsupported vector store type: {store_type}")